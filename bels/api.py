@@ -17,7 +17,7 @@ __author__ = "Marie-Elise Lecoq"
 __contributors__ = "John Wieczorek"
 __copyright__ = "Copyright 2026 Rauthiflor LLC"
 __filename__ = "api.py"
-__version__ = __filename__ + ' ' + "2026-02-05T18:25-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T23:55-03:00"
 
 import os
 import uuid
@@ -27,6 +27,7 @@ import re
 import csv
 import io
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from google.cloud import pubsub_v1
 from google.cloud import storage
@@ -36,10 +37,78 @@ from flask_restful import Api
 
 from dwca_vocab_utils import darwinize_list
 from bels_query import BELS_Client
+from bels_query import bigquerify_header
+from bels_query import country_fields
+from georef_store import open_georef_store
+from georef_cache import CachedGeorefStore
+from georef_cache import MemoryGeorefCache
+from georef_cache import SQLiteGeorefCache
+from georef_cache import georef_store_version
+from match_sql import matchcolumnfieldlist
+from upload_utils import is_utf8_csv
+from upload_utils import read_upload_header
+from upload_utils import upload_stream
+from upload_utils import upload_stream_as_csv
+from upload_utils import upload_stream_with_match_columns
 from resources import BestGeoref
-
-bels_client = BELS_Client()
+from resources import BestGeorefBatch
+
+# If BELS_GEOREF_STORE is the path to a local georef store built with georef_store.py,
+# either an SQLite database or a directory of index files, look up best georeferences 
+# there instead of in BigQuery.
+georef_store = None
+georef_store_file = os.getenv('BELS_GEOREF_STORE')
+if georef_store_file is not None and len(georef_store_file) > 0:
+    georef_store = open_georef_store(georef_store_file)
+
+# If BELS_TIER_WORKERS is a number of threads greater than 0, the match tiers for a 
+# Location in a BestGeoref request are looked up concurrently in a pool of that many 
+# threads instead of one after the other.
+tier_executor = None
+tier_workers = os.getenv('BELS_TIER_WORKERS')
+if tier_workers is not None and len(tier_workers) > 0 and int(tier_workers) > 0:
+    tier_executor = ThreadPoolExecutor(max_workers=int(tier_workers))
+
+# If BELS_CLIENT_MATCH_STRINGS is 'true', the match strings for the rows of a file 
+# uploaded to /api/bels_csv are made here and added to the file as columns, so that the
+# georeference script in BigQuery only has to join them to the gazetteer.
+client_match_strings = os.getenv('BELS_CLIENT_MATCH_STRINGS', '').lower() == 'true'
+
+# If BELS_GZIP_UPLOADS is 'true', files uploaded to /api/bels_csv are gzipped as they are
+# streamed to Google Cloud Storage.
+gzip_uploads = os.getenv('BELS_GZIP_UPLOADS', '').lower() == 'true'
+
+bels_client = BELS_Client(georef_store=georef_store)
 bels_client.populate()
+
+# Best georeference lookups go through a cache of results if BELS_GEOREF_CACHE_SIZE is
+# greater than 0. Entries expire after BELS_GEOREF_CACHE_TTL seconds. If 
+# BELS_GEOREF_CACHE_FILE is set, the cache is in that SQLite file, which all of the 
+# workers of the server share. Otherwise each worker has its own cache in memory. The
+# version of the gazetteer is part of the cache keys, so that results from before the
+# gazetteer was reloaded are not used. It is BELS_GAZETTEER_VERSION, which has to change
+# whenever the gazetteer is reloaded, or for a local georef store, one that comes from 
+# its files. Without a version there is no cache.
+georef_cache = None
+georef_cache_size = int(os.getenv('BELS_GEOREF_CACHE_SIZE', '0'))
+gazetteer_version = os.getenv('BELS_GAZETTEER_VERSION')
+if gazetteer_version is None or len(gazetteer_version) == 0:
+    gazetteer_version = None
+    if georef_store is not None:
+        gazetteer_version = georef_store_version(georef_store_file)
+if georef_cache_size > 0 and gazetteer_version is None:
+    logging.warning('No georeference cache without BELS_GAZETTEER_VERSION.')
+    georef_cache_size = 0
+if georef_cache_size > 0:
+    georef_cache_ttl = int(os.getenv('BELS_GEOREF_CACHE_TTL', '86400'))
+    georef_cache_file = os.getenv('BELS_GEOREF_CACHE_FILE')
+    if georef_cache_file is not None and len(georef_cache_file) > 0:
+        georef_cache = SQLiteGeorefCache(georef_cache_file, georef_cache_size, 
+            georef_cache_ttl)
+    else:
+        georef_cache = MemoryGeorefCache(georef_cache_size, georef_cache_ttl)
+    bels_client.georef_store = CachedGeorefStore(bels_client.georef_store, georef_cache,
+        gazetteer_version)
 #bels_client.country_report(10)
 
 storage_client = storage.Client()
@@ -56,7 +125,26 @@ counter = 0
 
 # The API endpoint for one-off georeferences instantiates a BestGeoref class to process
 # requests.
-api.add_resource(BestGeoref, '/api/bestgeoref', resource_class_kwargs={'bels_client': bels_client})
+api.add_resource(BestGeoref, '/api/bestgeoref', 
+    resource_class_kwargs={'bels_client': bels_client, 'tier_executor': tier_executor})
+
+# The API endpoint for lists of Locations instantiates a BestGeorefBatch class to 
+# process requests. BELS_BATCH_MAX is the maximum number of Locations in a request.
+batch_max = os.getenv('BELS_BATCH_MAX')
+if batch_max is not None and len(batch_max) > 0:
+    batch_max = int(batch_max)
+else:
+    batch_max = None
+api.add_resource(BestGeorefBatch, '/api/bestgeoref/batch', 
+    resource_class_kwargs={'bels_client': bels_client, 'max_locations': batch_max})
+
+@app.route('/api/bestgeoref/cache', methods=['GET'])
+def bestgeoref_cache():
+    # Statistics of the cache of best georeference lookups
+    if georef_cache is None:
+        return {"Message": {"status": "error", "result": "No georeference cache."}}, 404
+    stats = bels_client.georef_store.get_stats()
+    return {"Message": {"status": "success", "result": stats}}, 200
 
 @app.route('/api/bels_csv', methods=['POST'])
 def bels_csv():
@@ -108,48 +196,38 @@ def bels_csv():
         app.logger.error(s)
         return s, 400  # 400 Bad Request
 
-    csv_content = f.read()
+    # Read only the beginning of the file, enough to find the header. The rest of the 
+    # file is streamed to Google Cloud Storage after the header has been checked.
+    stream = f.stream
+    csv_prefix, fieldnames, dialect, encoding = read_upload_header(stream)
     
     # The input file can not be empty.
-    if len(csv_content) == 0:
+    if len(csv_prefix) == 0:
         s = f'Input file can not be empty.'
         app.logger.error(s)
         return s, 400  # 400 Bad Request
 
-    # Try to get the header from uploaded file.
-    first_newline = 2**63-1
-    first_return = 2**63-1
-    try:
-        first_newline = csv_content.index(b'\n')
-    except:
-        pass
-    try:
-        first_return = csv_content.index(b'\r')
-    except:
-        pass
-
-    # Find the earlier of \r or \n in the file. This should be the end of the header.
-    seekto = None
-    if first_newline < first_return:
-        seekto = first_newline
-    elif first_return < first_newline:
-        seekto = first_return
-
-    if seekto is None:
+    # The header is the first record in the file, parsed with the dialect and encoding 
+    # detected in the beginning of the file, so it may be quoted, tab-separated, or have
+    # a byte order mark. It must end with a line ending.
+    if fieldnames is None:
         s = 'File has no more than one row, so it is data without a header or a header '
         s += 'without data, in neither circumstance of which I am able to help you.'
         app.logger.error(s)
         return s, 400  # 400 Bad Request
 
-    # Get the header line and split on commas. Requires the input to be comma-separated.
-    headerline = csv_content[:seekto]
-    fieldnames = headerline.decode("utf-8").split(',')
     cleaned_fieldnames = []
     for field in fieldnames:
         cleaned_fieldnames.append(field.strip().strip('"').strip("'"))
 
-    #logging.info(f'headerline: {headerline}')
-    #app.logger.info(f'headerline: {headerline}')
+    # Files that are not comma-separated utf-8 are converted to it as they are uploaded.
+    convert_upload = is_utf8_csv(dialect, encoding) == False
+    if convert_upload == False:
+        # Comma-separated utf-8 files are read as they will be in BigQuery.
+        dialect = None
+        encoding = None
+
+    #app.logger.info(f'dialect: {dialect} encoding: {encoding}')
     #app.logger.info(f'cleaned_fieldnames: {cleaned_fieldnames}')
     
     # Darwinize the header
@@ -169,8 +247,44 @@ def bels_csv():
 
     # Google Cloud Storage location for uploaded file
     blob_location = f'{INPUT_LOCATION}/{str(uuid.uuid4())}'
+    if gzip_uploads == True:
+        blob_location += '.csv.gz'
     blob = bucket.blob(blob_location)
-    blob.upload_from_string(csv_content)
+
+    # Add the match strings to the file as columns as it is uploaded, unless the file 
+    # already has fields with those names. If they can not be added, the file is 
+    # uploaded again as it is, if it can be read again from the start.
+    row_count = None
+    match_columns = False
+    if client_match_strings == True:
+        bigqueryized_header = bigquerify_header(darwinized_header)
+        countryfieldlist = country_fields(bigqueryized_header)
+        if countryfieldlist is not None and \
+            len(set(bigqueryized_header) & set(matchcolumnfieldlist)) == 0:
+            try:
+                row_count = upload_stream_with_match_columns(blob, csv_prefix, stream,
+                    bigqueryized_header, countryfieldlist, bels_client.countrycode_dict,
+                    compress=gzip_uploads, dialect=dialect, encoding=encoding)
+                match_columns = row_count is not None
+            except (UnicodeDecodeError, csv.Error) as e:
+                app.logger.info(f'Unable to add match strings to upload: {e}')
+                if stream.seekable() == False:
+                    s = f'The uploaded file could not be read as CSV: {e}'
+                    app.logger.error(s)
+                    return s, 400  # 400 Bad Request
+                stream.seek(0)
+                csv_prefix = b''
+    if match_columns == False and convert_upload == True:
+        try:
+            row_count = upload_stream_as_csv(blob, csv_prefix, stream, dialect, 
+                encoding, compress=gzip_uploads)
+        except (UnicodeDecodeError, csv.Error) as e:
+            s = f'The uploaded file could not be read as {encoding} CSV: {e}'
+            app.logger.error(s)
+            return s, 400  # 400 Bad Request
+    elif match_columns == False:
+        # The estimated number of rows is for the choice of engine.
+        row_count = upload_stream(blob, csv_prefix, stream, compress=gzip_uploads)
 #    url = f'https://storage.cloud.google.com/{PROJECT_ID}/{blob_location}'
     gcs_uri = f'gs://{PROJECT_ID}/{blob_location}'
     topic_path = publisher.topic_path(PROJECT_ID, topic_name)
@@ -182,6 +296,8 @@ def bels_csv():
             'email': email,
             'output_filename': filename, # Altered output file name
             'header' : cleaned_fieldnames, # Header read from uploaded file
+            'row_count' : row_count, # For the choice of engine
+            'match_columns' : match_columns, # Match strings added to the file
         }
     })
     message_bytes = message_json.encode('utf-8')
@@ -246,5 +362,14 @@ if __name__ == "__main__":
 #https://localityservice.uc.r.appspot.com/api/bestgeoref
 #curl -X POST -H "Content-Type: application/json" -d '{"give_me": "BEST_GEOREF", "for_location": {"countrycode": "ES","stateprovince":"Cc", "locality":"Acebo"}}' http://127.0.0.1:5000/api/bestgeoref
 
+# Batch bestgeoref example
+#curl -X POST -H "Content-Type: application/json" -d '{"give_me": "BEST_GEOREF", "for_locations": [{"countrycode": "DK","locality":"Gudhjem"}, {"countrycode": "ES","stateprovince":"Cc", "locality":"Acebo"}]}' http://127.0.0.1:5000/api/bestgeoref/batch
+
+# Batch bestgeoref example, streamed as NDJSON
+#curl -X POST -H "Content-Type: application/json" -H "Accept: application/x-ndjson" -d '{"give_me": "BEST_GEOREF", "for_locations": [{"countrycode": "DK","locality":"Gudhjem"}, {"countrycode": "ES","stateprovince":"Cc", "locality":"Acebo"}]}' http://127.0.0.1:5000/api/bestgeoref/batch
+
+# Best georeference cache statistics
+#curl http://127.0.0.1:5000/api/bestgeoref/cache
+
 # Original record has georef examples
 #curl -X POST -H "Content-Type: application/json" -d '{"give_me": "BEST_GEOREF", "for_location": {"country":"Denmark", "decimallatitude":"20", "decimallongitude":"30", "geodeticdatum":"epsg:4326", "coordinateuncertaintyinmeters":"10", "georeferenceprotocol":"protocol", "georeferencesources":"sources", "georeferenceddate":"date", "georeferencedby":"georefby", "georeferenceremarks":"remarks"}}' http://127.0.0.1:5000/api/bestgeoref
\ No newline at end of file
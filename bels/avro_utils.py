@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "avro_utils.py"
+__version__ = __filename__ + ' ' + "2026-10-18T22:20-03:00"
+
+# This file contains functions to convert between CSV and Avro, the compressed binary
+# format used in place of CSV to load files into BigQuery and to export results from it.
+# BigQuery loads a CSV file with quoted newlines in it in a single worker, but splits
+# Avro files by block and loads the blocks in parallel. Results exported from BigQuery
+# as Avro shards are streamed into a single CSV file with avro_to_csv().
+#
+# Every field of a file converted with csv_to_avro() is a nullable string, with empty
+# values as NULL, as they are when a CSV file is loaded into BigQuery.
+
+import csv
+import logging
+
+try:
+    import fastavro
+except ImportError as e:
+    import warnings
+    s = "The fastavro package is required.\n"
+    s += "pip install fastavro\n"
+    warnings.warn(s)
+
+from local_matcher import read_row_chunks
+
+# Compression of Avro files, one that BigQuery can load
+AVRO_CODEC = 'deflate'
+
+# Approximate number of bytes in an Avro block, the unit in which BigQuery loads a file
+# in parallel and in which it is compressed
+AVRO_SYNC_INTERVAL = 1024*1024
+
+def avro_schema(header, name=None):
+    ''' Get the Avro schema for the rows of a file with the given header, in which every
+        field is a nullable string.
+    parameters:
+        header - list of the BigQuery-compatible field names (required)
+        name - name of the record type (optional; default 'bels_row')
+    returns:
+        schema - the parsed Avro schema
+    '''
+    if name is None:
+        name = 'bels_row'
+    fields = []
+    for field in header:
+        fields.append({'name': field, 'type': ['null', 'string'], 'default': None})
+    return fastavro.parse_schema({'type': 'record', 'name': name, 'fields': fields})
+
+def csv_to_avro(input, output, header, codec=None, chunksize=None):
+    ''' Convert a CSV file to Avro, with the given header in place of the header in the
+        file. Rows with fewer values than the header are padded with empty values, rows
+        with more are truncated.
+    parameters:
+        input - text stream of the comma-separated input file, with a header row
+            (required)
+        output - binary stream to which to write the Avro file (required)
+        header - list of the BigQuery-compatible field names to use in place of the
+            header in the input file (required)
+        codec - the compression of the Avro file (optional; default AVRO_CODEC)
+        chunksize - number of rows read together (optional)
+    returns:
+        rowcount - the number of rows written, or None if the header is not valid
+    '''
+    functionname = 'csv_to_avro()'
+
+    if header is None or len(header) == 0:
+        s = 'No header given in %s.' % functionname
+        logging.debug(s)
+        return None
+    if codec is None:
+        codec = AVRO_CODEC
+
+    rowcount = 0
+    def records():
+        nonlocal rowcount
+        for chunk in read_row_chunks(input, len(header), chunksize):
+            for row in chunk:
+                # Empty values are NULL, as when a CSV file is loaded into BigQuery.
+                yield {field: value if len(value) > 0 else None
+                    for field, value in zip(header, row)}
+            rowcount += len(chunk)
+
+    fastavro.writer(output, avro_schema(header), records(), codec=codec,
+        sync_interval=AVRO_SYNC_INTERVAL)
+    return rowcount
+
+def csv_value(value):
+    ''' Get the value of an Avro field as it is in a BigQuery CSV export.
+    parameters:
+        value - the value read from the Avro file
+    returns:
+        value - the value as a string, empty for NULL
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+def avro_to_csv(inputs, output, writeheader=True):
+    ''' Write the rows of one or more Avro files with the same schema, such as the shards
+        of a BigQuery export, to a single CSV file.
+    parameters:
+        inputs - iterable of binary streams of the Avro files, in order (required)
+        output - text stream to which to write the comma-separated output (required)
+        writeheader - write the field names as the first row (optional; default True)
+    returns:
+        rowcount - the number of rows written, not counting the header
+    '''
+    writer = csv.writer(output)
+    header = None
+    rowcount = 0
+    for input in inputs:
+        reader = fastavro.reader(input)
+        if header is None:
+            header = [field['name'] for field in reader.writer_schema['fields']]
+            if writeheader == True:
+                writer.writerow(header)
+        for record in reader:
+            writer.writerow([csv_value(record.get(field)) for field in header])
+            rowcount += 1
+    return rowcount
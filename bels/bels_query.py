@@ -16,16 +16,22 @@
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = "bels_query.py"
-__version__ = __filename__ + ' ' + "2022-06-20T13:25-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
 
 import json
 import logging
 import re
+from functools import lru_cache
 from google.cloud import bigquery
 from google.cloud import storage
 
 from json_utils import CustomJsonEncoder
 from dwca_utils import lower_dict_keys
+from georef_store import GeorefStore
+from georef_store import georefstoretables
+from match_sql import match_strs_sql
+from match_sql import matchcolumnfieldlist
+from match_sql import super_simplify_function_sql
 
 BQ_SERVICE='localityservice'
 BQ_GAZ_DATASET='gazetteer'
@@ -34,6 +40,21 @@ BQ_PROJECT='localityservice'
 BQ_INPUT_DATASET='belsapi'
 BQ_OUTPUT_DATASET='results'
 
+# Maximum number of match strings looked up in one batched query. Keeps the array 
+# parameter of the query well under the BigQuery request size limit.
+BQ_LOOKUP_BATCH_SIZE=10000
+
+# Maximum number of query job configurations kept by query_job_config()
+BQ_JOB_CONFIG_CACHE_SIZE=4096
+
+# For each tier of matching in the georeference script of process_import_table(), in 
+# order of priority, the kind of match, the match string field in the matcher table and 
+# the bels_match_type given to the results.
+scriptmatchtierlist = [
+    ('with_coords', 'bels_matchwithcoords', 'match using coords'),
+    ('verbatim_coords', 'bels_matchverbatimcoords', 'match using verbatim coords'),
+    ('sans_coords', 'bels_matchsanscoords', 'match sans coords')]
+
 def georeference_score(locdict):
     # Assumes the locdict has been darwinized
     if locdict is None:
@@ -132,11 +153,16 @@ def bels_original_georef(locdict):
     return row
 
 class BELS_Client():
-    def __init__(self, bq_client=None):
+    def __init__(self, bq_client=None, georef_store=None):
         self.bq_client = bq_client;
         if self.bq_client is None:
             print(f'New BigQuery Client instantiated for {self.__class__.__name__}')
             self.bq_client = bigquery.Client()
+        # The store in which to look up best georeferences. Default is the gazetteer in
+        # BigQuery.
+        self.georef_store = georef_store
+        if self.georef_store is None:
+            self.georef_store = BigQueryGeorefStore(self.bq_client)
         self.countrycode_dict = {}
 
     def get_bq_client(self):
@@ -189,6 +215,29 @@ FROM
             return countrycode
         return None
 
+class BigQueryGeorefStore(GeorefStore):
+    ''' A GeorefStore that looks up best georeferences in the gazetteer in BigQuery.
+    '''
+    def __init__(self, bq_client):
+        self.bq_client = bq_client
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        if matchtype == 'with_coords':
+            return get_best_with_coords_georef_reduced(self.bq_client, matchstr)
+        if matchtype == 'verbatim_coords':
+            return get_best_with_verbatim_coords_georef_reduced(self.bq_client, matchstr)
+        if matchtype == 'sans_coords':
+            return get_best_sans_coords_georef_reduced(self.bq_client, matchstr)
+        s = f'Match type {matchtype} not supported in BigQueryGeorefStore.'
+        logging.debug(s)
+        return None
+
+    def get_best_georefs_reduced(self, matchtype, matchstrs):
+        georefs = get_best_georefs_reduced(self.bq_client, matchtype, matchstrs)
+        if georefs is None:
+            return {}
+        return georefs
+
 def schema_from_header(header):
     # Create a BigQuery schema from the fields in a header.
     schema = []
@@ -232,7 +281,98 @@ def country_fields(header):
         return None
     return countryfieldsfound
 
-def process_import_table(bq_client, input_table_id, countryfieldlist):
+def matcher_clause(header=None):
+    # Get the part of the georeference script that makes the table matcher with the
+    # three match strings for each bels_id. Given the header of the input table, the 
+    # match strings are made with built-in SQL functions only (see match_sql.py), using
+    # bels_interpreted_countrycode as the countrycode. Otherwise they are made with the
+    # JavaScript UDFs, which can handle any fields, but serialize every row to JSON 
+    # three times.
+    if header is None:
+        return \
+"""-- Make the match strings
+CREATE TEMP TABLE matcher AS (
+SELECT
+  bels_id,
+REGEXP_REPLACE(functions.saveNumbers(NORMALIZE_AND_CASEFOLD(functions.removeSymbols(functions.simplifyDiacritics(functions.matchString(TO_JSON_STRING(t), "withcoords"))),NFKC)),r"[\\s]+",'') AS bels_matchwithcoords,
+REGEXP_REPLACE(functions.saveNumbers(NORMALIZE_AND_CASEFOLD(functions.removeSymbols(functions.simplifyDiacritics(functions.matchString(TO_JSON_STRING(t), "verbatimcoords"))),NFKC)),r"[\\s]+",'') AS bels_matchverbatimcoords,
+REGEXP_REPLACE(functions.saveNumbers(NORMALIZE_AND_CASEFOLD(functions.removeSymbols(functions.simplifyDiacritics(functions.matchString(TO_JSON_STRING(t), "sanscoords"))),NFKC)),r"[\\s]+",'') AS bels_matchsanscoords
+FROM 
+  interpreted AS t
+);
+"""
+    # The interpreted table has the fields of the input table and the interpreted 
+    # countrycode.
+    matchstrs = match_strs_sql(header + ['bels_interpreted_countrycode'], 
+        {'countrycode': 'bels_interpreted_countrycode'})
+    return \
+f"""-- Make the match strings with built-in SQL functions
+{super_simplify_function_sql()}
+
+CREATE TEMP TABLE matcher AS (
+SELECT
+  bels_id,
+{matchstrs}
+FROM 
+  interpreted AS t
+);
+"""
+
+def georefs_clause():
+    # Get the part of the georeference script that makes the table georefs with the best
+    # georeference for each bels_id from the highest priority tier of matching that has 
+    # one. Each tier is joined to the matcher table once and the best tier for each 
+    # bels_id is picked in a single window pass, rather than appending each tier in turn
+    # for the bels_ids not already in georefs, which rescans georefs for every tier.
+    tierselects = []
+    for tier, (matchtype, matchstrfield, bels_match_type) in \
+        enumerate(scriptmatchtierlist):
+        tableinfo = georefstoretables[matchtype]
+        tierselects.append(
+f"""SELECT
+  a.bels_id,
+  {tier} AS bels_tier,
+  interpreted_decimallatitude AS bels_decimallatitude,
+  interpreted_decimallongitude AS bels_decimallongitude,
+  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
+  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
+  v_georeferencedby AS bels_georeferencedby,
+  v_georeferenceddate AS bels_georeferenceddate,
+  v_georeferenceprotocol AS bels_georeferenceprotocol,
+  v_georeferencesources AS bels_georeferencesources,
+  v_georeferenceremarks AS bels_georeferenceremarks,
+  georef_score AS bels_georeference_score,
+  source AS bels_georeference_source,
+  georef_count AS bels_best_of_n_georeferences,
+  '{bels_match_type}' AS bels_match_type
+FROM
+  matcher a
+JOIN
+  `localityservice.gazetteer.{tableinfo['table']}` b
+ON
+  a.{matchstrfield}=b.{tableinfo['matchfield']}""")
+    unionclause = '\nUNION ALL\n'.join(tierselects)
+    return \
+f"""-- CREATE table georefs from the matches on every tier, keeping only the highest 
+-- priority tier for each bels_id
+CREATE TEMP TABLE georefs AS (
+SELECT
+  * EXCEPT (bels_tier)
+FROM (
+{unionclause}
+)
+WHERE TRUE
+QUALIFY ROW_NUMBER() OVER (PARTITION BY bels_id ORDER BY bels_tier)=1
+);
+"""
+
+def process_import_table(bq_client, input_table_id, countryfieldlist, 
+    matchcolumns=False):
+    # Georeference the rows of a table imported with import_table() with the 
+    # georeference script and put the results in a table of the same name in 
+    # BQ_OUTPUT_DATASET. If matchcolumns is True, the table already has the fields in 
+    # matchcolumnfieldlist, from local_matcher.add_match_columns(), and the script only 
+    # joins them to the gazetteer. Returns the id of the output table.
     if input_table_id is None or bq_client is None:
         return None
     if countryfieldlist is None or len(countryfieldlist) == 0:
@@ -240,7 +380,60 @@ def process_import_table(bq_client, input_table_id, countryfieldlist):
     table_parts = input_table_id.split('.')
     table_name = table_parts[len(table_parts)-1]
     output_table_id = BQ_PROJECT+'.'+BQ_OUTPUT_DATASET+'.'+table_name
-    
+
+    # The fields of the input table determine the match string expressions.
+    header = [field.name for field in bq_client.get_table(input_table_id).schema]
+    query = process_import_table_script(input_table_id, output_table_id, 
+        countryfieldlist, header=header, matchcolumns=matchcolumns)
+    if query is None:
+        return None
+
+    # Make a BigQuery API job request.
+    query_job = bq_client.query(query)
+
+    # Wait for the job to complete. result is a RowIterator, which is actually not an
+    # Iterator, but rather an Iterable. This, to iterate over it, use iter(result)
+    result = query_job.result()  
+    logging.info(f'Georeference script for {input_table_id}: '
+        f'{query_job.total_bytes_processed} bytes processed, '
+        f'{query_job.slot_millis} slot ms')
+
+    # The following may be useful if it is desired to bypass saving a persistent table - 
+    # to export the destination table to Google Cloud Storage directly. For testing, for 
+    # now, we'll save the table in BQ_OUTPUT_DATASET
+
+    # All queries write to a destination table. If a destination table is not specified, 
+    # BigQuery populates it with a reference to a temporary anonymous table after the 
+    # query completes.
+
+    # Get the reference to the destination table for the query results.
+#    destination = query_job.destination
+
+    # Get the Table object from the destination table reference.
+#    destination = bq_client.get_table(destination)
+
+    if isinstance(result, bigquery.table._EmptyRowIterator) == False:
+        logging.debug('Correctly detected _EmptyRowIterator.')
+        return output_table_id
+    return output_table_id
+
+def process_import_table_script(input_table_id, output_table_id, countryfieldlist,
+    georefsclause=None, header=None, matchcolumns=False):
+    # Get the georeference script for process_import_table(). georefsclause is the part 
+    # of the script that makes the table georefs, by default from georefs_clause().
+    # header is the list of fields in the input table, without which the match strings
+    # are made with the JavaScript UDFs (see matcher_clause()). If matchcolumns is True
+    # the input table already has the match strings (see process_matched_table_script()).
+    # Returns None if there is no interpretable country field in countryfieldlist.
+    if countryfieldlist is None or len(countryfieldlist) == 0:
+        return None
+    if georefsclause is None:
+        georefsclause = georefs_clause()
+    if matchcolumns == True:
+        return process_matched_table_script(input_table_id, output_table_id, 
+            georefsclause)
+    matcherclause = matcher_clause(header)
+
     matchcountryclause = None
     
     if 'interpreted_countrycode' in countryfieldlist:
@@ -399,99 +592,9 @@ ON
   UPPER(a.bels_match_country)=b.u_country
 );
 
--- Make the match strings
-CREATE TEMP TABLE matcher AS (
-SELECT
-  bels_id,
-REGEXP_REPLACE(functions.saveNumbers(NORMALIZE_AND_CASEFOLD(functions.removeSymbols(functions.simplifyDiacritics(functions.matchString(TO_JSON_STRING(t), "withcoords"))),NFKC)),r"[\s]+",'') AS bels_matchwithcoords,
-REGEXP_REPLACE(functions.saveNumbers(NORMALIZE_AND_CASEFOLD(functions.removeSymbols(functions.simplifyDiacritics(functions.matchString(TO_JSON_STRING(t), "verbatimcoords"))),NFKC)),r"[\s]+",'') AS bels_matchverbatimcoords,
-REGEXP_REPLACE(functions.saveNumbers(NORMALIZE_AND_CASEFOLD(functions.removeSymbols(functions.simplifyDiacritics(functions.matchString(TO_JSON_STRING(t), "sanscoords"))),NFKC)),r"[\s]+",'') AS bels_matchsanscoords
-FROM 
-  interpreted AS t
-);
-
--- CREATE table georefs from matchme_with_coords
-CREATE TEMP TABLE georefs AS (
-SELECT
-  a.bels_id,
-  interpreted_decimallatitude AS bels_decimallatitude,
-  interpreted_decimallongitude AS bels_decimallongitude,
-  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
-  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
-  v_georeferencedby AS bels_georeferencedby,
-  v_georeferenceddate AS bels_georeferenceddate,
-  v_georeferenceprotocol AS bels_georeferenceprotocol,
-  v_georeferencesources AS bels_georeferencesources,
-  v_georeferenceremarks AS bels_georeferenceremarks,
-  georef_score AS bels_georeference_score,
-  source AS bels_georeference_source,
-  georef_count AS bels_best_of_n_georeferences,
-  'match using coords' AS bels_match_type
-FROM
-  matcher a,
-  `localityservice.gazetteer.matchme_with_coords_best_georef` b
-WHERE
-  a.bels_matchwithcoords=b.matchme_with_coords
-);
-
--- APPEND verbatim coords matches to georefs
-INSERT INTO georefs (
-SELECT
-  a.bels_id,
-  interpreted_decimallatitude AS bels_decimallatitude,
-  interpreted_decimallongitude AS bels_decimallongitude,
-  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
-  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
-  v_georeferencedby AS bels_georeferencedby,
-  v_georeferenceddate AS bels_georeferenceddate,
-  v_georeferenceprotocol AS bels_georeferenceprotocol,
-  v_georeferencesources AS bels_georeferencesources,
-  v_georeferenceremarks AS bels_georeferenceremarks,
-  georef_score AS bels_georeference_score,
-  source AS bels_georeference_source,
-  georef_count AS bels_best_of_n_georeferences,
-  'match using verbatim coords' AS bels_match_type
-FROM
-  matcher a,
-  `localityservice.gazetteer.matchme_verbatimcoords_best_georef` b
-WHERE
-  a.bels_matchverbatimcoords=b.matchme AND
-  a.bels_id NOT IN (
-SELECT 
-  bels_id
-FROM georefs
-)
-);
-
--- APPEND sans coords matches to georefs
-INSERT INTO georefs (
-SELECT
-  a.bels_id,
-  interpreted_decimallatitude AS bels_decimallatitude,
-  interpreted_decimallongitude AS bels_decimallongitude,
-  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
-  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
-  v_georeferencedby AS bels_georeferencedby,
-  v_georeferenceddate AS bels_georeferenceddate,
-  v_georeferenceprotocol AS bels_georeferenceprotocol,
-  v_georeferencesources AS bels_georeferencesources,
-  v_georeferenceremarks AS bels_georeferenceremarks,
-  georef_score AS bels_georeference_score,
-  source AS bels_georeference_source,
-  georef_count AS bels_best_of_n_georeferences,
-  'match sans coords' AS bels_match_type
-FROM
-  matcher a,
-  `localityservice.gazetteer.matchme_sans_coords_best_georef` b
-WHERE
-  a.bels_matchsanscoords=b.matchme_sans_coords AND
-  a.bels_id NOT IN (
-SELECT 
-  bels_id
-FROM georefs
-)
-);
+{matcherclause}
 
+{georefsclause}
 -- Add georefs to original data as results
 CREATE OR REPLACE TABLE `{output_table_id}`
 AS
@@ -507,36 +610,46 @@ JOIN matcher b ON a.bels_id=b.bels_id
 LEFT JOIN georefs c ON b.bels_id=c.bels_id;
 END;
 """
+    return query
 
-    # Make a BigQuery API job request.
-    query_job = bq_client.query(query)
-
-    # Wait for the job to complete. result is a RowIterator, which is actually not an
-    # Iterator, but rather an Iterable. This, to iterate over it, use iter(result)
-    result = query_job.result()  
-
-    # The following may be useful if it is desired to bypass saving a persistent table - 
-    # to export the destination table to Google Cloud Storage directly. For testing, for 
-    # now, we'll save the table in BQ_OUTPUT_DATASET
-
-    # All queries write to a destination table. If a destination table is not specified, 
-    # BigQuery populates it with a reference to a temporary anonymous table after the 
-    # query completes.
-
-    # Get the reference to the destination table for the query results.
-#    destination = query_job.destination
-
-    # Get the Table object from the destination table reference.
-#    destination = bq_client.get_table(destination)
+def process_matched_table_script(input_table_id, output_table_id, georefsclause):
+    # Get the georeference script for an input table that already has the fields in 
+    # matchcolumnfieldlist, added before it was loaded. The match country, countrycode
+    # interpretation and match strings are not made again, so the script only joins the
+    # match strings to the gazetteer. The output has the same fields as the output of
+    # the full script.
+    query = \
+f"""
+-- Georeference matching script for an input table with the fields 
+-- {', '.join(matchcolumnfieldlist)}
+BEGIN
+CREATE TEMP TABLE matcher AS (
+SELECT 
+  *,
+  GENERATE_UUID() AS bels_id
+FROM 
+  `{input_table_id}`
+);
 
-    if isinstance(result, bigquery.table._EmptyRowIterator) == False:
-        logging.debug('Correctly detected _EmptyRowIterator.')
-        return output_table_id
-    return output_table_id
+{georefsclause}
+-- Add georefs to original data as results
+CREATE OR REPLACE TABLE `{output_table_id}`
+AS
+SELECT
+  a.* EXCEPT (bels_id),
+  c.* EXCEPT (bels_id)
+FROM
+  matcher a
+LEFT JOIN georefs c ON a.bels_id=c.bels_id;
+END;
+"""
+    return query
 
-def import_table(bq_client, gcs_uri, header, table_name=None):
+def import_table(bq_client, gcs_uri, header, table_name=None, source_format=None):
     # Create a table in BigQuery from a file in Google Cloud Storage with the given
-    # header.
+    # header. source_format is 'CSV' (the default) or 'AVRO', for a file made with 
+    # avro_utils.csv_to_avro(), which has the header as its schema and no header row, 
+    # and which BigQuery can load in parallel.
     #  Example: gcs_uri = "gs://localityservice/jobs/test_matchme_sans_coords_best_georef.csv"
 
     if gcs_uri is None:
@@ -557,14 +670,21 @@ def import_table(bq_client, gcs_uri, header, table_name=None):
     schema = schema_from_header(header)
     logging.debug(f'Header: {header}\nSchema: {schema}')
 
-    job_config = bigquery.LoadJobConfig(
-        schema=schema,
-        skip_leading_rows=1,
-        write_disposition='WRITE_TRUNCATE',
-        allow_quoted_newlines=True,
-        # The source format defaults to CSV, so the line below is optional.
-        source_format=bigquery.SourceFormat.CSV
-   )
+    if source_format == 'AVRO':
+        # The schema is the one in the Avro file.
+        job_config = bigquery.LoadJobConfig(
+            write_disposition='WRITE_TRUNCATE',
+            source_format=bigquery.SourceFormat.AVRO
+        )
+    else:
+        job_config = bigquery.LoadJobConfig(
+            schema=schema,
+            skip_leading_rows=1,
+            write_disposition='WRITE_TRUNCATE',
+            allow_quoted_newlines=True,
+            # The source format defaults to CSV, so the line below is optional.
+            source_format=bigquery.SourceFormat.CSV
+       )
 
     # First delete the table if it already exists
     try:
@@ -657,12 +777,45 @@ def export_table(bq_client, table_id, destination_uri):
         bloblist.append(blobname)
     return bloblist
 
-def query_location_by_id(base64locationhash, table_name=None):
+def export_table_avro(bq_client, table_id, destination_uri, storage_client=None):
+    # Export a table to Google Cloud Storage as DEFLATE-compressed Avro shards, which 
+    # BigQuery writes in parallel. destination_uri must have a wildcard (*) in the file
+    # name, which BigQuery replaces with the number of the shard. Returns the sorted 
+    # list of the names of the shard blobs, to be read with avro_utils.avro_to_csv().
+    # Not memoized: every call runs a new extract job, because callers delete the 
+    # shards once they have read them.
+    #  Example: destination_uri = "gs://localityservice/bels_output/tmp/results-*.avro"
+    logging.debug(f'table_id: {table_id} destination_uri: {destination_uri}')
+    if destination_uri is None or destination_uri.find('*') == -1:
+        logging.error(f'No wildcard in the destination {destination_uri}.')
+        return None
+    job_config = bigquery.job.ExtractJobConfig()
+    job_config.destination_format = bigquery.DestinationFormat.AVRO
+    job_config.compression = bigquery.Compression.DEFLATE
+    extract_job = bq_client.extract_table(
+        table_id,
+        destination_uri,
+        job_config = job_config,
+    ) # API request
+    # Wait for job to complete.
+    extract_job.result()
+
+    if storage_client is None:
+        storage_client = storage.Client()
+    locparts = destination_uri.split('/')
+    bucket = storage_client.get_bucket(locparts[2])
+    prefix = destination_uri[destination_uri.find(locparts[3]):].split('*')[0]
+    bloblist = [blob.name for blob in bucket.list_blobs(prefix=prefix)]
+    bloblist.sort()
+    return bloblist
+
+@lru_cache(maxsize=None)
+def query_location_by_id(table_name=None):
     ''' Create a query string to get a location record from the distinct Locations data
-        store in BigQuery using the BASE64 representation of the location identifier.
+        store in BigQuery using the BASE64 representation of the location identifier 
+        given in the STRING query parameter @locationid. The query string is built once 
+        per table.
     parameters:
-        base64locationhash - string representation of the base64 digest of the sha256
-            location hash (what humans see in the BigQuery UI as dwc_location_hash).
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -677,16 +830,17 @@ SELECT
 FROM 
     {table_name}
 WHERE 
-    TO_BASE64(dwc_location_hash)='{base64locationhash}'
+    TO_BASE64(dwc_location_hash)=@locationid
 """
     return query
 
-def query_location_by_hashid(locationhash, table_name=None):
+@lru_cache(maxsize=None)
+def query_location_by_hashid(table_name=None):
     ''' Create a query string to get a location record from the distinct Locations data
-        store in BigQuery using the binary hash representation of the identifier.
+        store in BigQuery using the binary hash representation of the identifier given in
+        the BYTES query parameter @locationhash. The query string is built once per 
+        table.
     parameters:
-        locationhash - binary representation of the sha256
-            location hash (not what humans see in the BigQuery UI as dwc_location_hash).
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -701,7 +855,7 @@ SELECT
 FROM
     {table_name}
 WHERE 
-    dwc_location_hash={locationhash}
+    dwc_location_hash=@locationhash
 """
     return query
 
@@ -716,7 +870,8 @@ def get_location_by_id(bq_client, base64locationhash):
     '''
     functionname = 'get_location_by_id()'
 
-    rows = run_bq_query(bq_client, query_location_by_id(base64locationhash), 1)
+    job_config = query_job_config('locationid', 'STRING', base64locationhash)
+    rows = run_bq_query(bq_client, query_location_by_id(), 1, job_config)
     for row in rows:
         return row_as_dict(row)
 
@@ -731,16 +886,19 @@ def get_location_by_hashid(bq_client, locationhash):
     '''
     functionname = 'get_location_by_hashid()'
 
-    rows = run_bq_query(bq_client, query_location_by_hashid(locationhash), 1)
+    job_config = query_job_config('locationhash', 'BYTES', locationhash)
+    rows = run_bq_query(bq_client, query_location_by_hashid(), 1, job_config)
     for row in rows:
         return row_as_dict(row)
 
-def query_best_sans_coords_georef(matchstr, table_name=None):
+@lru_cache(maxsize=None)
+def query_best_sans_coords_georef(table_name=None):
     ''' Create a query string to get the best georeference for the location matching 
         string matchstr from among set of best georeferences using the part of the 
         Location without coordinates from the Locations data store in BigQuery.
+        The matchme_sans_coords string to match is the STRING query parameter @matchstr. 
+        The query string is built once per table.
     parameters:
-        matchstr - the matchme_sans_coords string to match.
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -754,17 +912,19 @@ SELECT *
 FROM 
     {table_name}
 WHERE 
-    matchme_sans_coords='{matchstr}'
+    matchme_sans_coords=@matchstr
 """
     return query
 
-def query_best_sans_coords_georef_reduced(matchstr, table_name=None):
+@lru_cache(maxsize=None)
+def query_best_sans_coords_georef_reduced(table_name=None):
     ''' Create a query string to get the best georeference for the location matching 
         string matchstr from among set of best georeferences using the part of the 
         Location without coordinates from the Locations data store in BigQuery. Return 
         only fields needed to append for a download.
+        The matchme_sans_coords string to match is the STRING query parameter @matchstr. 
+        The query string is built once per table.
     parameters:
-        matchstr - the matchme_sans_coords string to match.
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -793,7 +953,7 @@ SELECT
 FROM 
     {table_name}
 WHERE 
-    matchme_sans_coords='{matchstr}'
+    matchme_sans_coords=@matchstr
 """
     return query
 
@@ -807,7 +967,8 @@ def get_best_sans_coords_georef(bq_client, matchstr):
     '''
     functionname = 'get_best_sans_coords_georef()'
 
-    rows = run_bq_query(bq_client, query_best_sans_coords_georef(matchstr), 1)
+    job_config = query_job_config('matchstr', 'STRING', matchstr)
+    rows = run_bq_query(bq_client, query_best_sans_coords_georef(), 1, job_config)
     if rows.total_rows==0:
         # Create a dict of an empty row so that every record can have a result
         # This has to match the structure of the rows query result.        
@@ -838,8 +999,9 @@ def get_best_sans_coords_georef_reduced(bq_client, matchstr):
         row_as_dict(row) - the first row of the query result as a dict.
     '''
     functionname = 'get_best_sans_coords_georef_reduced()'
-    query = query_best_sans_coords_georef_reduced(matchstr)
-    rows = run_bq_query(bq_client, query, 1)
+    query = query_best_sans_coords_georef_reduced()
+    job_config = query_job_config('matchstr', 'STRING', matchstr)
+    rows = run_bq_query(bq_client, query, 1, job_config)
     # logging.debug(f'{__version__} query: {query} row count: {rows.total_rows}')
     if rows.total_rows==0:
         # Create a dict of an empty row so that every record can have a result
@@ -862,13 +1024,15 @@ def get_best_sans_coords_georef_reduced(bq_client, matchstr):
     for row in rows:
         return row_as_dict(row)
 
-def query_best_with_verbatim_coords_georef(matchstr, table_name=None):
+@lru_cache(maxsize=None)
+def query_best_with_verbatim_coords_georef(table_name=None):
     ''' Create a query string to get the best georeference for the location matching 
         string matchstr from among set of best georeferences using the part of the 
         Location without coordinates, but with verbatim coordinates, from the Locations 
         data store in BigQuery.
+        The matchme string to match is the STRING query parameter @matchstr. 
+        The query string is built once per table.
     parameters:
-        matchstr - the matchme string to match.
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -882,17 +1046,19 @@ SELECT *
 FROM 
     {table_name}
 WHERE 
-    matchme='{matchstr}'
+    matchme=@matchstr
         """
     return query
 
-def query_best_with_verbatim_coords_georef_reduced(matchstr, table_name=None):
+@lru_cache(maxsize=None)
+def query_best_with_verbatim_coords_georef_reduced(table_name=None):
     ''' Create a query string to get the best georeference for the location matching 
         string matchstr from among set of best georeferences using the part of the 
         Location without coordinates, but with verbatim coordinates, from the Locations 
         data store in BigQuery. Return only fields needed to append for a download.
+        The matchme string to match is the STRING query parameter @matchstr. 
+        The query string is built once per table.
     parameters:
-        matchstr - the matchme string to match.
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -921,7 +1087,7 @@ SELECT
 FROM 
   {table_name}
 WHERE 
-  matchme='{matchstr}'
+  matchme=@matchstr
 """
     return query
 
@@ -935,7 +1101,8 @@ def get_best_with_verbatim_coords_georef(bq_client, matchstr):
     '''
     functionname = 'get_best_sans_coords_georef()'
 
-    rows = run_bq_query(bq_client, query_best_with_verbatim_coords_georef(matchstr), 1)
+    job_config = query_job_config('matchstr', 'STRING', matchstr)
+    rows = run_bq_query(bq_client, query_best_with_verbatim_coords_georef(), 1, job_config)
     for row in rows:
         return row_as_dict(row)
 
@@ -949,7 +1116,8 @@ def get_best_with_verbatim_coords_georef_reduced(bq_client, matchstr):
     '''
     functionname = 'get_best_sans_coords_georef_reduced()'
 
-    rows = run_bq_query(bq_client, query_best_with_verbatim_coords_georef_reduced(matchstr), 1)
+    job_config = query_job_config('matchstr', 'STRING', matchstr)
+    rows = run_bq_query(bq_client, query_best_with_verbatim_coords_georef_reduced(), 1, job_config)
     if rows.total_rows==0:
 #        # Create a dict of an empty row so that every record can have a result
 #        # This has to match the structure of the rows query result.
@@ -971,12 +1139,14 @@ def get_best_with_verbatim_coords_georef_reduced(bq_client, matchstr):
     for row in rows:
         return row_as_dict(row)
 
-def query_best_with_coords_georef(matchstr, table_name=None):
+@lru_cache(maxsize=None)
+def query_best_with_coords_georef(table_name=None):
     ''' Create a query string to get the best georeference for the location matching 
         string matchstr from among set of best georeferences using the whole 
         Location, with coordinates, from the Locations data store in BigQuery.
+        The matchme_with_coords string to match is the STRING query parameter @matchstr. 
+        The query string is built once per table.
     parameters:
-        matchstr - the matchme_with_coords string to match.
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -990,17 +1160,19 @@ SELECT *
 FROM 
     {table_name}
 WHERE 
-    matchme_with_coords='{matchstr}'
+    matchme_with_coords=@matchstr
 """
     return query
 
-def query_best_with_coords_georef_reduced(matchstr, table_name=None):
+@lru_cache(maxsize=None)
+def query_best_with_coords_georef_reduced(table_name=None):
     ''' Create a query string to get the best georeference for the location matching 
         string matchstr from among set of best georeferences using the whole 
         Location, with coordinates, from the Locations data store in BigQuery. Return 
         only fields needed to append for a download.
+        The matchme_with_coords string to match is the STRING query parameter @matchstr. 
+        The query string is built once per table.
     parameters:
-        matchstr - the matchme_with_coords string to match.
         table_name - full table name on which the query should be based.
     returns:
         query - the query string
@@ -1029,7 +1201,7 @@ SELECT
 FROM 
   {table_name}
 WHERE 
-  matchme_with_coords='{matchstr}'
+  matchme_with_coords=@matchstr
 """
     return query
 
@@ -1043,7 +1215,8 @@ def get_best_with_coords_georef(bq_client, matchstr):
     '''
     functionname = 'get_best_with_coords_georef()'
 
-    rows = run_bq_query(bq_client, query_best_with_coords_georef(matchstr), 1)
+    job_config = query_job_config('matchstr', 'STRING', matchstr)
+    rows = run_bq_query(bq_client, query_best_with_coords_georef(), 1, job_config)
     for row in rows:
         return row_as_dict(row)
 
@@ -1057,7 +1230,8 @@ def get_best_with_coords_georef_reduced(bq_client, matchstr):
     '''
     functionname = 'get_best_with_coords_georef_reduced()'
 
-    rows = run_bq_query(bq_client, query_best_with_coords_georef_reduced(matchstr), 1)
+    job_config = query_job_config('matchstr', 'STRING', matchstr)
+    rows = run_bq_query(bq_client, query_best_with_coords_georef_reduced(), 1, job_config)
     if rows.total_rows==0:
         return None
 #         # Create a dict of an empty row so that every record can have a result
@@ -1079,19 +1253,155 @@ def get_best_with_coords_georef_reduced(bq_client, matchstr):
     for row in rows:
         return row_as_dict(row)
 
-def run_bq_query(bq_client, querystr, max_results):
+@lru_cache(maxsize=None)
+def query_best_georefs_reduced(matchtype, table_name=None):
+    ''' Create a parameterized query string to get the best georeferences for all of 
+        the location matching strings in the array parameter @keys from among the set of 
+        best georeferences for the matchtype from the Locations data store in BigQuery. 
+        Return only fields needed to append for a download.
+    parameters:
+        matchtype - the kind of match, one of 'with_coords', 'verbatim_coords', 
+            'sans_coords'
+        table_name - full table name on which the query should be based.
+    returns:
+        query - the query string, or None if the matchtype is not supported
+    '''
+    functionname = 'query_best_georefs_reduced()'
+
+    tableinfo = georefstoretables.get(matchtype)
+    if tableinfo is None:
+        s = f'Match type {matchtype} not supported in {functionname}.'
+        logging.debug(s)
+        return None
+
+    if table_name is None:
+        table_name = BQ_SERVICE+'.'+BQ_GAZ_DATASET+'.'+tableinfo['table']
+    matchfield = tableinfo['matchfield']
+    query =f"""
+SELECT 
+  interpreted_countrycode as bels_countrycode,
+  {matchfield} as bels_match_string,
+  interpreted_decimallatitude as bels_decimallatitude,
+  interpreted_decimallongitude as bels_decimallongitude,
+  'epsg:4326' as bels_geodeticdatum,
+  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
+  v_georeferencedby as bels_georeferencedby,
+  v_georeferenceddate as bels_georeferenceddate,
+  v_georeferenceprotocol as bels_georeferenceprotocol,
+  v_georeferencesources as bels_georeferencesources,
+  v_georeferenceremarks as bels_georeferenceremarks,
+  georef_score as bels_georeference_score,
+  source as bels_georeference_source,
+  georef_count as bels_best_of_n_georeferences,
+  '{tableinfo['matchtype']}' as bels_match_type
+FROM 
+  {table_name}
+WHERE 
+  {matchfield} IN UNNEST(@keys)
+"""
+    return query
+
+def get_best_georefs_reduced(bq_client, matchtype, matchstrs, batchsize=None):
+    ''' Get the best georeferences for a list of location matching strings with one 
+        query from query_best_georefs_reduced() per batch of distinct match strings 
+        instead of one query per match string.
+    parameters:
+        bq_client - an instance of a bigquery.Client().
+        matchtype - the kind of match, one of 'with_coords', 'verbatim_coords', 
+            'sans_coords'
+        matchstrs - list of match strings to match.
+        batchsize - maximum number of match strings per query (optional; default 
+            BQ_LOOKUP_BATCH_SIZE)
+    returns:
+        georefs - dict of the reduced georeference for each match string that has one, 
+            keyed by match string, or None if the matchtype is not supported
+    '''
+    functionname = 'get_best_georefs_reduced()'
+
+    query = query_best_georefs_reduced(matchtype)
+    if query is None:
+        return None
+
+    if batchsize is None or batchsize < 1:
+        batchsize = BQ_LOOKUP_BATCH_SIZE
+
+    # Look up each distinct match string only once
+    keys = [matchstr for matchstr in dict.fromkeys(matchstrs) if matchstr is not None]
+    georefs = {}
+    for i in range(0, len(keys), batchsize):
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter('keys', 'STRING', keys[i:i+batchsize])])
+        rows = bq_client.query(query, job_config=job_config).result()
+        for row in rows:
+            georef = row_as_dict(row)
+            georefs[georef['bels_match_string']] = georef
+    return georefs
+
+def get_best_sans_coords_georefs_reduced(bq_client, matchstrs, batchsize=None):
+    ''' Get the results of get_best_georefs_reduced() for matchme_sans_coords strings.
+    parameters:
+        bq_client - an instance of a bigquery.Client().
+        matchstrs - list of matchme_sans_coords strings to match.
+        batchsize - maximum number of match strings per query (optional)
+    returns:
+        georefs - dict of the reduced georeference for each match string that has one
+    '''
+    return get_best_georefs_reduced(bq_client, 'sans_coords', matchstrs, batchsize)
+
+def get_best_with_verbatim_coords_georefs_reduced(bq_client, matchstrs, batchsize=None):
+    ''' Get the results of get_best_georefs_reduced() for matchme strings.
+    parameters:
+        bq_client - an instance of a bigquery.Client().
+        matchstrs - list of matchme strings to match.
+        batchsize - maximum number of match strings per query (optional)
+    returns:
+        georefs - dict of the reduced georeference for each match string that has one
+    '''
+    return get_best_georefs_reduced(bq_client, 'verbatim_coords', matchstrs, batchsize)
+
+def get_best_with_coords_georefs_reduced(bq_client, matchstrs, batchsize=None):
+    ''' Get the results of get_best_georefs_reduced() for matchme_with_coords strings.
+    parameters:
+        bq_client - an instance of a bigquery.Client().
+        matchstrs - list of matchme_with_coords strings to match.
+        batchsize - maximum number of match strings per query (optional)
+    returns:
+        georefs - dict of the reduced georeference for each match string that has one
+    '''
+    return get_best_georefs_reduced(bq_client, 'with_coords', matchstrs, batchsize)
+
+@lru_cache(maxsize=BQ_JOB_CONFIG_CACHE_SIZE)
+def query_job_config(name, type, value):
+    ''' Get a query job configuration with a single scalar query parameter. The 
+        configurations are cached, so repeated lookups of the same value reuse the same
+        configuration. The configurations returned must not be modified.
+    parameters:
+        name - the name of the query parameter, without the leading '@'.
+        type - the BigQuery type of the query parameter (e.g., 'STRING', 'BYTES').
+        value - the value of the query parameter.
+    returns:
+        job_config - a bigquery.QueryJobConfig with the query parameter.
+    '''
+    functionname = 'query_job_config()'
+
+    return bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter(name, type, value)])
+
+def run_bq_query(bq_client, querystr, max_results, job_config=None):
     ''' Execute a query through a bigquery.Client().
     parameters:
         bq_client - an instance of a bigquery.Client().
-        querystr - the matchme_with_coords string to match.
+        querystr - the query string to execute.
         max_results - an upper limit on the number of rows returned.
+        job_config - a bigquery.QueryJobConfig with the values of the query parameters
+            in querystr (optional)
     returns:
         rows - an Iterable containing  rows from the query result. A row can be turned 
             into a list, with row_as_list(), or into a dict, with row_as_dict().
     '''
     functionname = 'run_bq_query()'
 
-    query_job = bq_client.query(querystr)  # Make a BigQuery API job request.
+    query_job = bq_client.query(querystr, job_config=job_config)  # Make a BigQuery API job request.
     query_job.result()  # Wait for the job to complete.
 
     # All queries write to a destination table. If a destination table is not specified, 
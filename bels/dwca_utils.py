@@ -16,7 +16,7 @@
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = "dwca_utils.py"
-__version__ = __filename__ + ' ' + "2022-06-08T15:52-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T23:50-03:00"
 __adapted_from__ = "https://github.com/kurator-org/kurator-validation/blob/master/packages/kurator_dwca/dwca_utils.py"
 
 # This file contains common utility functions for dealing with the content of CSV and
@@ -26,8 +26,12 @@ import os.path
 import re
 import glob
 import codecs
+import io
 import logging
 import csv
+import mmap
+from bisect import bisect_left
+from itertools import islice
 from operator import itemgetter
 from uuid import uuid1
 
@@ -42,6 +46,18 @@ except ImportError as e:
     s += "pip install cchardet\n"
     warnings.warn(s)
 
+# Number of bytes read from the beginning of a file to detect its encoding and dialect
+SNIFF_PREFIX_SIZE = 64*1024
+
+# Number of bytes in each block sampled from the rest of a file to detect its encoding
+SNIFF_BLOCK_SIZE = 16*1024
+
+# Number of characters from the beginning of a file in which to detect its dialect
+SNIFF_DIALECT_SIZE = 20000
+
+# Number of records from one byte offset to the next in the index of a FileProfile
+RECORD_INDEX_INTERVAL = 10000
+
 def represents_int(s):
     ''' Determine if an object represents an integer.
     parameters:
@@ -184,72 +200,74 @@ def csv_file_dialect(fullpath, encoding=None):
         logging.debug(s)
         return None
 
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        #print('Going in to read_header() with encoding: %s' % encoding)
-        #print('for file %s' % inputfile)
-        encoding = csv_file_encoding(fullpath)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Detect the dialect, and the encoding if not given, from the beginning of the file
+    dialect, encoding = csv_sniff(fullpath, encoding=encoding)
+    return dialect
 
-    # Let's look at up to readto bytes from the file
-    readto = 20000
-    filesize = os.path.getsize(fullpath)
+def csv_text_dialect(buf, source=None):
+    ''' Detect the dialect of CSV or TXT data from text read from the beginning of it.
+    parameters:
+        buf - the text from the beginning of the data (required)
+        source - a description of where the text came from, for logging (optional)
+    returns:
+        dialect - a csv.dialect object with the detected attributes
+    '''
+    functionname = 'csv_text_dialect()'
 
-    if filesize < readto:
-        readto = filesize
+    if buf is None:
+        buf = ''
 
+    # newline=None finds the lines whatever their line endings are.
+    lines = io.StringIO(buf, newline=None)
     found_doublequotes = True
-    with open(fullpath, 'r', encoding=encoding) as file:
-        # Try to read the specified part of the file
+    # Try to read the specified part of the file
+    try:
+        # See if the buffer has any doubled double quotes in it. If so, infer that the 
+        # dialect doublequote value should be true.
+        if buf.find('""')>0:
+            found_doublequotes = True
+
+        # Make a determination based on existence of tabs in the buffer, as the
+        # Sniffer is not particularly good at detecting TSV file formats. So, if the
+        # buffer has a tab in it, let's treat it as a TSV file 
+        if buf.find('\t')>0:
+            return tsv_dialect()
+
+        # Otherwise let's see what we can find invoking the Sniffer.
+        # Sniffer only works well to find a delimiter using the first line
+        firstline = lines.readline()
+        logging.debug('Forced to use csv.Sniffer()')
+        dialect = csv.Sniffer().sniff(firstline, delimiters=',\t')
+
+        # The Sniffer doesn't always guess the line terminator correctly either
+        # Let's double-check.
+        if buf.find('\r\n')>0:
+            dialect.lineterminator = '\r\n'
+        elif buf.find('\r')>0:
+            dialect.lineterminator = '\r'
+        else:
+            dialect.lineterminator = '\n'
+    except csv.Error as e:
+        # Something went wrong, so let's try to read a few lines from the beginning of 
+        # the file
         try:
-            buf = file.read(readto)
+            lines.seek(0)
+            s = '%s' % functionname
+            s += ' %s' % e
+            s += ' Re-sniffing %s to %s' % (source, len(buf))
+            logging.debug(s)
+            sample_text = ''.join(lines.readline() for x in range(2,4,1))
             # See if the buffer has any doubled double quotes in it. If so, infer that the 
             # dialect doublequote value should be true.
-            if buf.find('""')>0:
+            if sample_text.find('""')>0:
                 found_doublequotes = True
-
-            # Make a determination based on existence of tabs in the buffer, as the
-            # Sniffer is not particularly good at detecting TSV file formats. So, if the
-            # buffer has a tab in it, let's treat it as a TSV file 
-            if buf.find('\t')>0:
-                return tsv_dialect()
-
-            # Otherwise let's see what we can find invoking the Sniffer.
-            # Sniffer only works well to find a delimiter using the first line
-            file.seek(0)
-            firstline = file.readline()
-            logging.debug('Forced to use csv.Sniffer()')
-            dialect = csv.Sniffer().sniff(firstline, delimiters=',\t')
-
-            # The Sniffer doesn't always guess the line terminator correctly either
-            # Let's double-check.
-            if buf.find('\r\n')>0:
-                dialect.lineterminator = '\r\n'
-            elif buf.find('\r')>0:
-                dialect.lineterminator = '\r'
-            else:
-                dialect.lineterminator = '\n'
+            dialect = csv.Sniffer().sniff(sample_text)
+        # Sorry, couldn't figure it out. Let's treat it as csv
         except csv.Error as e:
-            # Something went wrong, so let's try to read a few lines from the beginning of 
-            # the file
-            try:
-                file.seek(0)
-                s = 'csv_file_dialect()'
-                s += ' %s' % e
-                s += ' Re-sniffing %s to %s' % (fullpath, readto)
-                logging.debug(s)
-                sample_text = ''.join(file.readline() for x in range(2,4,1))
-                # See if the buffer has any doubled double quotes in it. If so, infer that the 
-                # dialect doublequote value should be true.
-                if sample_text.find('""')>0:
-                    found_doublequotes = True
-                dialect = csv.Sniffer().sniff(sample_text)
-            # Sorry, couldn't figure it out. Let's treat it as csv
-            except csv.Error as e:
-                s = 'Unable to determine csv dialect in %s' % functionname
-                s += ' %s' % e
-                logging.debug(s)
-                return csv_dialect()
+            s = 'Unable to determine csv dialect in %s' % functionname
+            s += ' %s' % e
+            logging.debug(s)
+            return csv_dialect()
     
     dialect.skipinitialspace = True
     dialect.strict = False
@@ -258,6 +276,465 @@ def csv_file_dialect(fullpath, encoding=None):
         dialect.escapechar='\\'
     return dialect
 
+def csv_prefix_dialect(prefix, encoding=None):
+    ''' Detect the dialect of a CSV or TXT data file from bytes read from the beginning
+        of it, such as an upload, as csv_file_dialect() does from the file.
+    parameters:
+        prefix - the bytes from the beginning of the file (required)
+        encoding - a string designating the file encoding (optional; default None) 
+            (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+    returns:
+        dialect - a csv.dialect object with the detected attributes, or None
+    '''
+    functionname = 'csv_prefix_dialect()'
+
+    if prefix is None or len(prefix) == 0:
+        s = 'No data given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    if encoding is None or len(encoding.strip()) == 0:
+        encoding = csv_prefix_encoding(prefix)
+
+    return csv_text_dialect(decode_prefix(prefix, encoding), 'prefix')
+
+def read_sniff_sample(data, prefixsize=None, samples=0, blocksize=None):
+    ''' Read the beginning of a file and, optionally, blocks spread evenly through the
+        rest of it, the last of them at the end, to detect its encoding and dialect.
+    parameters:
+        data - a seekable binary stream of the file (required)
+        prefixsize - number of bytes to read from the beginning of the file (optional;
+            default SNIFF_PREFIX_SIZE)
+        samples - number of blocks to read from the rest of the file (optional;
+            default 0)
+        blocksize - number of bytes in each block (optional; default SNIFF_BLOCK_SIZE)
+    returns:
+        prefix - the bytes from the beginning of the file
+        blocks - list of the sampled blocks, each from the start of a line in the file 
+            to the end of a line
+    '''
+    if prefixsize is None:
+        prefixsize = SNIFF_PREFIX_SIZE
+    if blocksize is None:
+        blocksize = SNIFF_BLOCK_SIZE
+    if represents_int(samples) == False or samples < 0:
+        samples = 0
+
+    data.seek(0)
+    prefix = data.read(prefixsize)
+    blocks = []
+    filesize = data.seek(0, os.SEEK_END)
+    remainder = filesize - len(prefix) - blocksize
+    if len(prefix) < prefixsize or remainder <= 0:
+        return prefix, blocks
+
+    for i in range(1, samples+1):
+        data.seek(len(prefix) + remainder*i//samples)
+        block = data.read(blocksize)
+        # Keep only whole lines, so that no character is cut in two.
+        start = block.find(b'\n')
+        end = block.rfind(b'\n')
+        if start != -1 and end > start:
+            blocks.append(block[start+1:end+1])
+    return prefix, blocks
+
+def csv_sniff(source, encoding=None, prefixsize=None, samples=0, blocksize=None):
+    ''' Detect the dialect and the encoding of a CSV or TXT data file, or of bytes from
+        the beginning of one, in a single look at a bounded amount of it. The encoding is
+        detected in the first prefixsize bytes and in the sampled blocks, if any, the 
+        dialect in the beginning of the decoded prefix, as csv_file_dialect() always has.
+        The result can be given as the dialect and encoding of every file function in 
+        this module, so that a file is sniffed once for all of them. Unlike 
+        csv_file_encoding(), it does not read the whole file.
+    parameters:
+        source - full path to the file, or the bytes of the data (required)
+        encoding - a string designating the file encoding, if it is known (optional; 
+            default None) (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        prefixsize - number of bytes to read from the beginning of the file (optional;
+            default SNIFF_PREFIX_SIZE)
+        samples - number of blocks from the rest of the file in which to detect the
+            encoding as well (optional; default 0)
+        blocksize - number of bytes in each block (optional; default SNIFF_BLOCK_SIZE)
+    returns:
+        dialect - a csv.dialect object with the detected attributes, or None on error
+        encoding - the given encoding or the best guess at one, defaulting to utf-8,
+            or None on error
+    '''
+    functionname = 'csv_sniff()'
+
+    if source is None:
+        s = 'No file or data given in %s.' % functionname
+        logging.debug(s)
+        return None, None
+
+    if isinstance(source, (bytes, bytearray)):
+        prefix, blocks = read_sniff_sample(io.BytesIO(source), prefixsize, samples,
+            blocksize)
+    else:
+        if len(source) == 0 or os.path.isfile(source) == False:
+            s = 'File %s not found in %s.' % (source, functionname)
+            logging.debug(s)
+            return None, None
+        with open(source, 'rb') as data:
+            prefix, blocks = read_sniff_sample(data, prefixsize, samples, blocksize)
+
+    if encoding is None or len(encoding.strip()) == 0:
+        encoding = csv_prefix_encoding(prefix, blocks)
+
+    text = decode_prefix(prefix, encoding)
+    if isinstance(source, (bytes, bytearray)) == False:
+        # Line endings as a file opened in text mode reads them, as csv_file_dialect()
+        # always has.
+        text = io.StringIO(text, newline=None).read()
+    if isinstance(source, (bytes, bytearray)):
+        source = 'data'
+    dialect = csv_text_dialect(text[:SNIFF_DIALECT_SIZE], source)
+    return dialect, encoding
+
+def sniff_file(inputfile, dialect=None, encoding=None, profile=None):
+    ''' Get the dialect and encoding of a file, from its FileProfile if one is given,
+        otherwise detecting with one call to csv_sniff() those that are not given.
+    parameters:
+        inputfile - full path to the input file (required)
+        dialect - csv.dialect object with the attributes of the input file (default None)
+        encoding - a string designating the input file encoding (optional; default None) 
+            (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        profile - FileProfile of the input file (optional; default None)
+    returns:
+        dialect - the given or detected csv.dialect object
+        encoding - the given or detected encoding
+    '''
+    if encoding is not None and len(encoding.strip()) == 0:
+        encoding = None
+    profile = current_profile(profile, inputfile)
+    if profile is not None:
+        if dialect is None:
+            dialect = profile.dialect
+        if encoding is None:
+            encoding = profile.encoding
+    if dialect is not None and encoding is not None:
+        return dialect, encoding
+    sniffeddialect, encoding = csv_sniff(inputfile, encoding=encoding)
+    if dialect is None:
+        dialect = sniffeddialect
+    return dialect, encoding
+
+class FileProfile():
+    ''' The dialect, encoding and header of a CSV or TXT data file, found with one call
+        to csv_sniff() when the profile is made, and the number of records after the
+        header and the byte offsets of the starts of every interval-th of them, found 
+        together in one scan of the file when they are first needed (see scan_records()),
+        from which read_csv_row() can start reading at any record. The file functions 
+        in this module take a FileProfile in place of detecting these each time. A 
+        profile is for the file as it was when it was made, identified by its path, size
+        and modification time (see file_profile_key()). file_profile() gives the same 
+        profile for a file until it changes.
+    '''
+    def __init__(self, inputfile, dialect=None, encoding=None, interval=None):
+        if interval is None:
+            interval = RECORD_INDEX_INTERVAL
+        self.inputfile = inputfile
+        self.key = file_profile_key(inputfile)
+        self.dialect, self.encoding = sniff_file(inputfile, dialect, encoding)
+        self.header = read_header(inputfile, self.dialect, self.encoding)
+        self.interval = interval
+        self.rowcount = None
+        self.recordoffsets = None
+
+    def current(self):
+        ''' Determine if the file is the same as when the profile was made.
+        returns:
+            True if the path, size and modification time of the file are unchanged
+        '''
+        return self.key is not None and file_profile_key(self.inputfile) == self.key
+
+    def scan(self):
+        ''' Count the records after the header and find the byte offsets of their 
+            starts, in one scan of the file.
+        '''
+        self.rowcount, self.recordoffsets = scan_records(self.inputfile, self.dialect,
+            self.encoding, self.interval)
+
+    def get_rowcount(self):
+        ''' Get the number of records after the header, scanning the file the first
+            time.
+        returns:
+            rowcount - the number of records after the header, or None on error
+        '''
+        if self.rowcount is None:
+            self.scan()
+        return self.rowcount
+
+    def get_record_offsets(self):
+        ''' Get the byte offsets of the starts of records 0, interval, 2*interval, ...
+            after the header, scanning the file the first time.
+        returns:
+            recordoffsets - list of byte offsets, or None if the records can not be 
+                found in the bytes of the file in its encoding
+        '''
+        if self.rowcount is None:
+            self.scan()
+        return self.recordoffsets
+
+    def __getstate__(self):
+        # A dialect found by csv.Sniffer is a class local to sniff(), which can not be
+        # pickled, so a profile sent to another process, such as to a worker that reads
+        # part of the file, carries the attributes of its dialect instead.
+        state = dict(self.__dict__)
+        if self.dialect is not None:
+            state['dialect'] = {attribute: getattr(self.dialect, attribute) 
+                for attribute in dialectattributelist}
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state.get('dialect'), dict):
+            state['dialect'] = type('dialect', (csv.Dialect,), state['dialect'])
+        self.__dict__.update(state)
+
+# The attributes of a csv dialect
+dialectattributelist = ['delimiter', 'doublequote', 'escapechar', 'lineterminator', 
+    'quotechar', 'quoting', 'skipinitialspace', 'strict']
+
+# The FileProfiles made by file_profile(), by file_profile_key()
+fileprofiles = {}
+
+def file_profile_key(inputfile):
+    ''' Get what identifies a file as it is now, for its FileProfile.
+    parameters:
+        inputfile - full path to the file (required)
+    returns:
+        key - tuple of the absolute path, the size and the modification time of the
+            file, or None if there is no file
+    '''
+    if inputfile is None or len(inputfile) == 0 or os.path.isfile(inputfile) == False:
+        return None
+    stat = os.stat(inputfile)
+    return (os.path.abspath(inputfile), stat.st_size, stat.st_mtime_ns)
+
+def file_profile(inputfile, dialect=None, encoding=None, interval=None):
+    ''' Get the FileProfile of a file, the one already made if the file has not changed
+        since, so that a file is sniffed once for any number of operations on it.
+    parameters:
+        inputfile - full path to the file (required)
+        dialect - csv.dialect object with the attributes of the file, for a new profile
+            (default None)
+        encoding - a string designating the file encoding, for a new profile (optional;
+            default None) (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        interval - the number of records between indexed record offsets, if not that of
+            the profile already made (optional; default None, RECORD_INDEX_INTERVAL for
+            a new profile)
+    returns:
+        profile - the FileProfile of the file, or None if there is no file
+    '''
+    functionname = 'file_profile()'
+
+    key = file_profile_key(inputfile)
+    if key is None:
+        s = 'File %s not found in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return None
+
+    profile = fileprofiles.get(key)
+    if profile is not None and interval is not None and profile.interval != interval:
+        profile = None
+    if profile is None:
+        # Profiles of the file before it changed are of no further use.
+        for oldkey in [k for k in fileprofiles if k[0] == key[0]]:
+            del fileprofiles[oldkey]
+        profile = FileProfile(inputfile, dialect, encoding, interval)
+        fileprofiles[key] = profile
+    return profile
+
+def current_profile(profile, inputfile):
+    ''' Get a FileProfile if it is of the given file as it is now.
+    parameters:
+        profile - the FileProfile, or None
+        inputfile - full path to the file (required)
+    returns:
+        profile - the profile, or None if it is not of the file as it is now
+    '''
+    if profile is None or profile.current() == False:
+        return None
+    if profile.key[0] != os.path.abspath(inputfile):
+        return None
+    return profile
+
+def ascii_compatible(encoding, chars=''):
+    ''' Determine if the line endings and the given characters are the same single bytes
+        in an encoding as in ASCII, so that they can be found in the bytes of a file.
+    parameters:
+        encoding - a string designating the encoding (required)
+        chars - string of other characters to check, such as those of a dialect
+    returns:
+        True if they are the same, otherwise False
+    '''
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return False
+    if name == 'utf-8-sig':
+        name = 'utf-8'
+    for c in '\r\na' + chars:
+        try:
+            if c.encode(name) != c.encode('ascii'):
+                return False
+        except UnicodeEncodeError:
+            return False
+    return True
+
+def scan_records(inputfile, dialect, encoding, interval=None):
+    ''' Count the records after the header of a CSV or TXT data file and find the byte
+        offsets at which records 0, interval, 2*interval, ... after the header start, in
+        one scan of the file. Records are found as csv.DictReader reads them, so a line
+        ending in a quoted or escaped value does not end a record, and empty lines are
+        not records. The offsets can only be found if the line endings and the special
+        characters of the dialect are single bytes in the encoding, as in ASCII. 
+        Otherwise the records are counted by reading them.
+    parameters:
+        inputfile - full path to the input file (required)
+        dialect - csv.dialect object with the attributes of the input file (required)
+        encoding - a string designating the input file encoding (required) 
+            (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        interval - number of records from one offset to the next (optional; default 
+            RECORD_INDEX_INTERVAL)
+    returns:
+        rowcount - the number of records after the header, or None on error
+        offsets - list of byte offsets of the records, or None if they can not be found
+    '''
+    functionname = 'scan_records()'
+
+    if inputfile is None or len(inputfile) == 0 or os.path.isfile(inputfile) == False:
+        s = 'File %s not found in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return None, None
+
+    if dialect is None or encoding is None:
+        s = 'No dialect or encoding given for %s in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return None, None
+
+    if interval is None or interval < 1:
+        interval = RECORD_INDEX_INTERVAL
+
+    quotechar = None
+    if dialect.quoting != csv.QUOTE_NONE and dialect.quotechar is not None:
+        quotechar = dialect.quotechar
+    escapechar = dialect.escapechar
+    specialchars = dialect.delimiter + (quotechar or '') + (escapechar or '')
+    if ascii_compatible(encoding, specialchars) == False:
+        # Count the records by reading them.
+        rowcount = 0
+        for row in read_csv_row(inputfile, dialect, encoding):
+            rowcount += 1
+        return rowcount, None
+
+    if os.path.getsize(inputfile) == 0:
+        return 0, []
+
+    # The special characters of the dialect as they are in a regular expression
+    delimiter = re.escape(dialect.delimiter.encode('ascii'))
+    quote = b''
+    if quotechar is not None:
+        quote = re.escape(quotechar.encode('ascii'))
+    escape = b''
+    if escapechar is not None:
+        escape = re.escape(escapechar.encode('ascii'))
+    spaces = b' *' if dialect.skipinitialspace == True else b''
+
+    # What ends a part of a record that is not quoted: a line ending, an escaped 
+    # character or a quote at the start of a value
+    valueend = [b'(?P<end>[\r\n])']
+    if len(escape) > 0:
+        valueend.append(b'(?P<escaped>' + escape + b'.)')
+    if len(quote) > 0:
+        valueend.append(b'(?P<quoted>' + delimiter + spaces + quote + b')')
+        valuestart = re.compile(spaces + quote)
+        # The rest of a quoted value, up to and including its closing quote
+        special = []
+        if dialect.doublequote == True:
+            special.append(quote + quote)
+        if len(escape) > 0:
+            special.append(escape + b'.')
+        inquotes = b'[^' + quote + escape + b']*'
+        if len(special) > 0:
+            inquotes += b'(?:(?:' + b'|'.join(special) + b')' + inquotes + b')*'
+        # A doubled quote is never the closing quote followed by another quote.
+        closingquote = quote
+        if dialect.doublequote == True:
+            closingquote = quote + b'(?!' + quote + b')'
+        quotedrest = re.compile(inquotes + closingquote, re.DOTALL)
+    valueend = re.compile(b'|'.join(valueend), re.DOTALL)
+
+    # A record in which nothing is escaped and every value either is quoted or has no
+    # quote in it, with the empty lines after it, found in one match. Other records 
+    # are found with record_end().
+    unquotedvalue = b'[^\r\n' + delimiter + quote + escape + b']*'
+    value = unquotedvalue
+    if len(quote) > 0:
+        simpleinquotes = b'[^' + quote + escape + b']*'
+        if dialect.doublequote == True:
+            simpleinquotes += b'(?:' + quote + quote + simpleinquotes + b')*'
+        value = b'(?:' + spaces + quote + simpleinquotes + closingquote + unquotedvalue + \
+            b'|' + unquotedvalue + b')'
+    simplerecord = re.compile(value + b'(?:' + delimiter + value + b')*' + 
+        b'(?:[\r\n]+|\\Z)')
+    lineendings = re.compile(b'[\r\n]*')
+
+    with open(inputfile, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+
+            def quoted_end(pos):
+                # The position after the closing quote of a value quoted before pos
+                match = quotedrest.match(data, pos)
+                if match is None:
+                    return size
+                pos = match.end()
+                # As csv reads it, an escape character right after a doubled-quote 
+                # dialect's closing quote is not an escape.
+                if len(escape) > 0 and dialect.doublequote == True and \
+                    data[pos:pos+1] == escapechar.encode('ascii'):
+                    pos += 1
+                return pos
+
+            def record_end(pos):
+                # The position of the line ending that ends the record that starts at pos
+                if len(quote) > 0:
+                    match = valuestart.match(data, pos)
+                    if match is not None:
+                        pos = quoted_end(match.end())
+                while pos < size:
+                    match = valueend.search(data, pos)
+                    if match is None:
+                        return size
+                    if match.lastgroup == 'end':
+                        return match.start()
+                    if match.lastgroup == 'escaped':
+                        pos = match.end()
+                    else:
+                        pos = quoted_end(match.end())
+                return size
+
+            pos = 0
+            if data[:3] == codecs.BOM_UTF8:
+                pos = 3
+            records = 0
+            offsets = []
+            while True:
+                pos = lineendings.match(data, pos).end()
+                if pos >= size:
+                    break
+                if records > 0 and (records-1) % interval == 0:
+                    offsets.append(pos)
+                records += 1
+                match = simplerecord.match(data, pos)
+                if match is not None:
+                    pos = match.end()
+                else:
+                    pos = record_end(pos)
+
+    return max(records-1, 0), offsets
+
 def dialects_equal(dialect1, dialect2):
     ''' Determine if two dialects have the same attributes.
     parameters:
@@ -358,13 +835,15 @@ def dialect_attributes(dialect):
 
     return s
 
-def read_header(inputfile, dialect=None, encoding=None):
+def read_header(inputfile, dialect=None, encoding=None, profile=None):
     ''' Get the header line of a CSV or TXT data file.
     parameters:
         inputfile - full path to the input file (required)
         dialect - csv.dialect object with the attributes of the input file (default None)
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         header - a list containing the fields in the original header
     '''
@@ -383,18 +862,16 @@ def read_header(inputfile, dialect=None, encoding=None):
 
     header = None
 
-    # If no explicit dialect for the file is given, figure it out from the file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
+    # The header in the profile is the one read with the dialect and encoding in it.
+    profile = current_profile(profile, inputfile)
+    if profile is not None and profile.header is not None and \
+        (dialect is None or dialect == profile.dialect) and \
+        (encoding is None or encoding == profile.encoding):
+        return list(profile.header)
 
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        #print('Going in to read_header() with encoding: %s' % encoding)
-        #print()'for file %s' % inputfile)
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Open up the file for processing
     with open(inputfile, 'r', newline='', encoding=encoding) as data:
@@ -406,6 +883,59 @@ def read_header(inputfile, dialect=None, encoding=None):
 
     return header
 
+def read_prefix_header(prefix, dialect=None, encoding=None):
+    ''' Get the header of a CSV or TXT data file from bytes read from the beginning of
+        it, such as an upload, by parsing only the first record, which may have quoted
+        line endings in it.
+    parameters:
+        prefix - the bytes from the beginning of the file (required)
+        dialect - csv.dialect object with the attributes of the file (default None)
+        encoding - a string designating the file encoding (optional; default None) 
+            (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+    returns:
+        header - a list containing the fields in the original header, or None if the
+            first record does not end with a line ending in the prefix
+    '''
+    functionname = 'read_prefix_header()'
+
+    if prefix is None or len(prefix) == 0:
+        s = 'No data given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    if encoding is None or len(encoding.strip()) == 0:
+        encoding = csv_prefix_encoding(prefix)
+
+    if dialect is None:
+        dialect = csv_prefix_dialect(prefix, encoding)
+
+    # Keep the lines the reader takes, to know whether the first record ended in them
+    consumed = []
+    exhausted = False
+    def prefix_lines():
+        nonlocal exhausted
+        for line in io.StringIO(decode_prefix(prefix, encoding), newline=''):
+            consumed.append(line)
+            yield line
+        exhausted = True
+
+    reader = csv.reader(prefix_lines(), dialect=dialect)
+    try:
+        header = next(reader)
+    except (StopIteration, csv.Error) as e:
+        s = 'Unable to read header from prefix in %s: %s' % (functionname, e)
+        logging.debug(s)
+        return None
+
+    # If the reader ran out of lines, the record may go on after the prefix, as it may
+    # if the last line has no line ending.
+    if exhausted == True or consumed[-1][-1:] not in ['\n', '\r']:
+        s = 'The first record does not end in the prefix in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    return header
+
 def read_rows(inputfile, rowcount, dialect, encoding, header=True, fieldnames=None):
     ''' Read rows from a csv file. Determine the existence of the file, its dialect, and 
         its encoding before making a call to this function.
@@ -509,15 +1039,9 @@ def composite_header(fullpath, dialect=None, encoding=None):
         return None
 
     for file in files:
-        if dialect is None:
-            useddialect = csv_file_dialect(file)
-            # csv_file_dialect() always returns a dialect if there is an input file.
-            # No need to check.
-
-        # Try to determine the encoding of the inputfile.
-        if encoding is None or len(encoding.strip()) == 0:
-            usedencoding = csv_file_encoding(file)
-            # csv_file_encoding() always returns an encoding if there is an input file.    
+        # Determine the dialect and encoding of each file with one look at it, unless
+        # they are given
+        useddialect, usedencoding = sniff_file(file, dialect, encoding)
 
         header = read_header(file, useddialect, usedencoding)
         compositeheader = merge_headers(compositeheader, header)
@@ -671,7 +1195,8 @@ def merge_headers(headersofar, headertoadd=None):
 
     return sorted(list(composedheader))
 
-def convert_csv(inputfile, outputfile, dialect=None, encoding=None, format=None):
+def convert_csv(inputfile, outputfile, dialect=None, encoding=None, format=None, 
+    profile=None):
     ''' Convert an arbitrary csv file into a txt file in utf-8.
     parameters:
         inputfile - full path to the input file (required)
@@ -680,6 +1205,8 @@ def convert_csv(inputfile, outputfile, dialect=None, encoding=None, format=None)
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
         format - output file format (e.g., 'csv' or 'txt') (optional; default 'txt')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         True if finished successfully, otherwise False
     '''
@@ -700,16 +1227,9 @@ def convert_csv(inputfile, outputfile, dialect=None, encoding=None, format=None)
         logging.debug(s)
         return False
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Create a the dialect object for the output file based on the given format
     if format is not None and format.lower() == 'csv':
@@ -718,7 +1238,8 @@ def convert_csv(inputfile, outputfile, dialect=None, encoding=None, format=None)
         outdialect = tsv_dialect()
 
     # Get the header from the input file
-    inputheader = read_header(inputfile, dialect=dialect, encoding=encoding)
+    inputheader = read_header(inputfile, dialect=dialect, encoding=encoding, 
+        profile=profile)
 
     if inputheader is None:
         s = 'Unable to read header for %s in %s.' % (inputfile, functionname)
@@ -738,7 +1259,8 @@ def convert_csv(inputfile, outputfile, dialect=None, encoding=None, format=None)
     logging.debug(s)
     return True
 
-def csv_select_fields(inputfile, outputfile, fieldlist=None, dialect=None, encoding=None, format=None):
+def csv_select_fields(inputfile, outputfile, fieldlist=None, dialect=None, encoding=None, format=None,
+    profile=None):
     ''' Write data from selected fields of an input file to an output file.
     parameters:
         inputfile - full path to the input file (required)
@@ -748,6 +1270,8 @@ def csv_select_fields(inputfile, outputfile, fieldlist=None, dialect=None, encod
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
         format - output file format (e.g., 'csv' or 'txt') (optional; default 'txt')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         True if finished successfully, otherwise False
     '''
@@ -768,16 +1292,9 @@ def csv_select_fields(inputfile, outputfile, fieldlist=None, dialect=None, encod
         logging.debug(s)
         return False
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Create a the dialect object for the output file based on the given format
     if format is not None and format.lower() == 'csv':
@@ -786,7 +1303,8 @@ def csv_select_fields(inputfile, outputfile, fieldlist=None, dialect=None, encod
         outdialect = tsv_dialect()
 
     # Get the header from the input file
-    inputheader = read_header(inputfile, dialect=dialect, encoding=encoding)
+    inputheader = read_header(inputfile, dialect=dialect, encoding=encoding, 
+        profile=profile)
 
     if inputheader is None:
         s = 'Unable to read header for %s in %s.' % (inputfile, functionname)
@@ -817,7 +1335,8 @@ def csv_select_fields(inputfile, outputfile, fieldlist=None, dialect=None, encod
     logging.debug(s)
     return True
 
-def csv_clean_whitespace(inputfile, outputfile, dialect=None, encoding=None, format=None):
+def csv_clean_whitespace(inputfile, outputfile, dialect=None, encoding=None, format=None,
+    profile=None):
     ''' Write data from an input file to an output file where all fields have 
         sequential whitespaces replaced with a single space and leading and trailing 
         whitespaces removed.
@@ -828,6 +1347,8 @@ def csv_clean_whitespace(inputfile, outputfile, dialect=None, encoding=None, for
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
         format - output file format (e.g., 'csv' or 'txt') (optional; default 'txt')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         True if finished successfully, otherwise False
     '''
@@ -848,16 +1369,9 @@ def csv_clean_whitespace(inputfile, outputfile, dialect=None, encoding=None, for
         logging.debug(s)
         return False
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Create a the dialect object for the output file based on the given format
     if format is not None and format.lower() == 'csv':
@@ -866,7 +1380,8 @@ def csv_clean_whitespace(inputfile, outputfile, dialect=None, encoding=None, for
         outdialect = tsv_dialect()
 
     # Get the header from the input file
-    inputheader = read_header(inputfile, dialect=dialect, encoding=encoding)
+    inputheader = read_header(inputfile, dialect=dialect, encoding=encoding, 
+        profile=profile)
 
     if inputheader is None:
         s = 'Unable to read header for %s in %s.' % (inputfile, functionname)
@@ -891,7 +1406,8 @@ def csv_clean_whitespace(inputfile, outputfile, dialect=None, encoding=None, for
     logging.debug(s)
     return True
 
-def term_rowcount_from_file(inputfile, termname, dialect=None, encoding=None):
+def term_rowcount_from_file(inputfile, termname, dialect=None, encoding=None, 
+    profile=None):
     ''' Count of the rows that are populated for a given term.
     parameters:
         inputfile - full path to the input file (required)
@@ -899,6 +1415,8 @@ def term_rowcount_from_file(inputfile, termname, dialect=None, encoding=None):
         dialect - csv.dialect object with the attributes of the input files (default None)
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         rowcount - the number of rows with the term populated
     '''
@@ -919,19 +1437,12 @@ def term_rowcount_from_file(inputfile, termname, dialect=None, encoding=None):
         logging.debug(s)
         return 0
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Search for fields based on a cleaned header
-    cleanheader = clean_header(read_header(inputfile, dialect, encoding))
+    cleanheader = clean_header(read_header(inputfile, dialect, encoding, profile))
 
     # Search for term based on cleaned term to match cleaned header
     cleanterm = clean_header([termname])[0]
@@ -953,7 +1464,7 @@ def term_rowcount_from_file(inputfile, termname, dialect=None, encoding=None):
 
     return rowcount
 
-def term_completeness_from_file(inputfile, dialect=None, encoding=None):
+def term_completeness_from_file(inputfile, dialect=None, encoding=None, profile=None):
     ''' Make a dictionary of field names and the number of rows in which each is 
         populated.
     parameters:
@@ -961,6 +1472,8 @@ def term_completeness_from_file(inputfile, dialect=None, encoding=None):
         dialect - csv.dialect object with the attributes of the input files (default None)
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         fieldcountdict - dictionary of field names and the number of rows in which they 
             are populated in the inputfile
@@ -977,19 +1490,12 @@ def term_completeness_from_file(inputfile, dialect=None, encoding=None):
         logging.debug(s)
         return 0
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Search for fields based on a cleaned header
-    header = read_header(inputfile, dialect, encoding)
+    header = read_header(inputfile, dialect, encoding, profile)
 
     rowcount = 0
 
@@ -1007,13 +1513,15 @@ def term_completeness_from_file(inputfile, dialect=None, encoding=None):
     fieldcountdict['rows'] = rowcount
     return fieldcountdict
 
-def csv_field_checker(inputfile, dialect=None, encoding=None):
+def csv_field_checker(inputfile, dialect=None, encoding=None, profile=None):
     ''' Determine if any row in a csv file has fewer fields than the header.
     parameters:
         inputfile - full path to the input file (required)
         dialect - csv.dialect object with the attributes of the input files (default None)
         encoding - a string designating the input file encoding (optional; default None) 
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         index, row - a tuple composed of the index of the first row that has a different 
             number of fields (1 is the first row after the header) and the row string
@@ -1030,18 +1538,11 @@ def csv_field_checker(inputfile, dialect=None, encoding=None):
         logging.debug(s)
         return None
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
-    header = read_header(inputfile, dialect, encoding)
+    header = read_header(inputfile, dialect, encoding, profile)
 
     if header is None:
         s = 'No header found for %s in %s.' % (inputfile, functionname)
@@ -1062,7 +1563,7 @@ def csv_field_checker(inputfile, dialect=None, encoding=None):
     return None
 
 def purge_non_printing_from_file(inputfile, outputfile, dialect=None, encoding=None, 
-    sub='-'):
+    sub='-', profile=None):
     ''' Remove new lines and carriage returns in data. Assumes that the header is intact
         with the correct number of columns.
     parameters:
@@ -1073,6 +1574,8 @@ def purge_non_printing_from_file(inputfile, outputfile, dialect=None, encoding=N
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
         sub - character sequence to substitute for the non-printing character 
             (default '-')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         False if the removal does not complete successfully, otherwise True
     '''
@@ -1088,18 +1591,11 @@ def purge_non_printing_from_file(inputfile, outputfile, dialect=None, encoding=N
         logging.debug(s)
         return None
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
-    header = read_header(inputfile, dialect, encoding)
+    header = read_header(inputfile, dialect, encoding, profile)
 
     if header is None:
         s = 'No header found for %s in %s.' % (inputfile, functionname)
@@ -1200,9 +1696,70 @@ def csv_file_encoding(inputfile, maxlines=None):
 
     return encoding
 
+def csv_prefix_encoding(prefix, blocks=None):
+    ''' Try to discern the encoding of a file from bytes read from the beginning of it,
+        such as an upload, as csv_file_encoding() does from the file.
+    parameters:
+        prefix - the bytes from the beginning of the file (required)
+        blocks - list of whole lines of bytes sampled from the rest of the file, from
+            read_sniff_sample() (optional)
+    returns:
+        the best guess at an encoding, defaulting to utf-8, or None on error
+    '''
+    functionname = 'csv_prefix_encoding()'
+
+    if prefix is None:
+        s = 'No data given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    detector = UniversalDetector()
+    if blocks is not None and len(blocks) > 0:
+        # The blocks follow the whole lines of the prefix, so that no character in
+        # what the detector is fed is cut in two.
+        end = prefix.rfind(b'\n')
+        if end != -1:
+            prefix = prefix[:end+1]
+    detector.feed(prefix)
+    if blocks is not None:
+        for block in blocks:
+            if detector.done:
+                break
+            detector.feed(block)
+    detector.close()
+    encoding = detector.result['encoding']
+
+    if encoding is None or len(encoding.strip()) == 0:
+        # Encoding not determined
+        s = 'No appropriate encoding found for prefix. Forcing utf8 '
+        s += 'in %s' % functionname
+        logging.debug(s)
+        encoding = 'utf-8'
+    elif encoding.lower() == 'ascii':
+        # A prefix with only ASCII in it says nothing about the rest of the file, which
+        # is most likely utf-8, of which ASCII is a subset.
+        encoding = 'utf-8'
+
+    return encoding
+
+def decode_prefix(prefix, encoding):
+    ''' Decode bytes read from the beginning of a file, without the incomplete character,
+        if any, at the end of them, and without a byte order mark.
+    parameters:
+        prefix - the bytes from the beginning of the file (required)
+        encoding - a string designating the file encoding (required)
+    returns:
+        text - the decoded text, with undecodable bytes replaced
+    '''
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    text = decoder.decode(prefix, final=False)
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    return text
+
 def extract_values_from_file(
     inputfile, fields, separator=None, dialect=None, encoding=None, 
-    function=None, *args, **kwargs):
+    function=None, *args, profile=None, **kwargs):
     ''' Get a list of the values of a list of fields from a file.
     parameters:
         inputfile - full path to the input file (required)
@@ -1215,6 +1772,8 @@ def extract_values_from_file(
         function - function to call for each value extracted (default None)
         args - unnamed parameters to function as tuple (optional)
         kwargs - named parameters to function as dictionary (optional)
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         values - the extracted values of the fields in the list, concatenated with
             separator between values
@@ -1231,22 +1790,15 @@ def extract_values_from_file(
         logging.debug(s)
         return None
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Create a set into which to put the distinct values
     values = set()
 
     # Create a cleaned version of the header
-    cleanheader = clean_header(read_header(inputfile, dialect, encoding))
+    cleanheader = clean_header(read_header(inputfile, dialect, encoding, profile))
 
     # Create a cleaned version of fields
     cleanfields = clean_header(fields)
@@ -1270,7 +1822,7 @@ def extract_values_from_file(
 
 def extract_value_counts_from_file(
     inputfile, fields, separator=None, dialect=None, encoding=None, 
-    function=None, *args, **kwargs):
+    function=None, *args, profile=None, **kwargs):
     ''' Get a dictionary of values of a list of fields from a file and their counts.
     parameters:
         inputfile - full path to the input file (required)
@@ -1283,6 +1835,8 @@ def extract_value_counts_from_file(
         function - function to call for each value extracted (default None)
         args - unnamed parameters to function as tuple (optional)
         kwargs - named parameters to function as dictionary (optional)
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header (optional; default None)
     returns:
         values - the extracted values of the fields in the list, concatenated with
             separator between values
@@ -1299,19 +1853,12 @@ def extract_value_counts_from_file(
         logging.debug(s)
         return None
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
-
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
     # Create a cleaned version of the header
-    cleanheader = clean_header(read_header(inputfile, dialect, encoding))
+    cleanheader = clean_header(read_header(inputfile, dialect, encoding, profile))
 
     # Create a cleaned version of fields
     cleanfields = clean_header(fields)
@@ -1406,9 +1953,13 @@ def extract_fields_from_row(row, fields, separator=None):
 
     return newrow
 
-def read_csv_row(inputfile, dialect, encoding, header=True, fieldnames=None):
+def read_csv_row(inputfile, dialect, encoding, header=True, fieldnames=None, 
+    start=None, stop=None, profile=None):
     ''' Yield a row from a csv file. Determine the existence of the file, its dialect, and 
-        its encoding before making a call to this function.
+        its encoding before making a call to this function. Given the FileProfile of a 
+        file with a header, reading starts at the indexed record offset nearest before 
+        start instead of at the beginning of the file, so that parts of a large file can
+        be read on their own, such as in parallel (see record_chunks()).
     parameters:
         inputfile - full path to the input file (required)
         dialect - csv.dialect object with the attributes of the input file (required)
@@ -1416,22 +1967,108 @@ def read_csv_row(inputfile, dialect, encoding, header=True, fieldnames=None):
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
         fieldnames -  list containing the fields in the header (optional)
         header - True if the file has a header row (optional; default True)
+        start - number of the first record to yield, 0 for the first one after the 
+            header (optional; default 0)
+        stop - number of the record before which to stop (optional; default None, to 
+            the end of the file)
+        profile - FileProfile of the input file, from file_profile(), for its index of 
+            record offsets (optional; default None)
     returns:
         row - the row as a dictionary
     '''
     functionname = 'read_csv_row()'
 
-    with open(inputfile, 'r', newline='', encoding=encoding) as data:
-        if fieldnames is None or len(fieldnames)==0:
-            reader = csv.DictReader(data, dialect=dialect)
-        else:
-            reader = csv.DictReader(data, dialect=dialect, fieldnames=fieldnames)
-            if header==True:
-                next(reader)
-        for row in reader:
+    if start is None or start < 0:
+        start = 0
+    count = None
+    if stop is not None:
+        count = max(stop - start, 0)
+
+    # Find the last indexed record at or before start. The offsets are those of the 
+    # records read with the dialect and encoding in the profile.
+    offset = None
+    skip = start
+    profile = current_profile(profile, inputfile)
+    if start > 0 and header == True and profile is not None and \
+        (dialect is None or dialect == profile.dialect) and \
+        (encoding is None or encoding == profile.encoding):
+        offsets = profile.get_record_offsets()
+        if offsets is not None and len(offsets) > 0:
+            i = min(start // profile.interval, len(offsets) - 1)
+            offset = offsets[i]
+            skip = start - i*profile.interval
+            dialect = profile.dialect
+            encoding = profile.encoding
+
+    if offset is None:
+        with open(inputfile, 'r', newline='', encoding=encoding) as data:
+            if fieldnames is None or len(fieldnames)==0:
+                reader = csv.DictReader(data, dialect=dialect)
+            else:
+                reader = csv.DictReader(data, dialect=dialect, fieldnames=fieldnames)
+                if header==True:
+                    next(reader)
+            for row in islice(reader, skip, None if count is None else skip+count):
+                yield row
+        return
+
+    # Reading does not start at the header, so the fieldnames have to be given.
+    if fieldnames is None or len(fieldnames)==0:
+        fieldnames = read_header(inputfile, dialect, encoding, profile)
+    with open(inputfile, 'rb') as f:
+        f.seek(offset)
+        data = io.TextIOWrapper(f, encoding=encoding, newline='')
+        reader = csv.DictReader(data, dialect=dialect, fieldnames=fieldnames)
+        for row in islice(reader, skip, None if count is None else skip+count):
             yield row
 
-def safe_read_csv_row(inputfile, dialect=None, encoding=None, header=True, fieldnames=None):
+def record_chunks(profile, chunkcount):
+    ''' Divide the records after the header of a file into consecutive ranges of about
+        the same number of bytes, each starting at an offset in the index of its 
+        FileProfile, to be read on their own with read_csv_row(), such as in parallel.
+    parameters:
+        profile - FileProfile of the file, from file_profile() (required)
+        chunkcount - the number of ranges wanted (required)
+    returns:
+        chunks - list of tuples of the number of the first record in a range and the 
+            number of the record after it, fewer than chunkcount if there are not enough
+            indexed records, or None on error
+    '''
+    functionname = 'record_chunks()'
+
+    if profile is None:
+        s = 'No file profile given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    rowcount = profile.get_rowcount()
+    if rowcount is None:
+        s = 'Unable to count the records of %s in %s.' % (profile.inputfile, functionname)
+        logging.debug(s)
+        return None
+
+    if represents_int(chunkcount) == False or int(chunkcount) < 1:
+        chunkcount = 1
+    chunkcount = int(chunkcount)
+
+    # Without offsets, records are divided evenly, each range read from the start.
+    offsets = profile.get_record_offsets()
+    if offsets is None or len(offsets) == 0:
+        size = max(-(-rowcount // chunkcount), 1)
+        return [(i, min(i+size, rowcount)) for i in range(0, rowcount, size)]
+
+    # Each range starts at the first indexed record at or after an even share of the 
+    # bytes of the records.
+    filesize = profile.key[1]
+    starts = [0]
+    for i in range(1, chunkcount):
+        j = bisect_left(offsets, offsets[0] + (filesize - offsets[0])*i // chunkcount)
+        if j < len(offsets) and j*profile.interval > starts[-1]:
+            starts.append(j*profile.interval)
+    return list(zip(starts, starts[1:] + [rowcount]))
+
+def safe_read_csv_row(inputfile, dialect=None, encoding=None, header=True, fieldnames=None,
+    profile=None, start=None, stop=None):
     ''' Yield a row from a csv file. This function tries to determine the existence of 
         the file, its dialect, and its encoding before opening and reading. These 
         parameters can be provided explicitly to speed up reading.
@@ -1442,6 +2079,13 @@ def safe_read_csv_row(inputfile, dialect=None, encoding=None, header=True, field
             (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
         fieldnames -  list containing the fields in the header (optional)
         header - True if the file has a header row (optional; default True)
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header, and for its index of record 
+            offsets (optional; default None)
+        start - number of the first record to yield, 0 for the first one after the 
+            header (optional; default 0)
+        stop - number of the record before which to stop (optional; default None, to 
+            the end of the file)
     returns:
         row - the row as a dictionary
     '''
@@ -1457,27 +2101,13 @@ def safe_read_csv_row(inputfile, dialect=None, encoding=None, header=True, field
         logging.debug(s)
         return None
 
-    # Determine the dialect of the input file
-    if dialect is None:
-        dialect = csv_file_dialect(inputfile)
-        # csv_file_dialect() always returns a dialect if there is an input file.
-        # No need to check.
+    # Determine the dialect and encoding of the input file with one look at it,
+    # unless they are given
+    dialect, encoding = sniff_file(inputfile, dialect, encoding, profile)
 
-    # Try to determine the encoding of the inputfile.
-    if encoding is None or len(encoding.strip()) == 0:
-        encoding = csv_file_encoding(inputfile)
-        # csv_file_encoding() always returns an encoding if there is an input file.    
-        # No need to check.
-    
-    with open(inputfile, 'r', newline='', encoding=encoding) as data:
-        if fieldnames is None or len(fieldnames)==0:
-            reader = csv.DictReader(data, dialect=dialect)
-        else:
-            reader = csv.DictReader(data, dialect=dialect, fieldnames=fieldnames)
-            if header==True:
-                next(reader)
-        for row in reader:
-            yield row
+    for row in read_csv_row(inputfile, dialect, encoding, header=header, 
+        fieldnames=fieldnames, start=start, stop=stop, profile=profile):
+        yield row
 
 # Not needed in Python 3.x
 # def utf8_file_encoder(inputfile, outputfile, encoding=None):
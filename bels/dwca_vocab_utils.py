@@ -16,7 +16,7 @@
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = "dwca_vocab_utils.py"
-__version__ = __filename__ + ' ' + "2022-06-08T15:52-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T14:00-03:00"
 __adapted_from__ = "https://github.com/kurator-org/kurator-validation/blob/master/packages/kurator_dwca/dwca_vocab_utils.py"
 
 # This file contains common utility functions for dealing with the vocabulary management
@@ -39,40 +39,138 @@ from dwca_terms import vocabfieldlist
 from dwca_terms import vocabrowdict
 from dwca_utils import write_header
 
+# Darwin Cloud vocabularies already loaded in this process, keyed by the absolute path
+# of the vocabulary file. Each entry is a tuple of the modification time and size of the
+# file when it was loaded and the vocabulary dictionary.
+darwincloudcache = {}
+
+# Maximum number of DarwinizePlans a Darwinizer keeps for the headers it has seen
+DARWINIZER_PLAN_CACHE_SIZE = 256
+
 class Darwinizer():
     def __init__(self, dwccloudfile=None):
         self.darwinclouddict = self.get_darwinizer_dict(dwccloudfile)
+        # DarwinizePlans for the headers already seen, keyed by (header, namespace)
+        self.plans = {}
 
     def get_darwinizer_dict(self, dwccloudfile):
         dirname = os.path.dirname(__file__)
         if dwccloudfile is None:
             vocabpath = os.path.join(dirname, './vocabularies/')
-            dwcloudfile = os.path.join(vocabpath, 'darwin_cloud.txt')
-        darwinclouddict = darwin_cloud_vocab_dict_from_file(dwccloudfile)
+            dwccloudfile = os.path.join(vocabpath, 'darwin_cloud.txt')
+        darwinclouddict = cached_darwin_cloud_vocab_dict(dwccloudfile)
         return darwinclouddict
 
     def darwinize_dict(self, inputdict, namespace=False):
         if self.darwinclouddict is None:
             return None
-        darwinizeddict = {}
+        # Rows of the same file share a header, so the plan for the header is compiled 
+        # only once.
+        header = tuple(inputdict)
+        plan = self.plans.get((header, namespace))
+        if plan is None:
+            if len(self.plans) >= DARWINIZER_PLAN_CACHE_SIZE:
+                self.plans.clear()
+            plan = self.plan(header, namespace=namespace)
+            self.plans[(header, namespace)] = plan
+        return dict(zip(plan.fieldnames, inputdict.values()))
+
+    def plan(self, header, namespace=False, case=None):
+        ''' Get a DarwinizePlan for a header using the vocabulary of this Darwinizer.
+        parameters:
+            header - list of the field names in the header (required)
+            namespace - True if the namespace should be prepended to standard terms
+            case - 'u' for uppercase, 'l' for lowercase output field names, default is
+                unchanged (optional)
+        returns:
+            plan - a DarwinizePlan for the header, or None if there is no vocabulary
+        '''
+        if self.darwinclouddict is None:
+            return None
+        return DarwinizePlan(header, darwinclouddict=self.darwinclouddict, 
+            namespace=namespace, case=case)
+
+class DarwinizePlan():
+    ''' The Darwinized field names for a header, found once so that every row with that 
+        header can be Darwinized by position without looking up its field names again.
+        Field names are translated as by Darwinizer.darwinize_dict().
+    '''
+    def __init__(self, header, dwccloudfile=None, darwinclouddict=None, namespace=False,
+        case=None):
+        ''' Compile the plan for a header.
+        parameters:
+            header - list of the field names in the header (required)
+            dwccloudfile - the vocabulary file for the Darwin Cloud (optional; default
+                the darwin_cloud.txt distributed with bels)
+            darwinclouddict - Darwin Cloud vocabulary dict to use instead of 
+                dwccloudfile (optional)
+            namespace - True if the namespace should be prepended to standard terms
+            case - 'u' for uppercase, 'l' for lowercase output field names, default is
+                unchanged (optional)
+        '''
+        if darwinclouddict is None:
+            darwinclouddict = Darwinizer(dwccloudfile).darwinclouddict
+        if darwinclouddict is None:
+            darwinclouddict = {}
+        if case is not None and len(case) > 0:
+            case = case[0].lower()
+        self.darwinclouddict = darwinclouddict
+        self.namespace = namespace
+        self.case = case
+        self.header = list(header)
+        self.fieldnames = []
         i = 1
-        for term, value in inputdict.items():
+        for term in self.header:
+            if term is None:
+                # csv.DictReader puts the values beyond the header under None
+                self.fieldnames.append(None)
+                continue
             newterm = term.strip()
             searchterm = ustripstr(term)
-            standardterm = None
-            if searchterm in self.darwinclouddict:
-                standardterm = self.darwinclouddict[searchterm].get('standard')
+            if searchterm in darwinclouddict:
+                standardterm = darwinclouddict[searchterm].get('standard')
                 if standardterm is not None and len(standardterm) > 0:
                     if namespace == True:
-                        ns = self.darwinclouddict[searchterm].get('namespace')
+                        ns = darwinclouddict[searchterm].get('namespace')
                         newterm = f'{ns}:{standardterm}'
                     else:
                         newterm = standardterm
             elif len(newterm) == 0:
                 newterm = f'UNNAMED_COLUMN_{i}'
                 i += 1
-            darwinizeddict[newterm]=value
-        return darwinizeddict
+            if case == 'u':
+                newterm = newterm.upper()
+            elif case == 'l':
+                newterm = newterm.lower()
+            self.fieldnames.append(newterm)
+        self.fieldcount = len(self.fieldnames)
+
+    def darwinize_row(self, row):
+        ''' Darwinize a row given as a list of values in the order of the header. 
+            Missing values are None, extra values are ignored.
+        parameters:
+            row - list of values (required)
+        returns:
+            darwinizeddict - dict of the values keyed by Darwinized field name
+        '''
+        if len(row) < self.fieldcount:
+            row = list(row) + [None]*(self.fieldcount - len(row))
+        return dict(zip(self.fieldnames, row))
+
+    def darwinize_dict(self, inputdict):
+        ''' Darwinize a dict with the keys of the header, in the order of the header, 
+            such as a row from csv.DictReader. A dict with any other keys is Darwinized 
+            with a plan compiled for its own keys.
+        parameters:
+            inputdict - dict of values keyed by the original field names (required)
+        returns:
+            darwinizeddict - dict of the values keyed by Darwinized field name
+        '''
+        if len(inputdict) == self.fieldcount and list(inputdict) == self.header:
+            return dict(zip(self.fieldnames, inputdict.values()))
+        plan = DarwinizePlan(inputdict.keys(), darwinclouddict=self.darwinclouddict,
+            namespace=self.namespace, case=self.case)
+        return plan.darwinize_dict(inputdict)
 
 def vocabheader(key, separator=None):
     ''' Construct the header row for a vocabulary file. Begin with a field name equal to 
@@ -388,11 +486,10 @@ def vocab_dict_from_file(
     # Iterate through all rows in the input file
     for row in read_csv_row(vocabfile, dialect, encoding, header=True, 
             fieldnames=fieldnames):
-        # Make a complete copy of the row
-        rowdict = copy.deepcopy(row)
-        value = row[key]
-        # Remove the key from the row copy
-        rowdict.pop(key)
+        # Each row is a new dict of strings, so it can be kept as the entry without 
+        # making a copy
+        rowdict = row
+        value = rowdict.pop(key)
         newvalue = value
         # If we are supposed to apply a function to the key value
         if function is not None:
@@ -432,14 +529,48 @@ def darwin_cloud_vocab_dict_from_file(vocabfile):
     # Iterate through all rows in the input file. Let read_csv_row figure out the dialect
     for row in read_csv_row(vocabfile, dialect=dialect, encoding='utf-8', header=True, 
             fieldnames=header):
-        # Make a complete copy of the row
-        rowdict = copy.deepcopy(row)
-        key = row['fieldname']
-        # Remove the key from the row copy
-        rowdict.pop('fieldname')
+        # Each row is a new dict of strings, so it can be kept as the entry without 
+        # making a copy
+        rowdict = row
+        key = rowdict.pop('fieldname')
         vocabdict[key]=rowdict                
     return vocabdict
 
+def cached_darwin_cloud_vocab_dict(vocabfile):
+    ''' Get a Darwin Cloud vocabulary as a dictionary, loading it from the file only if 
+        it has not already been loaded in this process or if the file has been modified 
+        since it was. The same dictionary is returned to every caller, so it must not be 
+        modified.
+    parameters:
+        vocabfile - path to the vocabulary file (required)
+    returns:
+        vocabdict - dictionary of complete vocabulary records
+    '''
+    functionname = 'cached_darwin_cloud_vocab_dict()'
+
+    if vocabfile is None or len(vocabfile) == 0:
+        s = 'No vocabulary file given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    try:
+        stat = os.stat(vocabfile)
+    except OSError:
+        s = 'Vocabulary file %s not found in %s.' % (vocabfile, functionname)
+        logging.debug(s)
+        return None
+
+    cachekey = os.path.abspath(vocabfile)
+    filestate = (stat.st_mtime_ns, stat.st_size)
+    cached = darwincloudcache.get(cachekey)
+    if cached is not None and cached[0] == filestate:
+        return cached[1]
+
+    vocabdict = darwin_cloud_vocab_dict_from_file(vocabfile)
+    if vocabdict is not None:
+        darwincloudcache[cachekey] = (filestate, vocabdict)
+    return vocabdict
+
 def term_values_recommended(lookupdict):
     ''' Get non-standard values and their standard equivalents from a lookupdict
     parameters:
@@ -645,13 +776,7 @@ def darwinize_list(termlist, dwccloudfile, namespace=None, case=None):
         logging.debug(s)
         return None
 
-    dialect = csv_file_dialect(dwccloudfile)
-
-    # No need to check if dwccloudfile is given and exists, vetted_vocab_dict_from_file() 
-    # does that.
-    if len(dialect.escapechar)!=1:
-        print(f'In dwca_vocab_utils.py: darwinize_list(), dialect: -------\n {vars(dialect)}')
-    darwinclouddict = darwin_cloud_vocab_dict_from_file(dwccloudfile)
+    darwinclouddict = cached_darwin_cloud_vocab_dict(dwccloudfile)
 
     if darwinclouddict is None:
         s = 'No Darwin Cloud terms in %s.' % functionname
@@ -712,11 +837,9 @@ def darwinize_dict(inputdict, dwccloudfile, namespace=False):
         logging.debug(s)
         return None
 
-    dialect = csv_file_dialect(dwccloudfile)
-
-    # No need to check if dwccloudfile is given and exists, vetted_vocab_dict_from_file() 
-    # does that.
-    darwinclouddict = darwin_cloud_vocab_dict_from_file(dwccloudfile)
+    # No need to check if dwccloudfile is given and exists, 
+    # cached_darwin_cloud_vocab_dict() does that.
+    darwinclouddict = cached_darwin_cloud_vocab_dict(dwccloudfile)
 
     if darwinclouddict is None:
         s = 'No Darwin Cloud terms in %s.' % functionname
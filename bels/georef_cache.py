@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "georef_cache.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
+
+# This file contains caches of the results of best georeference lookups and a
+# GeorefStore that looks up best georeferences through a cache in front of another
+# GeorefStore. Results are cached by match type, match string and gazetteer version,
+# for a limited time (ttl) and up to a maximum number of entries, beyond which the least
+# recently used entries are evicted. Match strings without a georeference are cached
+# too, so that repeated misses do not go to the store either.
+#
+# MemoryGeorefCache is private to a process. SQLiteGeorefCache is in a file that can be
+# shared by all of the processes of a server on the same machine.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from georef_store import GeorefStore
+from json_utils import CustomJsonEncoder
+
+# Default maximum number of entries in a cache
+GEOREF_CACHE_SIZE = 100000
+
+# Default number of seconds an entry stays in a cache
+GEOREF_CACHE_TTL = 86400
+
+# Names of the statistics kept by a cache
+georefcachestatlist = ['hits', 'negative_hits', 'misses', 'sets', 'evictions',
+    'expirations']
+
+def georef_cache_key(matchtype, matchstr, version=None):
+    ''' Get the key of the result for a match string in a georef cache.
+    parameters:
+        matchtype - the kind of match, one of matchtypelist
+        matchstr - the simplified Location match string
+        version - the version of the gazetteer the result came from (optional)
+    returns:
+        key - the cache key as a string
+    '''
+    # The match string is last, so it can contain the separator.
+    if version is None:
+        version = ''
+    return f'{version}|{matchtype}|{matchstr}'
+
+def georef_store_version(path):
+    ''' Get a version of the gazetteer in a local georef store from its files, which 
+        changes whenever the store is rebuilt.
+    parameters:
+        path - full path to the SQLite database file or the directory of index files of
+            the store (required)
+    returns:
+        version - string of the latest modification time and the total size of the 
+            files, or None if there is no store at path
+    '''
+    if path is None or len(path) == 0:
+        return None
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        files = [file for file in files if os.path.isfile(file)]
+    elif os.path.isfile(path):
+        files = [path]
+    else:
+        return None
+    if len(files) == 0:
+        return None
+    stats = [os.stat(file) for file in files]
+    mtime = max(stat.st_mtime_ns for stat in stats)
+    size = sum(stat.st_size for stat in stats)
+    return f'{mtime}-{size}'
+
+class GeorefCache(ABC):
+    ''' Interface for a cache of best georeference lookup results. A cached value of
+        None is a lookup that found no georeference. Implementations provide lookup(),
+        store() and size().
+    '''
+    def __init__(self, maxsize=None, ttl=None):
+        if maxsize is None:
+            maxsize = GEOREF_CACHE_SIZE
+        if ttl is None:
+            ttl = GEOREF_CACHE_TTL
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = {stat: 0 for stat in georefcachestatlist}
+        self.statslock = threading.Lock()
+
+    @abstractmethod
+    def lookup(self, key):
+        ''' Get an entry from the cache.
+        parameters:
+            key - the cache key from georef_cache_key()
+        returns:
+            (found, georef) - found is True if the key is in the cache and has not
+                expired, and georef is the cached result, which is None for a lookup
+                that found no georeference
+        '''
+
+    @abstractmethod
+    def store(self, key, georef):
+        ''' Put an entry in the cache.
+        parameters:
+            key - the cache key from georef_cache_key()
+            georef - the result of the lookup, None if it found no georeference
+        '''
+
+    @abstractmethod
+    def size(self):
+        ''' Get the number of entries in the cache.
+        returns:
+            size - the number of entries, including any that have expired but have not
+                been removed
+        '''
+
+    def count(self, stat, n=1):
+        with self.statslock:
+            self.stats[stat] += n
+
+    def get_stats(self):
+        ''' Get the statistics of the cache.
+        returns:
+            stats - dict of the counts in georefcachestatlist for this process, the
+                hit_rate, the current size, maxsize and ttl
+        '''
+        with self.statslock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = None
+        if lookups > 0:
+            stats['hit_rate'] = (stats['hits'] + stats['negative_hits'])/lookups
+        stats['size'] = self.size()
+        stats['maxsize'] = self.maxsize
+        stats['ttl'] = self.ttl
+        return stats
+
+    def close(self):
+        pass
+
+class MemoryGeorefCache(GeorefCache):
+    ''' A GeorefCache in the memory of the process.
+    '''
+    def __init__(self, maxsize=None, ttl=None):
+        super().__init__(maxsize, ttl)
+        # Entries are (expiry time, georef), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                else:
+                    del self.entries[key]
+                    entry = None
+                    self.count('expirations')
+        if entry is None:
+            self.count('misses')
+            return False, None
+        georef = entry[1]
+        if georef is None:
+            self.count('negative_hits')
+            return True, None
+        self.count('hits')
+        # Callers may change the result they get, so they get a copy.
+        return True, dict(georef)
+
+    def store(self, key, georef):
+        if georef is not None:
+            georef = dict(georef)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, georef)
+            self.entries.move_to_end(key)
+            evicted = 0
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                evicted += 1
+        self.count('sets')
+        if evicted > 0:
+            self.count('evictions', evicted)
+
+    def size(self):
+        return len(self.entries)
+
+class SQLiteGeorefCache(GeorefCache):
+    ''' A GeorefCache in an SQLite database file, which can be shared by processes on
+        the same machine. The statistics are those of this process.
+    '''
+    def __init__(self, dbfile, maxsize=None, ttl=None):
+        super().__init__(maxsize, ttl)
+        self.dbfile = dbfile
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(dbfile, timeout=30, check_same_thread=False,
+            isolation_level=None)
+        # Write-ahead logging lets processes read while another writes.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS georef_cache ('
+            'key TEXT PRIMARY KEY, georef TEXT, expires REAL, used REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS georef_cache_used '
+            'ON georef_cache (used)')
+
+    def lookup(self, key):
+        # Expiry times are wall clock times, because they are shared between processes.
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT georef, expires FROM georef_cache WHERE key=?', (key,)).fetchone()
+            if row is not None:
+                if row[1] > now:
+                    self.connection.execute(
+                        'UPDATE georef_cache SET used=? WHERE key=?', (now, key))
+                else:
+                    self.connection.execute(
+                        'DELETE FROM georef_cache WHERE key=?', (key,))
+                    row = None
+                    self.count('expirations')
+        if row is None:
+            self.count('misses')
+            return False, None
+        if row[0] is None:
+            self.count('negative_hits')
+            return True, None
+        self.count('hits')
+        return True, json.loads(row[0])
+
+    def store(self, key, georef):
+        now = time.time()
+        value = None
+        if georef is not None:
+            value = json.dumps(georef, cls=CustomJsonEncoder)
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO georef_cache '
+                '(key, georef, expires, used) VALUES (?, ?, ?, ?)',
+                (key, value, now + self.ttl, now))
+            excess = self.size() - self.maxsize
+            if excess > 0:
+                # Evict the least recently used entries
+                self.connection.execute('DELETE FROM georef_cache WHERE key IN '
+                    '(SELECT key FROM georef_cache ORDER BY used LIMIT ?)', (excess,))
+        self.count('sets')
+        if excess > 0:
+            self.count('evictions', excess)
+
+    def size(self):
+        return self.connection.execute('SELECT COUNT(*) FROM georef_cache').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+class CachedGeorefStore(GeorefStore):
+    ''' A GeorefStore that looks up best georeferences in a GeorefCache before looking
+        them up in another GeorefStore, and caches what it finds, including misses.
+    '''
+    def __init__(self, georef_store, cache, version=None):
+        self.georef_store = georef_store
+        self.cache = cache
+        # The version of the gazetteer in the store, so that results from a previous
+        # version in a shared cache are not used.
+        self.version = version
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        key = georef_cache_key(matchtype, matchstr, self.version)
+        found, georef = self.cache.lookup(key)
+        if found == True:
+            return georef
+        georef = self.georef_store.get_best_georef_reduced(matchtype, matchstr)
+        self.cache.store(key, georef)
+        return georef
+
+    def get_best_georefs_reduced(self, matchtype, matchstrs):
+        georefs = {}
+        uncached = []
+        for matchstr in dict.fromkeys(matchstrs):
+            if matchstr is None:
+                continue
+            found, georef = self.cache.lookup(
+                georef_cache_key(matchtype, matchstr, self.version))
+            if found == False:
+                uncached.append(matchstr)
+            elif georef is not None:
+                georefs[matchstr] = georef
+        if len(uncached) > 0:
+            found = self.georef_store.get_best_georefs_reduced(matchtype, uncached)
+            for matchstr in uncached:
+                georef = found.get(matchstr)
+                self.cache.store(georef_cache_key(matchtype, matchstr, self.version),
+                    georef)
+                if georef is not None:
+                    georefs[matchstr] = georef
+        return georefs
+
+    def get_stats(self):
+        ''' Get the statistics of the cache, with the gazetteer version.'''
+        stats = self.cache.get_stats()
+        stats['version'] = self.version
+        return stats
+
+    def close(self):
+        self.cache.close()
+        self.georef_store.close()
@@ -0,0 +1,672 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "georef_store.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
+
+# This file contains the interface for stores of the best georeferences for Location
+# match strings, and two local implementations of it, one in an SQLite database and one 
+# in memory-mapped index files. Each holds the content of the three 
+# matchme_*_best_georef tables of the gazetteer, loaded from CSV exports of those 
+# tables, with only the fields returned by the get_best_*_georef_reduced() functions in 
+# bels_query. The BigQuery implementation is BigQueryGeorefStore in bels_query.
+#
+# The index files for a table are in a directory of index files. The .dat file has one 
+# record per match string, a JSON list of the stored values followed by a line feed. 
+# The .idx file has a 16 byte header (GEOREF_INDEX_MAGIC and the entry count) followed 
+# by the entries sorted by hash, each a big-endian 64-bit hash of the match string and 
+# the 64-bit offset of its record in the .dat file. A lookup is a binary search in the 
+# memory-mapped .idx file and a read of one record in the memory-mapped .dat file, so 
+# processes opening the same files share them through the page cache.
+#
+# resolve_best_georef() finds the best georeference from the tiers of matching for a
+# Location in any GeorefStore, either one tier at a time or all at once. 
+# resolve_best_georefs() does the same for a list of Locations with one batched lookup
+# per tier.
+#
+# Examples:
+#
+# python georef_store.py -d ./gazetteer.db -t sans_coords
+#   -i ./matchme_sans_coords_best_georef_000000000000.csv.gz
+#
+# python georef_store.py -f mmap -d ./gazetteer_index -t sans_coords
+#   -i ./matchme_sans_coords_best_georef_000000000000.csv.gz
+
+import argparse
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from decimal import Decimal, ROUND_HALF_UP
+
+from dwca_utils import setup_actor_logging
+
+# The kinds of Location matches, in the order in which they are tried
+matchtypelist = ['with_coords', 'verbatim_coords', 'sans_coords']
+
+# For each kind of match, the name of the table in the store, the match string field in
+# the gazetteer table and the bels_match_type given to the result.
+georefstoretables = {
+    'with_coords': {
+        'table':'matchme_with_coords_best_georef',
+        'matchfield':'matchme_with_coords',
+        'matchtype':'match with coords'},
+    'verbatim_coords': {
+        'table':'matchme_verbatimcoords_best_georef',
+        'matchfield':'matchme',
+        'matchtype':'match using verbatim coords'},
+    'sans_coords': {
+        'table':'matchme_sans_coords_best_georef',
+        'matchfield':'matchme_sans_coords',
+        'matchtype':'match sans coords'}
+}
+
+# The fields of the result of a reduced best georeference query, in order
+reducedgeoreffieldlist = [
+    'bels_countrycode',
+    'bels_match_string',
+    'bels_decimallatitude',
+    'bels_decimallongitude',
+    'bels_geodeticdatum',
+    'bels_coordinateuncertaintyinmeters',
+    'bels_georeferencedby',
+    'bels_georeferenceddate',
+    'bels_georeferenceprotocol',
+    'bels_georeferencesources',
+    'bels_georeferenceremarks',
+    'bels_georeference_score',
+    'bels_georeference_source',
+    'bels_best_of_n_georeferences',
+    'bels_match_type'
+]
+
+# For each field stored, the SQLite type and the fields of the gazetteer table it can be
+# loaded from, in order of preference. Older exports have best_interpreted_* fields.
+georefstorefields = [
+    ('bels_countrycode', 'TEXT',
+        ['interpreted_countrycode', 'best_interpreted_countrycode']),
+    ('bels_decimallatitude', 'REAL',
+        ['interpreted_decimallatitude', 'best_interpreted_decimallatitude']),
+    ('bels_decimallongitude', 'REAL',
+        ['interpreted_decimallongitude', 'best_interpreted_decimallongitude']),
+    ('bels_coordinateuncertaintyinmeters', 'INTEGER', ['unc_numeric']),
+    ('bels_georeferencedby', 'TEXT', ['v_georeferencedby']),
+    ('bels_georeferenceddate', 'TEXT', ['v_georeferenceddate']),
+    ('bels_georeferenceprotocol', 'TEXT', ['v_georeferenceprotocol']),
+    ('bels_georeferencesources', 'TEXT', ['v_georeferencesources']),
+    ('bels_georeferenceremarks', 'TEXT', ['v_georeferenceremarks']),
+    ('bels_georeference_score', 'INTEGER', ['georef_score']),
+    ('bels_georeference_source', 'TEXT', ['source']),
+    ('bels_best_of_n_georeferences', 'INTEGER', ['georef_count'])
+]
+
+# Number of rows to insert into the store at a time when loading
+GEOREF_STORE_LOAD_BATCH_SIZE = 10000
+
+# Header of an index file and the format of the header and of the entries
+GEOREF_INDEX_MAGIC = b'BELSIDX1'
+georefindexheader = struct.Struct('>8sQ')
+georefindexentry = struct.Struct('>QQ')
+
+# Number of index entries sorted in memory at a time when building an index
+GEOREF_INDEX_SORT_BATCH_SIZE = 4000000
+
+class GeorefStore(ABC):
+    ''' Interface for a store of the best georeferences for Location match strings.
+        Implementations provide get_best_georef_reduced().
+    '''
+    @abstractmethod
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        ''' Get the best georeference for a match string.
+        parameters:
+            matchtype - the kind of match, one of matchtypelist
+            matchstr - the simplified Location match string to match
+        returns:
+            georef - dict of the reducedgeoreffieldlist fields, or None if there is no
+                georeference for matchstr
+        '''
+
+    def get_best_with_coords_georef_reduced(self, matchstr):
+        return self.get_best_georef_reduced('with_coords', matchstr)
+
+    def get_best_with_verbatim_coords_georef_reduced(self, matchstr):
+        return self.get_best_georef_reduced('verbatim_coords', matchstr)
+
+    def get_best_sans_coords_georef_reduced(self, matchstr):
+        return self.get_best_georef_reduced('sans_coords', matchstr)
+
+    def get_best_georefs_reduced(self, matchtype, matchstrs):
+        ''' Get the best georeferences for a list of match strings. Implementations for
+            which each lookup is a round trip override this to look them up in batches.
+        parameters:
+            matchtype - the kind of match, one of matchtypelist
+            matchstrs - list of simplified Location match strings to match
+        returns:
+            georefs - dict of the georeference for each match string that has one, keyed
+                by match string
+        '''
+        georefs = {}
+        # Look up each distinct match string only once
+        for matchstr in dict.fromkeys(matchstrs):
+            if matchstr is None:
+                continue
+            georef = self.get_best_georef_reduced(matchtype, matchstr)
+            if georef is not None:
+                georefs[matchstr] = georef
+        return georefs
+
+    def close(self):
+        pass
+
+class SQLiteGeorefStore(GeorefStore):
+    ''' A GeorefStore in a local SQLite database built with load_georef_store().
+    '''
+    def __init__(self, dbfile):
+        # Lookups only read, so the connection can be shared by the threads of a server.
+        self.dbfile = dbfile
+        self.connection = sqlite3.connect(f'file:{dbfile}?mode=ro', uri=True,
+            check_same_thread=False)
+        self.queries = {}
+        for matchtype in matchtypelist:
+            table = georefstoretables[matchtype]['table']
+            self.queries[matchtype] = \
+                f'SELECT * FROM {table} WHERE bels_match_string=?'
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        try:
+            query = self.queries[matchtype]
+        except KeyError:
+            s = f'Match type {matchtype} not supported in SQLiteGeorefStore.'
+            logging.debug(s)
+            return None
+        try:
+            row = self.connection.execute(query, (matchstr,)).fetchone()
+        except sqlite3.OperationalError as e:
+            # The table for the match type has not been loaded
+            s = f'{e} in SQLiteGeorefStore {self.dbfile}'
+            logging.debug(s)
+            return None
+        if row is None:
+            return None
+        return reduced_georef(matchtype, row)
+
+    def close(self):
+        self.connection.close()
+
+class MmapGeorefStore(GeorefStore):
+    ''' A GeorefStore in memory-mapped index files built with build_georef_index().
+    '''
+    def __init__(self, indexdir):
+        self.indexdir = indexdir
+        self.files = []
+        self.indexes = {}
+        for matchtype in matchtypelist:
+            idxfile, datfile = georef_index_files(indexdir, matchtype)
+            if os.path.isfile(idxfile) == False or os.path.isfile(datfile) == False:
+                continue
+            idx = self.map_file(idxfile)
+            dat = self.map_file(datfile)
+            if idx is None:
+                continue
+            magic, count = georefindexheader.unpack_from(idx, 0)
+            if magic != GEOREF_INDEX_MAGIC:
+                s = f'{idxfile} is not a georef index file.'
+                logging.debug(s)
+                continue
+            self.indexes[matchtype] = (idx, dat, count)
+
+    def map_file(self, file):
+        f = open(file, 'rb')
+        self.files.append(f)
+        if os.path.getsize(file) == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        index = self.indexes.get(matchtype)
+        if index is None:
+            return None
+        idx, dat, count = index
+        key = match_string_hash(matchstr)
+        headersize = georefindexheader.size
+        entrysize = georefindexentry.size
+
+        # Find the first entry with the hash of the match string
+        lo = 0
+        hi = count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if georefindexentry.unpack_from(idx, headersize + mid*entrysize)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        # More than one match string can have the same hash. If a match string was 
+        # loaded more than once, the last one loaded is the one to use.
+        values = None
+        while lo < count:
+            hash, offset = georefindexentry.unpack_from(idx, headersize + lo*entrysize)
+            if hash != key:
+                break
+            record = json.loads(dat[offset:dat.find(b'\n', offset)])
+            if record[0] == matchstr:
+                values = record
+            lo += 1
+        if values is None:
+            return None
+        return reduced_georef(matchtype, values)
+
+    def close(self):
+        for matchtype, (idx, dat, count) in self.indexes.items():
+            idx.close()
+            if dat is not None:
+                dat.close()
+        self.indexes = {}
+        for f in self.files:
+            f.close()
+        self.files = []
+
+def open_georef_store(path):
+    ''' Open a local georef store, either an SQLite database or a directory of index 
+        files.
+    parameters:
+        path - full path to the SQLite database file or the directory of index files
+    returns:
+        store - a SQLiteGeorefStore or MmapGeorefStore, or None if path does not exist
+    '''
+    if os.path.isdir(path):
+        return MmapGeorefStore(path)
+    if os.path.isfile(path):
+        return SQLiteGeorefStore(path)
+    s = f'Georef store {path} not found.'
+    logging.debug(s)
+    return None
+
+def resolve_best_georef(georef_store, tiers, executor=None):
+    ''' Get the best georeference from the highest priority tier of matching that has 
+        one. Without an executor, the tiers are looked up one at a time until one has a
+        georeference. With an executor, all of the tiers are looked up at once and the
+        georeference is returned as soon as the tiers of higher priority are known to 
+        have none. Lookups of lower priority tiers that have not started by then are 
+        cancelled.
+    parameters:
+        georef_store - the GeorefStore in which to look up the georeferences (required)
+        tiers - list of (matchtype, matchstr) tuples in priority order (required)
+        executor - a concurrent.futures.Executor in which to run the lookups (optional)
+    returns:
+        georef - dict of the reducedgeoreffieldlist fields for the highest priority tier 
+            with a georeference, or None if no tier has one
+    '''
+    if executor is None or len(tiers) < 2:
+        for matchtype, matchstr in tiers:
+            georef = georef_store.get_best_georef_reduced(matchtype, matchstr)
+            if georef is not None:
+                return georef
+        return None
+
+    futures = [executor.submit(georef_store.get_best_georef_reduced, matchtype, 
+        matchstr) for matchtype, matchstr in tiers]
+    try:
+        # Waiting in priority order returns the first tier with a georeference once
+        # all of the tiers before it have come back without one.
+        for future in futures:
+            georef = future.result()
+            if georef is not None:
+                return georef
+        return None
+    finally:
+        for future in futures:
+            future.cancel()
+
+def resolve_best_georefs(georef_store, tierslist):
+    ''' Get the best georeference for each of a list of Locations from the highest 
+        priority tier of matching that has one, with one batched lookup per tier. Each 
+        tier is looked up only for the Locations that did not get a georeference from a
+        tier of higher priority.
+    parameters:
+        georef_store - the GeorefStore in which to look up the georeferences (required)
+        tierslist - list of the match tiers for each Location, each a list of 
+            (matchtype, matchstr) tuples in priority order (required)
+    returns:
+        georefs - list of the best georeference for each Location, in the order of 
+            tierslist, None for Locations without one. Locations with the same match
+            string share the same georeference dict.
+    '''
+    georefs = [None]*len(tierslist)
+    for matchtype in matchtypelist:
+        pending = []
+        for i, tiers in enumerate(tierslist):
+            if georefs[i] is not None:
+                continue
+            for tiermatchtype, matchstr in tiers:
+                if tiermatchtype == matchtype:
+                    pending.append((i, matchstr))
+        if len(pending) == 0:
+            continue
+        found = georef_store.get_best_georefs_reduced(matchtype,
+            [matchstr for i, matchstr in pending])
+        for i, matchstr in pending:
+            georefs[i] = found.get(matchstr)
+    return georefs
+
+def reduced_georef(matchtype, row):
+    ''' Get a row of a table in a georef store as a reduced best georeference.
+    parameters:
+        matchtype - the kind of match, one of matchtypelist
+        row - tuple of bels_match_string followed by the values of the georefstorefields
+    returns:
+        georef - dict of the reducedgeoreffieldlist fields
+    '''
+    georef = {'bels_match_string': row[0]}
+    for (field, fieldtype, sources), value in zip(georefstorefields, row[1:]):
+        georef[field] = value
+    georef['bels_geodeticdatum'] = 'epsg:4326'
+    georef['bels_match_type'] = georefstoretables[matchtype]['matchtype']
+    return {field: georef[field] for field in reducedgeoreffieldlist}
+
+def store_value(fieldtype, value):
+    ''' Convert a value from a CSV export to the type of the field in the store. Empty
+        values are NULL in BigQuery, so they are stored as None.
+    parameters:
+        fieldtype - the SQLite type of the field
+        value - the value as a string
+    returns:
+        the converted value, or None if it is empty or can not be converted
+    '''
+    if value is None or len(value) == 0:
+        return None
+    try:
+        if fieldtype == 'INTEGER':
+            # As SAFE_CAST(round(unc_numeric,0) AS INT64) in BigQuery, halves away from 0
+            return int(Decimal(value).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        if fieldtype == 'REAL':
+            return float(value)
+    except Exception:
+        return None
+    return value
+
+def create_georef_store(dbfile):
+    ''' Create the tables of a georef store if they do not exist.
+    parameters:
+        dbfile - full path to the SQLite database file (required)
+    returns:
+        connection - an open sqlite3 connection to the database
+    '''
+    connection = sqlite3.connect(dbfile)
+    fields = ', '.join(f'{field} {fieldtype}'
+        for field, fieldtype, sources in georefstorefields)
+    for matchtype in matchtypelist:
+        table = georefstoretables[matchtype]['table']
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+            f'(bels_match_string TEXT PRIMARY KEY, {fields}) WITHOUT ROWID')
+    connection.commit()
+    return connection
+
+def read_export_rows(inputfile):
+    ''' Yield the rows of a CSV export of a BigQuery table, compressed with gzip or not.
+    parameters:
+        inputfile - full path to the input file (required)
+    returns:
+        row - the row as a dictionary
+    '''
+    if inputfile.endswith('.gz'):
+        data = gzip.open(inputfile, 'rt', newline='', encoding='utf-8')
+    else:
+        data = open(inputfile, 'r', newline='', encoding='utf-8')
+    with data:
+        for row in csv.DictReader(data):
+            yield row
+
+def export_store_rows(matchtype, inputfiles):
+    ''' Yield the values to store for the rows of CSV exports of a matchme_*_best_georef 
+        table. Rows without a match string are skipped.
+    parameters:
+        matchtype - the kind of match the table is for, one of matchtypelist (required)
+        inputfiles - list of full paths to the CSV export files (required)
+    returns:
+        values - list of bels_match_string followed by the values of the 
+            georefstorefields
+    '''
+    matchfield = georefstoretables[matchtype]['matchfield']
+    for inputfile in inputfiles:
+        sources = None
+        for row in read_export_rows(inputfile):
+            if sources is None:
+                # Find the field to load each stored field from in this export
+                sources = []
+                for field, fieldtype, candidates in georefstorefields:
+                    source = None
+                    for candidate in candidates:
+                        if candidate in row:
+                            source = candidate
+                            break
+                    sources.append((fieldtype, source))
+            matchstr = row.get(matchfield)
+            if matchstr is None or len(matchstr) == 0:
+                continue
+            values = [matchstr]
+            for fieldtype, source in sources:
+                values.append(store_value(fieldtype, row.get(source)))
+            yield values
+
+def load_georef_store(dbfile, matchtype, inputfiles):
+    ''' Load CSV exports of a matchme_*_best_georef table into a georef store, replacing
+        any existing entries for the same match strings.
+    parameters:
+        dbfile - full path to the SQLite database file (required)
+        matchtype - the kind of match the table is for, one of matchtypelist (required)
+        inputfiles - list of full paths to the CSV export files (required)
+    returns:
+        rowcount - the number of rows loaded, or None if the inputs were not valid
+    '''
+    functionname = 'load_georef_store()'
+
+    if matchtype not in matchtypelist:
+        s = f'Match type {matchtype} not one of {matchtypelist} in {functionname}.'
+        logging.debug(s)
+        return None
+
+    for inputfile in inputfiles:
+        if os.path.isfile(inputfile) == False:
+            s = f'File {inputfile} not found in {functionname}.'
+            logging.debug(s)
+            return None
+
+    table = georefstoretables[matchtype]['table']
+    placeholders = ', '.join(['?']*(len(georefstorefields)+1))
+    insert = f'INSERT OR REPLACE INTO {table} VALUES ({placeholders})'
+
+    connection = create_georef_store(dbfile)
+    rowcount = 0
+    try:
+        batch = []
+        for values in export_store_rows(matchtype, inputfiles):
+            batch.append(values)
+            if len(batch) >= GEOREF_STORE_LOAD_BATCH_SIZE:
+                connection.executemany(insert, batch)
+                rowcount += len(batch)
+                batch = []
+        connection.executemany(insert, batch)
+        rowcount += len(batch)
+        connection.commit()
+    finally:
+        connection.close()
+    return rowcount
+
+def match_string_hash(matchstr):
+    ''' Get the 64-bit hash of a match string used in georef index files.
+    parameters:
+        matchstr - the match string
+    returns:
+        hash - the hash as an int
+    '''
+    digest = hashlib.blake2b(matchstr.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def georef_index_files(indexdir, matchtype):
+    ''' Get the paths to the index and record files for a match type.
+    parameters:
+        indexdir - full path to the directory of index files
+        matchtype - the kind of match, one of matchtypelist
+    returns:
+        (idxfile, datfile) - the full paths to the index file and the record file
+    '''
+    table = georefstoretables[matchtype]['table']
+    return (os.path.join(indexdir, f'{table}.idx'), os.path.join(indexdir, f'{table}.dat'))
+
+def build_georef_index(indexdir, matchtype, inputfiles):
+    ''' Build the index files for a matchme_*_best_georef table from CSV exports of the
+        table, replacing any existing index files for the table. The entries are sorted 
+        in batches of GEOREF_INDEX_SORT_BATCH_SIZE and the batches merged, so tables of 
+        any size can be indexed in bounded memory.
+    parameters:
+        indexdir - full path to the directory of index files (required)
+        matchtype - the kind of match the table is for, one of matchtypelist (required)
+        inputfiles - list of full paths to the CSV export files (required)
+    returns:
+        rowcount - the number of rows indexed, or None if the inputs were not valid
+    '''
+    functionname = 'build_georef_index()'
+
+    if matchtype not in matchtypelist:
+        s = f'Match type {matchtype} not one of {matchtypelist} in {functionname}.'
+        logging.debug(s)
+        return None
+
+    for inputfile in inputfiles:
+        if os.path.isfile(inputfile) == False:
+            s = f'File {inputfile} not found in {functionname}.'
+            logging.debug(s)
+            return None
+
+    os.makedirs(indexdir, exist_ok=True)
+    idxfile, datfile = georef_index_files(indexdir, matchtype)
+
+    # Write the records and sorted runs of (hash, offset) entries
+    runs = []
+    entries = []
+    rowcount = 0
+    with open(datfile + '.tmp', 'wb') as dat:
+        for values in export_store_rows(matchtype, inputfiles):
+            entries.append((match_string_hash(values[0]), dat.tell()))
+            dat.write(json.dumps(values, ensure_ascii=False).encode('utf-8') + b'\n')
+            rowcount += 1
+            if len(entries) >= GEOREF_INDEX_SORT_BATCH_SIZE:
+                runs.append(write_index_run(indexdir, entries))
+                entries = []
+    runs.append(write_index_run(indexdir, entries))
+
+    # Merge the runs into the index file
+    with open(idxfile + '.tmp', 'wb') as idx:
+        idx.write(georefindexheader.pack(GEOREF_INDEX_MAGIC, rowcount))
+        for entry in heapq.merge(*[read_index_run(run) for run in runs]):
+            idx.write(georefindexentry.pack(*entry))
+    for run in runs:
+        os.remove(run)
+
+    os.replace(datfile + '.tmp', datfile)
+    os.replace(idxfile + '.tmp', idxfile)
+    return rowcount
+
+def write_index_run(indexdir, entries):
+    ''' Sort index entries and write them to a temporary run file.
+    parameters:
+        indexdir - full path to the directory in which to write the run file
+        entries - list of (hash, offset) tuples
+    returns:
+        runfile - full path to the run file
+    '''
+    entries.sort()
+    fd, runfile = tempfile.mkstemp(suffix='.run', dir=indexdir)
+    with os.fdopen(fd, 'wb') as f:
+        for entry in entries:
+            f.write(georefindexentry.pack(*entry))
+    return runfile
+
+def read_index_run(runfile):
+    ''' Yield the (hash, offset) entries in a run file.
+    parameters:
+        runfile - full path to the run file
+    returns:
+        entry - (hash, offset) tuple
+    '''
+    with open(runfile, 'rb') as f:
+        while True:
+            data = f.read(georefindexentry.size*4096)
+            if len(data) == 0:
+                break
+            for entry in georefindexentry.iter_unpack(data):
+                yield entry
+
+def _getoptions():
+    ''' Parse command line options and return them.'''
+    parser = argparse.ArgumentParser()
+
+    help = 'full path to the SQLite database file or the directory of index files'
+    parser.add_argument("-d", "--dbfile", help=help)
+
+    help = 'format of the store, sqlite or mmap (optional; default sqlite)'
+    parser.add_argument("-f", "--format", default='sqlite', help=help)
+
+    help = f'match type of the table being loaded ({", ".join(matchtypelist)})'
+    parser.add_argument("-t", "--matchtype", help=help)
+
+    help = 'full paths to the CSV export files of the table'
+    parser.add_argument("-i", "--inputfiles", nargs='+', help=help)
+
+    help = 'log level (e.g., DEBUG, WARNING, INFO) (optional)'
+    parser.add_argument("-l", "--loglevel", help=help)
+
+    return parser.parse_args()
+
+def main():
+    options = _getoptions()
+
+    if options.dbfile is None or options.matchtype is None or \
+        options.inputfiles is None:
+        s =  'syntax:\n'
+        s += 'python georef_store.py'
+        s += ' -d ./gazetteer.db'
+        s += ' -t sans_coords'
+        s += ' -i ./matchme_sans_coords_best_georef_000000000000.csv.gz'
+        s += ' -f sqlite'
+        s += ' -l DEBUG'
+        print('%s' % s)
+        return
+
+    setup_actor_logging(vars(options))
+    starttime = time.perf_counter()
+    if options.format == 'mmap':
+        rowcount = build_georef_index(options.dbfile, options.matchtype, 
+            options.inputfiles)
+    else:
+        rowcount = load_georef_store(options.dbfile, options.matchtype, 
+            options.inputfiles)
+    elapsedtime = time.perf_counter()-starttime
+    print(f'Loaded {rowcount} rows into {options.dbfile} in {elapsedtime:1.3f}s')
+
+if __name__ == '__main__':
+    main()
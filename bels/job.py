@@ -17,11 +17,12 @@ __author__ = "Marie-Elise Lecoq"
 __contributors__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = 'job.py'
-__version__ = __filename__ + ' ' + "2022-06-21T21:54-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T23:55-03:00"
 
 import base64
 import json
 import csv
+import gzip
 import io
 import os
 import tempfile
@@ -42,18 +43,27 @@ lib_path = os.path.abspath('./bels')
 sys.path.append(lib_path)
 
 from id_utils import dwc_location_hash, location_match_str, super_simplify
-from dwca_utils import safe_read_csv_row, lower_dict_keys
+from dwca_utils import safe_read_csv_row
 from bels_query import get_location_by_hashid, row_as_dict
-from bels_query import get_best_sans_coords_georef_reduced
+from bels_query import get_best_sans_coords_georefs_reduced
 from bels_query import import_table
 from bels_query import export_table
+from bels_query import export_table_avro
 from bels_query import delete_table
 from bels_query import process_import_table
 from bels_query import bigquerify_header
 from bels_query import country_fields
-from dwca_vocab_utils import darwinize_dict
+from bels_query import BigQueryGeorefStore
+from georef_store import open_georef_store
+from avro_utils import avro_to_csv
+from avro_utils import csv_to_avro
+from local_matcher import choose_bulk_engine
+from local_matcher import countrycode_lookup_dict
+from local_matcher import local_match_file
+from dwca_vocab_utils import DarwinizePlan
 from dwca_vocab_utils import darwinize_list
 from dwca_terms import locationmatchsanscoordstermlist
+from match_sql import matchcolumnfieldlist
 
 PROJECT_ID = 'localityservice'
 OUTPUT_LOCATION = 'bels_output'
@@ -61,10 +71,32 @@ OUTPUT_LOCATION = 'bels_output'
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 sg_api = sendgrid.SendGridAPIClient(SENDGRID_API_KEY)
 
+# Files with an estimated number of rows up to BELS_LOCAL_MATCH_MAX_ROWS are georeferenced
+# in this process instead of in BigQuery, which takes about 30s for even a one-row file.
+# Unset or 0 sends every file to BigQuery, so local matching is only on if it is asked
+# for (e.g., 10000). Local matching looks up best georeferences in the local georef 
+# store given by BELS_GEOREF_STORE if there is one, otherwise in BigQuery.
+local_match_max_rows = os.getenv('BELS_LOCAL_MATCH_MAX_ROWS')
+if local_match_max_rows is not None and len(local_match_max_rows) > 0:
+    local_match_max_rows = int(local_match_max_rows)
+else:
+    local_match_max_rows = None
+local_georef_store = None
+georef_store_file = os.getenv('BELS_GEOREF_STORE')
+if georef_store_file is not None and len(georef_store_file) > 0:
+    local_georef_store = open_georef_store(georef_store_file)
+countrycodes = None
+
+# If BELS_AVRO_INTERMEDIATE is 'true', files georeferenced in BigQuery are converted to
+# Avro before they are loaded, and the results are exported as Avro shards that are
+# streamed into a single CSV file. BigQuery loads and exports Avro in parallel, but CSV 
+# with quoted newlines in a single worker.
+avro_intermediate = os.getenv('BELS_AVRO_INTERMEDIATE', '').lower() == 'true'
+
 def process_csv_in_bulk(event, context, bq_client, storage_client):
     """ Background Cloud Function to be triggered by Pub/Sub to georeference all the rows
-        in a CSV file by uploading the file to Cloud Storage and then loading that into
-        a BigQuery table for processing.
+        in a CSV file uploaded to Cloud Storage, either in this process if the file is 
+        small or by loading it into a BigQuery table for processing.
     Args:
         event (dict):  The dictionary with data specific to this type of
         event. The `data` field contains the PubsubMessage message. The
@@ -98,6 +130,10 @@ def process_csv_in_bulk(event, context, bq_client, storage_client):
     email = json_config['email']
     header = json_config['header']
 
+    # If match_columns is True, api.py added the fields in matchcolumnfieldlist to the end 
+    # of each row of the file when it was uploaded.
+    match_columns = json_config.get('match_columns') == True
+
     # Alter output file name to [filename]-[UUID of input file location].csv
     upload_file_parts = upload_file_url.split('/')
     file_suffix = upload_file_parts[len(upload_file_parts)-1].split('.')[0]
@@ -126,25 +162,89 @@ def process_csv_in_bulk(event, context, bq_client, storage_client):
         send_failure_email(email, s, sg_api)
         return
     
-    input_table_id = import_table(bq_client, upload_file_url, bigqueryized_header)
+    # Small files are georeferenced here, the rest in BigQuery. The estimated row count
+    # is given by api.py when the file is uploaded.
+    rowcount = json_config.get('row_count')
+    engine = choose_bulk_engine(rowcount, local_match_max_rows)
+    logging.info(f'Engine for {upload_file_url} ({rowcount} rows estimated): {engine}')
+    output_url_list = None
+    if engine == 'local':
+        # The added match fields are beyond the end of the header, so they are ignored
+        # and made again.
+        output_url_list = process_csv_locally(bq_client, storage_client, upload_file_url,
+            bigqueryized_header, countryfieldlist, output_filename)
+        if output_url_list is None:
+            engine = 'bigquery'
+            logging.info(f'Engine for {upload_file_url} after local failure: {engine}')
+    if engine == 'bigquery':
+        output_url_list = process_csv_in_bigquery(bq_client, storage_client, 
+            upload_file_url, bigqueryized_header, countryfieldlist, output_filename,
+            match_columns)
+
+    # Notify the receiving party by email given.
+    try:
+        send_email(email, output_url_list, sg_api)
+    except Exception as e:
+        logging.error(f'Error sending email: {e}. Files stored at {output_url_list}')
+
+    elapsedtime = time.perf_counter()-starttime
+    s = f'Success! Total elapsed time = {elapsedtime:1.3f}s with engine {engine}\n'
+    s += f'Output to {output_url_list} for job:\n'
+    s += f'{json_config_in}'
+    logging.info(s)
+
+def process_csv_in_bigquery(bq_client, storage_client, upload_file_url, header, 
+    countryfieldlist, output_filename, match_columns=False):
+    """ Georeference all the rows in a CSV file in Google Cloud Storage by loading it into
+        a BigQuery table, processing that with the SQL script and exporting the result
+        to Google Cloud Storage.
+    Args:
+        upload_file_url (str): the Google Cloud Storage location of the input file
+        header (list): the Darwinized, BigQuery-compatible field names of the file
+        countryfieldlist (list): the country fields in the header in order of priority
+        output_filename (str): the name of the output file
+        match_columns (bool): whether the file has the fields in matchcolumnfieldlist
+            after those in header, in which case the script only does the joins
+    Returns:
+        list: the public URLs of the output files
+    """
+    if match_columns == True:
+        header = header + matchcolumnfieldlist
+    input_file_url = upload_file_url
+    source_format = None
+    if avro_intermediate == True:
+        avro_file_url = upload_csv_as_avro(storage_client, upload_file_url, header)
+        if avro_file_url is not None:
+            input_file_url = avro_file_url
+            source_format = 'AVRO'
+    input_table_id = import_table(bq_client, input_file_url, header, 
+        source_format=source_format)
+    if source_format == 'AVRO':
+        delete_blobs(storage_client, [input_file_url])
 
     # Do georeferencing on the imported table with SQL script
     # Pass the countryfieldlist so the bels_match_field can be set with distinct
     # SQL queries based on priority.
-    output_table_id = process_import_table(bq_client, input_table_id, countryfieldlist)
+    output_table_id = process_import_table(bq_client, input_table_id, countryfieldlist,
+        match_columns)
 
     # Export results to Google Cloud Storage
-    # Make this work for big files that get split
-    destination_uri = f'gs://{PROJECT_ID}/{OUTPUT_LOCATION}/{output_filename}'
-    outputfilelist = export_table(bq_client, output_table_id, destination_uri)
-
-    bucket = storage_client.get_bucket(PROJECT_ID)
-
-    output_url_list = []
-    for file in outputfilelist:
-        blob = bucket.blob(f'{file}')
-        output_url_list.append(blob.public_url)
-    output_url_list.sort()
+    output_url_list = None
+    if avro_intermediate == True:
+        output_url_list = export_table_as_csv(bq_client, storage_client, 
+            output_table_id, output_filename)
+    if output_url_list is None:
+        # Make this work for big files that get split
+        destination_uri = f'gs://{PROJECT_ID}/{OUTPUT_LOCATION}/{output_filename}'
+        outputfilelist = export_table(bq_client, output_table_id, destination_uri)
+
+        bucket = storage_client.get_bucket(PROJECT_ID)
+
+        output_url_list = []
+        for file in outputfilelist:
+            blob = bucket.blob(f'{file}')
+            output_url_list.append(blob.public_url)
+        output_url_list.sort()
 
     # Remove the input and output tables from BigQuery
     try:
@@ -167,17 +267,128 @@ def process_csv_in_bulk(event, context, bq_client, storage_client):
     except Exception as e:
         logging.error(f'Table {output_table_id} does not exist.')
 
-    # Notify the receiving party by email given.
+    return output_url_list
+
+def upload_csv_as_avro(storage_client, upload_file_url, header):
+    """ Convert a CSV file in Google Cloud Storage to Avro with csv_to_avro(), streaming
+        it from and to Google Cloud Storage, so that BigQuery can load it in parallel.
+    Args:
+        upload_file_url (str): the Google Cloud Storage location of the CSV file
+        header (list): the BigQuery-compatible field names of the file
+    Returns:
+        str: the Google Cloud Storage location of the Avro file, or None if the file 
+        could not be converted
+    """
+    avro_file_url = f'{upload_file_url}.avro'
     try:
-        send_email(email, output_url_list, sg_api)
+        input_blob = storage.Blob.from_string(upload_file_url, client=storage_client)
+        avro_blob = storage.Blob.from_string(avro_file_url, client=storage_client)
+        with input_blob.open('rb') as raw, \
+            avro_blob.open('wb', ignore_flush=True, content_type='avro/binary') as output:
+            # Uploads may have been gzipped on the way to Google Cloud Storage.
+            if upload_file_url.endswith('.gz'):
+                raw = gzip.GzipFile(fileobj=raw, mode='rb')
+            f = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            rowcount = csv_to_avro(f, output, header)
     except Exception as e:
-        logging.error(f'Error sending email: {e}. Files stored at {output_url_list}')
+        logging.error(f'Error converting {upload_file_url} to Avro: {e}')
+        delete_blobs(storage_client, [avro_file_url])
+        return None
+    logging.info(f'Converted {rowcount} rows of {upload_file_url} to {avro_file_url}.')
+    return avro_file_url
+
+def export_table_as_csv(bq_client, storage_client, table_id, output_filename):
+    """ Export a BigQuery table as Avro shards with export_table_avro() and stream them
+        into a single gzipped CSV file in Google Cloud Storage with avro_to_csv(). The 
+        shards are removed afterwards.
+    Args:
+        table_id (str): the BigQuery table to export
+        output_filename (str): the name of the output file
+    Returns:
+        list: the public URL of the output file, or None if the table could not be 
+        exported this way
+    """
+    shard_uri = f'gs://{PROJECT_ID}/{OUTPUT_LOCATION}/tmp/' + \
+        f'{output_filename.split(".")[0]}-*.avro'
+    shards = []
+    try:
+        shards = export_table_avro(bq_client, table_id, shard_uri)
+        if shards is None or len(shards) == 0:
+            logging.error(f'No Avro shards exported from {table_id}.')
+            return None
+        bucket = storage_client.get_bucket(PROJECT_ID)
+        blob = bucket.blob(f'{OUTPUT_LOCATION}/{output_filename}')
+        with blob.open('wb', ignore_flush=True, content_type='application/gzip') as f, \
+            gzip.open(f, 'wt', newline='', encoding='utf-8') as output:
+            rowcount = avro_to_csv(open_blobs(bucket, shards), output)
+    except Exception as e:
+        logging.error(f'Error exporting {table_id} through Avro: {e}')
+        return None
+    finally:
+        if shards is not None:
+            delete_blobs(storage_client, 
+                [f'gs://{PROJECT_ID}/{shard}' for shard in shards])
+    logging.info(f'Exported {rowcount} rows of {table_id} to {blob.public_url}.')
+    return [blob.public_url]
+
+def open_blobs(bucket, blobnames):
+    # Open the blobs in a bucket for reading one after the other.
+    for blobname in blobnames:
+        with bucket.blob(blobname).open('rb') as f:
+            yield f
+
+def delete_blobs(storage_client, blob_urls):
+    # Remove intermediate files from Google Cloud Storage, if they exist.
+    for blob_url in blob_urls:
+        try:
+            storage.Blob.from_string(blob_url, client=storage_client).delete()
+        except Exception as e:
+            logging.debug(f'Unable to delete {blob_url}: {e}')
 
-    elapsedtime = time.perf_counter()-starttime
-    s = f'Success! Total elapsed time = {elapsedtime:1.3f}s\n'
-    s += f'Output to {output_url_list} for job:\n'
-    s += f'{json_config_in}'
-    logging.info(s)
+def process_csv_locally(bq_client, storage_client, upload_file_url, header, 
+    countryfieldlist, output_filename):
+    """ Georeference all the rows in a CSV file in Google Cloud Storage in this process 
+        with local_match_file() and upload the result to Google Cloud Storage, with the
+        same fields as the output of process_csv_in_bigquery().
+    Args:
+        upload_file_url (str): the Google Cloud Storage location of the input file
+        header (list): the Darwinized, BigQuery-compatible field names of the file
+        countryfieldlist (list): the country fields in the header in order of priority
+        output_filename (str): the name of the output file
+    Returns:
+        list: the public URL of the output file, or None if the file could not be 
+        georeferenced locally
+    """
+    global countrycodes
+    if countrycodes is None:
+        countrycodes = countrycode_lookup_dict()
+    georef_store = local_georef_store
+    if georef_store is None:
+        georef_store = BigQueryGeorefStore(bq_client)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        # Uploads may have been gzipped on the way to Google Cloud Storage.
+        inputfile = os.path.join(tempdir, 'input.csv')
+        if upload_file_url.endswith('.gz'):
+            inputfile += '.gz'
+        outputfile = os.path.join(tempdir, output_filename)
+        try:
+            input_blob = storage.Blob.from_string(upload_file_url, client=storage_client)
+            input_blob.download_to_filename(inputfile)
+            rowcount = local_match_file(inputfile, outputfile, header, countryfieldlist,
+                georef_store, countrycodes)
+        except Exception as e:
+            logging.error(f'Error georeferencing {upload_file_url} locally: {e}')
+            return None
+        if rowcount is None:
+            logging.error(f'Unable to georeference {upload_file_url} locally.')
+            return None
+        logging.info(f'Georeferenced {rowcount} rows of {upload_file_url} locally.')
+
+        bucket = storage_client.get_bucket(PROJECT_ID)
+        blob = bucket.blob(f'{OUTPUT_LOCATION}/{output_filename}')
+        blob.upload_from_filename(outputfile, content_type='application/gzip')
+    return [blob.public_url]
 
 def find_best_georef(client, filename):
     # vocabpath is the location of vocabulary files to test with
@@ -187,22 +398,32 @@ def find_best_georef(client, filename):
     darwincloudfile = os.path.join(vocabpath, 'darwin_cloud.txt')
     
     listToCsv = []
+    matchstrs = []
+    plan = None
     # logging.info('find_best_georef() filename: %s' % filename)
     for row in safe_read_csv_row(filename):
         # logging.info(f'row: {row}')
-        rowdict = row_as_dict(row)
-
-        loc = darwinize_dict(row_as_dict(row), darwincloudfile)
-        lowerloc = lower_dict_keys(loc)
+        # Every row has the same fields, so Darwinize the header only once.
+        if plan is None:
+            plan = DarwinizePlan(list(row), darwincloudfile, case='l')
+        lowerloc = plan.darwinize_dict(row)
 
         sanscoordslocmatchstr = location_match_str(locationmatchsanscoordstermlist, \
             lowerloc)
-        matchstr = super_simplify(sanscoordslocmatchstr)
-        result = get_best_sans_coords_georef_reduced(client, matchstr)
+        listToCsv.append(row)
+        matchstrs.append(super_simplify(sanscoordslocmatchstr))
+
+    # Look up the georeferences for all of the rows in batches rather than one query
+    # per row.
+    results = get_best_sans_coords_georefs_reduced(client, matchstrs)
+    for result in results.values():
+        for field in ['dwc_location_hash', 'locationid']:
+            if field in result:
+                result[field] = base64.b64encode(result[field]).decode('utf-8')
+
+    for row, matchstr in zip(listToCsv, matchstrs):
+        result = results.get(matchstr)
         if result:
-            for field in ['dwc_location_hash', 'locationid']:
-                if field in result:
-                    result[field] = base64.b64encode(result[field]).decode('utf-8')
             row.update(result)
         else:
             # Create a dict of empty results for all results fields anyway to make sure
@@ -212,7 +433,6 @@ def find_best_georef(client, filename):
 #             s.append(f' no georef found for: {matchstr}'
 #             print(''.join(s))
             pass
-        listToCsv.append(row)
     return listToCsv
 
 def create_output(occurrences):
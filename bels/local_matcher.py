@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "local_matcher.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:55-03:00"
+
+# This file contains functions to georeference all of the rows in a CSV file in this
+# process, the same way that the script in bels_query.process_import_table() does in
+# BigQuery, without loading the file into BigQuery. The rows are streamed from the input
+# file in chunks. For each row the country to match is the first of the country fields
+# that has a value, the countrycode is interpreted from it with the countrycode lookup,
+# the three match strings are constructed with the interpreted countrycode, and the best
+# georeference is looked up in a GeorefStore tier by tier, with coords, then with
+# verbatim coords, then sans coords. The output has the same columns as the table that
+# process_import_table() makes and export_table() exports: the input fields,
+# bels_match_country, bels_interpreted_countrycode, the three match strings and the
+# georeference fields.
+#
+# Loading a file into BigQuery, running the script and exporting the result takes about
+# 30s however few rows the file has, so files of up to a maximum number of rows can be
+# matched with local_match_file() instead (see choose_bulk_engine()). Local matching is
+# off unless a maximum is given, e.g., with BELS_LOCAL_MATCH_MAX_ROWS in job.py.
+#
+# Files matched in BigQuery can have the match strings added as columns before they are
+# loaded, with add_match_columns(), so that the script only joins them to the gazetteer.
+
+import csv
+import gzip
+import logging
+import os
+
+from georef_store import resolve_best_georefs
+from id_utils import location_match_strs
+from id_utils import super_simplify
+from match_sql import matchcolumnfieldlist
+
+# Number of rows matched together
+LOCAL_MATCH_CHUNK_SIZE = 10000
+
+# Default maximum estimated number of rows in a file matched locally instead of in
+# BigQuery, 0 to match every file in BigQuery unless a maximum is given
+LOCAL_MATCH_MAX_ROWS = 0
+
+# Fields added to the input fields in the output, in order, as in process_import_table()
+localmatchfieldlist = ['bels_match_country', 'bels_interpreted_countrycode',
+    'bels_matchwithcoords', 'bels_matchverbatimcoords', 'bels_matchsanscoords',
+    'bels_decimallatitude', 'bels_decimallongitude', 'bels_geodeticdatum',
+    'bels_coordinateuncertaintyinmeters', 'bels_georeferencedby',
+    'bels_georeferenceddate', 'bels_georeferenceprotocol', 'bels_georeferencesources',
+    'bels_georeferenceremarks', 'bels_georeference_score', 'bels_georeference_source',
+    'bels_best_of_n_georeferences', 'bels_match_type']
+
+# The georeference fields of a GeorefStore result copied to the output
+localmatchgeoreffieldlist = ['bels_decimallatitude', 'bels_decimallongitude',
+    'bels_coordinateuncertaintyinmeters', 'bels_georeferencedby',
+    'bels_georeferenceddate', 'bels_georeferenceprotocol', 'bels_georeferencesources',
+    'bels_georeferenceremarks', 'bels_georeference_score', 'bels_georeference_source',
+    'bels_best_of_n_georeferences']
+
+# The bels_match_type process_import_table() gives to the results of each tier, by the
+# bels_match_type of the results from a GeorefStore
+localmatchtypes = {
+    'match with coords': 'match using coords',
+    'match using verbatim coords': 'match using verbatim coords',
+    'match sans coords': 'match sans coords'}
+
+def countrycode_lookup_dict(lookupfile=None):
+    ''' Get the countrycode lookup from a CSV export of the vocabs.countrycode_lookup
+        table, the same dict that BELS_Client.populate() gets from BigQuery.
+    parameters:
+        lookupfile - full path to the CSV file with the fields u_country and countrycode
+            (optional; default data/countrycode_lookup.csv)
+    returns:
+        countrycodes - dict of countrycode by upper case country, or None if the file
+            can not be read
+    '''
+    functionname = 'countrycode_lookup_dict()'
+
+    if lookupfile is None:
+        dirname = os.path.dirname(os.path.abspath(__file__))
+        lookupfile = os.path.join(dirname, '..', 'data', 'countrycode_lookup.csv')
+
+    if os.path.isfile(lookupfile) == False:
+        s = 'File %s not found in %s.' % (lookupfile, functionname)
+        logging.debug(s)
+        return None
+
+    countrycodes = {}
+    with open(lookupfile, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            countrycode = row['countrycode']
+            if len(countrycode) == 0:
+                countrycode = None
+            countrycodes[row['u_country']] = countrycode
+    return countrycodes
+
+class RowCountEstimate():
+    ''' Running estimate of the number of data rows in a CSV file from the number of line
+        endings in its content, given in chunks as it is read. The estimate is the same
+        as that of estimate_row_count() for the whole content.
+    '''
+    def __init__(self):
+        self.start = b''
+        self.last = b''
+        self.newlines = 0
+        self.returns = 0
+
+    def update(self, chunk):
+        ''' Count the line endings in the next chunk of the content.
+        parameters:
+            chunk - the next bytes of the content (required)
+        '''
+        if len(chunk) == 0:
+            return
+        if len(self.start) < 2:
+            self.start += chunk[:2-len(self.start)]
+        self.last = chunk[-1:]
+        self.newlines += chunk.count(b'\n')
+        self.returns += chunk.count(b'\r')
+
+    def rowcount(self):
+        ''' Get the estimate for the content so far.
+        returns:
+            rowcount - the estimated number of rows after the header, or None if the
+                content is compressed
+        '''
+        # gzip content can not be counted without decompressing it
+        if self.start == b'\x1f\x8b':
+            return None
+        lineendings = self.newlines
+        if lineendings == 0:
+            lineendings = self.returns
+        linecount = lineendings
+        if len(self.last) > 0 and self.last not in (b'\n', b'\r'):
+            linecount += 1
+        return max(linecount - 1, 0)
+
+def estimate_row_count(content):
+    ''' Estimate the number of data rows in the content of an uploaded CSV file from the
+        number of line endings. Quoted fields with line endings in them make the
+        estimate high.
+    parameters:
+        content - the content of the file as bytes, with a header row (required)
+    returns:
+        rowcount - the estimated number of rows after the header, or None if the content
+            is compressed
+    '''
+    if content is None:
+        return None
+    estimate = RowCountEstimate()
+    estimate.update(content)
+    return estimate.rowcount()
+
+def choose_bulk_engine(rowcount, maxrows=None):
+    ''' Choose how to georeference all of the rows in a file, locally for small files or
+        in BigQuery for large ones.
+    parameters:
+        rowcount - the estimated number of rows in the file, None if not known (required)
+        maxrows - the maximum number of rows to match locally, 0 to match every file in
+            BigQuery (optional; default LOCAL_MATCH_MAX_ROWS, 0)
+    returns:
+        engine - 'local' or 'bigquery'
+    '''
+    if maxrows is None:
+        maxrows = LOCAL_MATCH_MAX_ROWS
+    # Files of unknown size go to BigQuery, which can match files of any size.
+    if maxrows <= 0 or rowcount is None or rowcount > maxrows:
+        return 'bigquery'
+    return 'local'
+
+def match_country(row, countryindexes):
+    ''' Get the value of the first of the country fields in a row that has a value.
+    parameters:
+        row - list of the values in the row (required)
+        countryindexes - list of the indexes of the country fields in the row, in order
+            of priority (required)
+    returns:
+        country - the country value, or None if none of the country fields has a value
+    '''
+    for i in countryindexes:
+        value = row[i]
+        # Empty fields are NULL when a CSV file is loaded into BigQuery.
+        if value is not None and len(value) > 0:
+            return value
+    return None
+
+def match_string_rows(header, rows, countryfieldlist, countrycodes):
+    ''' Get the match country, the interpreted countrycode and the three match strings
+        for a chunk of rows, as the script in process_import_table() makes them.
+    parameters:
+        header - list of the Darwinized, BigQuery-compatible field names of the rows
+            (required)
+        rows - list of rows, each a list of values in the order of header (required)
+        countryfieldlist - list of the country fields in the header in order of
+            priority, from bels_query.country_fields() (required)
+        countrycodes - dict of countrycode by upper case country (required)
+    returns:
+        matchrows - list of the values of the matchcolumnfieldlist fields for each row
+    '''
+    countryindexes = [header.index(field) for field in countryfieldlist]
+    matchcountries = [match_country(row, countryindexes) for row in rows]
+    interpreted = []
+    for country in matchcountries:
+        if country is None:
+            interpreted.append(None)
+        else:
+            interpreted.append(countrycodes.get(country.upper()))
+
+    # The match strings use the interpreted countrycode in place of any countrycode in
+    # the input. The last of two columns with the same name is used.
+    columns = [list(column) for column in zip(*rows)]
+    if len(columns) == 0:
+        columns = [[] for field in header]
+    withcoords, verbatimcoords, sanscoords = location_match_strs(
+        header + ['countrycode'], columns + [interpreted])
+    withcoords = [super_simplify(s) for s in withcoords]
+    verbatimcoords = [super_simplify(s) for s in verbatimcoords]
+    sanscoords = [super_simplify(s) for s in sanscoords]
+    return [list(values) for values in
+        zip(matchcountries, interpreted, withcoords, verbatimcoords, sanscoords)]
+
+def local_match_rows(header, rows, countryfieldlist, georef_store, countrycodes):
+    ''' Georeference a chunk of rows as the script in process_import_table() does.
+    parameters:
+        header - list of the Darwinized, BigQuery-compatible field names of the rows
+            (required)
+        rows - list of rows, each a list of values in the order of header (required)
+        countryfieldlist - list of the country fields in the header in order of
+            priority, from bels_query.country_fields() (required)
+        georef_store - the GeorefStore in which to look up georeferences (required)
+        countrycodes - dict of countrycode by upper case country (required)
+    returns:
+        matchrows - list of the values of the localmatchfieldlist fields for each row
+    '''
+    matchrows = match_string_rows(header, rows, countryfieldlist, countrycodes)
+
+    # Every tier is tried for every row, in priority order
+    tierslist = [[('with_coords', w), ('verbatim_coords', v), ('sans_coords', s)]
+        for country, countrycode, w, v, s in matchrows]
+    georefs = resolve_best_georefs(georef_store, tierslist)
+
+    for matchrow, georef in zip(matchrows, georefs):
+        if georef is None:
+            matchrow.extend([None]*(len(localmatchfieldlist)-len(matchrow)))
+        else:
+            values = [georef.get(field) for field in localmatchgeoreffieldlist]
+            geodeticdatum = None
+            if values[0] is not None:
+                geodeticdatum = 'epsg:4326'
+            matchtype = localmatchtypes.get(georef['bels_match_type'],
+                georef['bels_match_type'])
+            matchrow.extend(values[:2] + [geodeticdatum] + values[2:] + [matchtype])
+    return matchrows
+
+def local_match_file(inputfile, outputfile, header, countryfieldlist, georef_store,
+    countrycodes, chunksize=None, dialect=None):
+    ''' Georeference all of the rows in a CSV file in this process and write the results
+        with the same columns as the table made by process_import_table().
+    parameters:
+        inputfile - full path to the utf-8 input file, with a header row, gzipped if it
+            ends in '.gz' (required)
+        outputfile - full path to the output file, gzipped if it ends in '.gz'
+            (required)
+        header - list of the Darwinized, BigQuery-compatible field names to use in place
+            of the header in the input file, as given to import_table() (required)
+        countryfieldlist - list of the country fields in the header in order of
+            priority, from bels_query.country_fields() (required)
+        georef_store - the GeorefStore in which to look up georeferences (required)
+        countrycodes - dict of countrycode by upper case country (required)
+        chunksize - number of rows matched together (optional; default
+            LOCAL_MATCH_CHUNK_SIZE)
+        dialect - csv.dialect object with the attributes of the input file, if it is
+            not comma-separated (optional)
+    returns:
+        rowcount - the number of rows written, or None if the inputs were not valid
+    '''
+    functionname = 'local_match_file()'
+
+    if inputfile is None or os.path.isfile(inputfile) == False:
+        s = 'File %s not found in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return None
+
+    if header is None or countryfieldlist is None or len(countryfieldlist) == 0:
+        s = 'No header or country fields given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    if georef_store is None or countrycodes is None:
+        s = 'No georef store or countrycode lookup given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    if inputfile.endswith('.gz'):
+        input = gzip.open(inputfile, 'rt', newline='', encoding='utf-8')
+    else:
+        input = open(inputfile, 'r', newline='', encoding='utf-8')
+    if outputfile.endswith('.gz'):
+        output = gzip.open(outputfile, 'wt', newline='', encoding='utf-8')
+    else:
+        output = open(outputfile, 'w', newline='', encoding='utf-8')
+    rowcount = 0
+    with input as f, output:
+        writer = csv.writer(output)
+        writer.writerow(header + localmatchfieldlist)
+        for chunk in read_row_chunks(f, len(header), chunksize, dialect):
+            matchrows = local_match_rows(header, chunk, countryfieldlist, georef_store,
+                countrycodes)
+            rowcount += write_match_rows(writer, chunk, matchrows)
+    return rowcount
+
+def add_match_columns(input, output, header, countryfieldlist, countrycodes,
+    chunksize=None, dialect=None):
+    ''' Write the rows of a CSV file with the match country, the interpreted countrycode
+        and the three match strings added as columns, as the script in
+        process_import_table() makes them, so that they can be loaded into BigQuery and
+        the script only has to join them to the gazetteer.
+    parameters:
+        input - text stream of the comma-separated input file, with a header row
+            (required)
+        output - text stream to which to write the comma-separated output (required)
+        header - list of the Darwinized, BigQuery-compatible field names to use in place
+            of the header in the input file (required)
+        countryfieldlist - list of the country fields in the header in order of
+            priority, from bels_query.country_fields() (required)
+        countrycodes - dict of countrycode by upper case country (required)
+        chunksize - number of rows matched together (optional; default
+            LOCAL_MATCH_CHUNK_SIZE)
+        dialect - csv.dialect object with the attributes of the input file, if it is
+            not comma-separated (optional)
+    returns:
+        rowcount - the number of rows written, or None if the inputs were not valid
+    '''
+    functionname = 'add_match_columns()'
+
+    if header is None or countryfieldlist is None or len(countryfieldlist) == 0:
+        s = 'No header or country fields given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    if countrycodes is None:
+        s = 'No countrycode lookup given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    rowcount = 0
+    writer = csv.writer(output)
+    writer.writerow(header + matchcolumnfieldlist)
+    for chunk in read_row_chunks(input, len(header), chunksize, dialect):
+        matchrows = match_string_rows(header, chunk, countryfieldlist, countrycodes)
+        rowcount += write_match_rows(writer, chunk, matchrows)
+    return rowcount
+
+def read_row_chunks(input, fieldcount, chunksize=None, dialect=None):
+    ''' Read the rows after the header row of a CSV file in chunks, each row with
+        exactly fieldcount values, padded with empty values or truncated as needed.
+    parameters:
+        input - text stream of the comma-separated file (required)
+        fieldcount - the number of values in each row (required)
+        chunksize - maximum number of rows in a chunk (optional; default
+            LOCAL_MATCH_CHUNK_SIZE)
+        dialect - csv.dialect object with the attributes of the file, if it is not
+            comma-separated (optional)
+    returns:
+        generator of lists of rows
+    '''
+    if chunksize is None or chunksize < 1:
+        chunksize = LOCAL_MATCH_CHUNK_SIZE
+    if dialect is None:
+        dialect = 'excel'
+    reader = csv.reader(input, dialect=dialect)
+    # The header in the file is replaced by the given header
+    next(reader, None)
+    chunk = []
+    for row in reader:
+        if len(row) < fieldcount:
+            row = row + ['']*(fieldcount - len(row))
+        elif len(row) > fieldcount:
+            row = row[:fieldcount]
+        chunk.append(row)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+def write_match_rows(writer, rows, matchrows):
+    ''' Write a chunk of rows with their match results.
+    returns:
+        rowcount - the number of rows written
+    '''
+    for row, matchrow in zip(rows, matchrows):
+        # NULL values are empty in BigQuery CSV exports
+        writer.writerow(row + ['' if v is None else v for v in matchrow])
+    return len(rows)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "match_normalizer.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
+
+# This file contains functions to construct the simplified Location-matching strings
+# (bels_matchwithcoords, bels_matchverbatimcoords, bels_matchsanscoords) for all of the
+# rows in a CSV or TXT file, using a pool of worker processes. The records after the
+# header are split into ranges that start at the records in the index of the 
+# FileProfile of the file, which is made in one scan that honors quoted line ends (see
+# dwca_utils.record_chunks()). The profile indexes records often enough for ranges of
+# the requested size, and the ranges are small enough to give each worker one. Each 
+# worker reads and parses its own range with dwca_utils.read_csv_row(), so only the 
+# match strings travel between processes. 
+# Results are yielded in the order of the rows in the input file.
+#
+# Example:
+#
+# python match_normalizer.py -i ../data/tests/test_benchmark_1000.csv -o ./matchstrs.csv
+#   -w 4 -c 16777216
+
+import argparse
+import csv
+import logging
+import os
+import time
+from multiprocessing import Pool
+
+from dwca_utils import current_profile
+from dwca_utils import RECORD_INDEX_INTERVAL
+from dwca_utils import file_profile
+from dwca_utils import read_csv_row
+from dwca_utils import read_header
+from dwca_utils import record_chunks
+from dwca_utils import setup_actor_logging
+from dwca_vocab_utils import darwinize_list
+from id_utils import location_match_strs
+from id_utils import super_simplify
+
+# Default size in bytes of the ranges of the input file processed by the workers
+MATCH_CHUNK_SIZE = 16*1024*1024
+
+# Number of indexed records in a range of the requested size, so that ranges come
+# within about this fraction of the requested size
+CHUNK_INDEX_COUNT = 8
+
+# Number of bytes at the start of a file from which to estimate the size of its records
+RECORD_SAMPLE_SIZE = 64*1024
+
+# Names of the match string fields in the output, as in process_import_table()
+matchstrfieldlist = ['bels_matchwithcoords', 'bels_matchverbatimcoords',
+    'bels_matchsanscoords']
+
+def chunk_interval(inputfile, chunksize=None):
+    ''' Get the number of records between indexed records in the FileProfile of a file
+        for ranges of the file of about chunksize bytes, from the size of the records in
+        a sample at the start of the file.
+    parameters:
+        inputfile - full path to the input file (required)
+        chunksize - approximate size in bytes of each range (optional; default
+            MATCH_CHUNK_SIZE)
+    returns:
+        interval - the number of records between indexed records, from 1 to 
+            RECORD_INDEX_INTERVAL, or None on error
+    '''
+    functionname = 'chunk_interval()'
+
+    if inputfile is None or os.path.isfile(inputfile) == False:
+        s = 'File %s not found in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return None
+
+    if chunksize is None or chunksize < 1:
+        chunksize = MATCH_CHUNK_SIZE
+
+    # Line ends in quoted values make the estimate smaller, and the index finer, than
+    # it needs to be.
+    with open(inputfile, 'rb') as f:
+        sample = f.read(RECORD_SAMPLE_SIZE)
+    recordsize = max(len(sample) // max(sample.count(b'\n'), 1), 1)
+    interval = chunksize // (CHUNK_INDEX_COUNT*recordsize)
+    return min(max(interval, 1), RECORD_INDEX_INTERVAL)
+
+def chunk_ranges(inputfile, chunksize=None, profile=None):
+    ''' Split the records after the header of a file into ranges of approximately 
+        chunksize bytes, each starting at a record in the index of the FileProfile of 
+        the file, so that no record is split between ranges.
+    parameters:
+        inputfile - full path to the input file (required)
+        chunksize - approximate size in bytes of each range (optional; default
+            MATCH_CHUNK_SIZE)
+        profile - FileProfile of the input file (optional; default a file_profile() 
+            with the interval from chunk_interval())
+    returns:
+        ranges - list of (start, stop) record numbers of the ranges, in file order, 
+            fewer than the size of the file calls for if there are not enough indexed 
+            records, or None on error
+    '''
+    functionname = 'chunk_ranges()'
+
+    if inputfile is None or len(inputfile)==0:
+        s = 'No file given in %s.' % functionname
+        logging.debug(s)
+        return None
+
+    if os.path.isfile(inputfile) == False:
+        s = 'File %s not found in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return None
+
+    if chunksize is None or chunksize < 1:
+        chunksize = MATCH_CHUNK_SIZE
+
+    profile = current_profile(profile, inputfile)
+    if profile is None:
+        profile = file_profile(inputfile,
+            interval=chunk_interval(inputfile, chunksize))
+
+    # The size of the records after the header, or of the file if they can not be found
+    # in its bytes
+    size = profile.key[1]
+    offsets = profile.get_record_offsets()
+    if offsets is not None and len(offsets) > 0:
+        size -= offsets[0]
+    return record_chunks(profile, max(-(-size // chunksize), 1))
+
+def normalize_chunk(task):
+    ''' Construct the simplified Location-matching strings for a range of the records 
+        of a file. This is the function run by each worker process.
+    parameters:
+        task - tuple of (inputfile, start, stop, termlist, profile), where start and 
+            stop are the record numbers of the range from chunk_ranges(), termlist is 
+            the list of lowercase Darwinized field names in the header and profile is 
+            the FileProfile of the file
+    returns:
+        matchstrs - list of (withcoords, verbatimcoords, sanscoords) tuples, one for
+            each row in the range
+    '''
+    functionname = 'normalize_chunk()'
+
+    inputfile, start, stop, termlist, profile = task
+
+    # Read the values by position, as the Darwinized field names need not be unique. 
+    # Every row is as long as the header, with missing values as None. Empty lines are
+    # not rows.
+    fieldnames = list(range(len(termlist)))
+    rows = []
+    for row in read_csv_row(inputfile, profile.dialect, profile.encoding, 
+        fieldnames=fieldnames, start=start, stop=stop, profile=profile):
+        if not row:
+            continue
+        rows.append([row[i] for i in fieldnames])
+
+    withcoords, verbatimcoords, sanscoords = \
+        location_match_strs(termlist, rows, columnar=False)
+    matchstrs = []
+    for matchstrtuple in zip(withcoords, verbatimcoords, sanscoords):
+        matchstrs.append(tuple(super_simplify(s) for s in matchstrtuple))
+    return matchstrs
+
+def normalize_file(inputfile, dwccloudfile, workers=None, chunksize=None,
+    dialect=None, encoding=None, profile=None):
+    ''' Yield the simplified Location-matching strings for all of the rows in a file, in
+        row order, constructed by a pool of worker processes.
+    parameters:
+        inputfile - full path to the input file (required)
+        dwccloudfile - the vocabulary file for the Darwin Cloud (required)
+        workers - number of worker processes (optional; default os.cpu_count()). If 1,
+            the rows are processed in this process.
+        chunksize - approximate size in bytes of the range of the file each worker
+            processes at a time, at most an even share of the file among the workers 
+            (optional; default MATCH_CHUNK_SIZE)
+        dialect - csv.dialect object with the attributes of the input file (optional)
+        encoding - a string designating the input file encoding (optional)
+            (e.g., 'utf-8', 'mac_roman', 'latin_1', 'cp1252')
+        profile - FileProfile of the input file, from file_profile(), to use in place of
+            detecting its dialect, encoding and header and of scanning it for its 
+            records, which limits the ranges to its indexed records (optional; default 
+            None)
+    returns:
+        matchstrs - (withcoords, verbatimcoords, sanscoords) tuple for each row
+    '''
+    functionname = 'normalize_file()'
+
+    if inputfile is None or os.path.isfile(inputfile) == False:
+        s = 'File %s not found in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count()
+
+    # Ranges no larger than an even share of the file, so every worker gets one
+    if chunksize is None or chunksize < 1:
+        chunksize = MATCH_CHUNK_SIZE
+    chunksize = max(min(chunksize, -(-os.path.getsize(inputfile) // workers)), 1)
+
+    profile = current_profile(profile, inputfile)
+    if profile is None:
+        profile = file_profile(inputfile, dialect, encoding,
+            interval=chunk_interval(inputfile, chunksize))
+
+    ranges = chunk_ranges(inputfile, chunksize, profile)
+    if ranges is None:
+        return
+
+    header = read_header(inputfile, profile=profile)
+    termlist = darwinize_list(header, dwccloudfile, case='l')
+    if termlist is None:
+        s = 'No header found in %s in %s.' % (inputfile, functionname)
+        logging.debug(s)
+        return
+
+    # The profile goes to the workers with its index, so they do not scan the file.
+    tasks = [(inputfile, start, stop, termlist, profile) for start, stop in ranges]
+
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            for matchstrs in normalize_chunk(task):
+                yield matchstrs
+        return
+
+    with Pool(processes=min(workers, len(tasks))) as pool:
+        # imap() returns the results of the chunks in the order of the tasks as soon as
+        # each is ready, and each chunk is a contiguous range of rows.
+        for chunkmatchstrs in pool.imap(normalize_chunk, tasks):
+            for matchstrs in chunkmatchstrs:
+                yield matchstrs
+
+def match_normalizer(options):
+    ''' Write the simplified Location-matching strings for all of the rows in a file to
+        an output file.
+    options - a dictionary of parameters
+        loglevel - level at which to log (e.g., DEBUG) (optional)
+        inputfile - full path to the input file (required)
+        outputfile - full path to the output file (required)
+        dwccloudfile - the vocabulary file for the Darwin Cloud (optional)
+        workers - number of worker processes (optional)
+        chunksize - approximate size in bytes of the ranges processed by the workers
+            (optional)
+    returns:
+        rowcount - the number of rows written, or None if the inputs were not valid
+    '''
+    setup_actor_logging(options)
+
+    inputfile = options.get('inputfile')
+    outputfile = options.get('outputfile')
+    if inputfile is None or outputfile is None:
+        logging.debug('Input and output files are required. %s' % __version__)
+        return None
+
+    dwccloudfile = options.get('dwccloudfile')
+    if dwccloudfile is None:
+        dirname = os.path.dirname(__file__)
+        dwccloudfile = os.path.join(dirname, 'vocabularies', 'darwin_cloud.txt')
+
+    rowcount = 0
+    with open(outputfile, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(matchstrfieldlist)
+        for matchstrs in normalize_file(inputfile, dwccloudfile,
+            workers=options.get('workers'), chunksize=options.get('chunksize')):
+            writer.writerow(matchstrs)
+            rowcount += 1
+    return rowcount
+
+def _getoptions():
+    ''' Parse command line options and return them.'''
+    parser = argparse.ArgumentParser()
+
+    help = 'full path to the input file'
+    parser.add_argument("-i", "--inputfile", help=help)
+
+    help = 'full path to the output file'
+    parser.add_argument("-o", "--outputfile", help=help)
+
+    help = 'number of worker processes (optional; default number of CPUs)'
+    parser.add_argument("-w", "--workers", type=int, help=help)
+
+    help = 'approximate size in bytes of the ranges processed by the workers (optional)'
+    parser.add_argument("-c", "--chunksize", type=int, help=help)
+
+    help = 'log level (e.g., DEBUG, WARNING, INFO) (optional)'
+    parser.add_argument("-l", "--loglevel", help=help)
+
+    return parser.parse_args()
+
+def main():
+    options = _getoptions()
+
+    if options.inputfile is None or options.outputfile is None:
+        s =  'syntax:\n'
+        s += 'python match_normalizer.py'
+        s += ' -i ../data/tests/test_benchmark_1000.csv'
+        s += ' -o ./matchstrs.csv'
+        s += ' -w 4'
+        s += ' -c 16777216'
+        s += ' -l DEBUG'
+        print('%s' % s)
+        return
+
+    optdict = vars(options)
+    starttime = time.perf_counter()
+    rowcount = match_normalizer(optdict)
+    elapsedtime = time.perf_counter()-starttime
+    if rowcount is not None:
+        print(f'{rowcount} rows in {elapsedtime:1.3f}s '
+              f'({rowcount/elapsedtime:1.0f} rows/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "match_sql.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:20-03:00"
+
+# This file contains functions to construct BigQuery SQL expressions that make the
+# simplified Location-matching strings (bels_matchwithcoords, bels_matchverbatimcoords,
+# bels_matchsanscoords) with built-in SQL functions only, instead of with the JavaScript
+# UDFs matchString, simplifyDiacritics, removeSymbols and saveNumbers. The results are
+# the same as those of id_utils.location_match_str() followed by super_simplify(), with
+# empty (NULL) fields treated as empty strings, as they are when a CSV file is read in
+# Python. The golden corpus in data/tests/test_match_strings_golden.csv holds the
+# expected results for both.
+#
+# The steps of super_simplify() are given as a list of simple operations (see
+# simplify_steps()), from which the SQL is made and which can be run in Python to check
+# them without BigQuery (see run_simplify_steps()). BigQuery regular expressions (RE2)
+# have no lookarounds, so the separators that save_numbers() keeps next to digits are
+# marked with NUMBER_SEPARATOR_MARK before the rest are removed.
+#
+# Decimal coordinates are likewise made by operations that can be run in Python (see
+# coordinate_steps() and run_coordinate_steps()). They are in the format of the 
+# coordinates in the match strings of the gazetteer (see gazetteer/load_*.sql), a 
+# NUMERIC rounded to seven places as a STRING, e.g., 0.1167 and 0, which is also that of
+# the JavaScript UDF matchString, except that the UDF rounds negative halves up and 
+# writes values under 1e-6 with an exponent.
+
+import re
+import unicodedata
+from decimal import Decimal
+from functools import lru_cache
+
+from dwca_terms import locationmatchsanscoordstermlist
+from dwca_terms import locationmatchverbatimcoordstermlist
+from dwca_terms import locationmatchwithcoordstermlist
+from id_utils import coordinatecontext
+from id_utils import numeric_str
+from id_utils import numeric_value
+from id_utils import supersimplifier
+
+# A private use character, not expected in Location data, that marks the separators
+# (. , - / +) next to a digit, which save_numbers() keeps.
+NUMBER_SEPARATOR_MARK = '\ue000'
+
+# Name of the temporary SQL function made by super_simplify_function_sql()
+SUPER_SIMPLIFY_FUNCTION = 'superSimplify'
+
+# The characters that are whitespace in Python regular expressions (\s), all of which
+# are below U+3001
+whitespacechars = ''.join(chr(c) for c in range(0x3001) if chr(c).isspace())
+
+# For each match string field, the terms that go into it
+matchstrtermlists = {
+    'bels_matchwithcoords': locationmatchwithcoordstermlist,
+    'bels_matchverbatimcoords': locationmatchverbatimcoordstermlist,
+    'bels_matchsanscoords': locationmatchsanscoordstermlist}
+
+# The fields with the match strings and the country they were made with, which can be
+# added to a file before it is loaded into BigQuery (see local_matcher.py), so that the
+# georeference script only has to join them to the gazetteer.
+matchcolumnfieldlist = ['bels_match_country', 'bels_interpreted_countrycode'] + \
+    list(matchstrtermlists)
+
+def sql_string_literal(value):
+    ''' Get a BigQuery string literal for a string. Characters other than printable
+        ASCII are escaped, so that the SQL is ASCII.
+    parameters:
+        value - the string
+    returns:
+        literal - the quoted and escaped string literal
+    '''
+    escaped = []
+    for c in value:
+        if c == '\\' or c == "'":
+            escaped.append('\\' + c)
+        elif ' ' <= c <= '~':
+            escaped.append(c)
+        elif ord(c) <= 0xFFFF:
+            escaped.append(f'\\u{ord(c):04x}')
+        else:
+            escaped.append(f'\\U{ord(c):08x}')
+    return "'" + ''.join(escaped) + "'"
+
+def character_class(chars):
+    ''' Get a regular expression character class that matches the given characters,
+        with consecutive characters as ranges. The class is the same in RE2 and Python.
+    parameters:
+        chars - iterable of single characters
+    returns:
+        charclass - the character class, e.g. '[a-c\\-]'
+    '''
+    def classchar(c):
+        if c in '\\]^-[':
+            return '\\' + c
+        return c
+
+    codepoints = sorted(set(ord(c) for c in chars))
+    parts = []
+    i = 0
+    while i < len(codepoints):
+        j = i
+        while j+1 < len(codepoints) and codepoints[j+1] == codepoints[j]+1:
+            j += 1
+        if j == i:
+            parts.append(classchar(chr(codepoints[i])))
+        else:
+            parts.append(classchar(chr(codepoints[i])) + '-' +
+                classchar(chr(codepoints[j])))
+        i = j+1
+    return '[' + ''.join(parts) + ']'
+
+@lru_cache(maxsize=None)
+def simplify_steps():
+    ''' Get the operations that make a Location string into a match string with the same
+        result as super_simplify(). Each operation is a tuple, one of:
+            ('replace', old, new) - replace every old substring with new
+            ('translate', source, target) - replace each character in source with the
+                character at the same position in target
+            ('regexp_replace', pattern, replacement) - replace every match of the
+                pattern, in which \\d is a decimal digit in any script
+            ('normalize_and_casefold',) - casefold, then NFKC normalize
+    returns:
+        steps - tuple of operations, in order
+    '''
+    # Simplify diacritics and remove symbols, as in SuperSimplifier.simplify_uncached()
+    steps = []
+    translatesource = ''
+    translatetarget = ''
+    deleted = []
+    for codepoint, value in sorted(supersimplifier.translationtable.items()):
+        if value is None:
+            deleted.append(chr(codepoint))
+        elif len(value) == 1:
+            translatesource += chr(codepoint)
+            translatetarget += value
+        else:
+            steps.append(('replace', chr(codepoint), value))
+    steps.append(('translate', translatesource, translatetarget))
+    steps.append(('regexp_replace', character_class(deleted), ''))
+    steps.append(('normalize_and_casefold',))
+
+    # save_numbers() and remove_whitespace(). A separator is kept if the character
+    # before it or after it is a digit, so those are marked, after which separators that
+    # are not marked are removed, then the marks and whitespace are removed.
+    separators = '[.,\\-/+]'
+    mark = NUMBER_SEPARATOR_MARK
+    steps.append(('regexp_replace', f'(\\d)({separators})', f'\\1{mark}\\2'))
+    steps.append(('regexp_replace', f'({separators})(\\d)', f'{mark}\\1\\2'))
+    steps.append(('regexp_replace', f'(^|[^{mark}]){separators}+', '\\1'))
+    steps.append(('regexp_replace', character_class(mark + whitespacechars) + '+',
+        ''))
+    return tuple(steps)
+
+def run_simplify_steps(idstr, steps=None):
+    ''' Apply the operations from simplify_steps() to a string in Python, as the SQL from
+        super_simplify_sql() does in BigQuery.
+    parameters:
+        idstr - the Location string
+        steps - the operations (optional; default simplify_steps())
+    returns:
+        matchstr - the match string
+    '''
+    if steps is None:
+        steps = simplify_steps()
+    for step in steps:
+        if step[0] == 'replace':
+            idstr = idstr.replace(step[1], step[2])
+        elif step[0] == 'translate':
+            idstr = idstr.translate(str.maketrans(step[1], step[2]))
+        elif step[0] == 'regexp_replace':
+            idstr = re.sub(step[1], step[2], idstr)
+        elif step[0] == 'normalize_and_casefold':
+            idstr = unicodedata.normalize('NFKC', idstr.casefold())
+    return idstr
+
+def super_simplify_sql(expression):
+    ''' Get a BigQuery SQL expression that makes the match string from the value of a
+        SQL expression with the same result as super_simplify().
+    parameters:
+        expression - SQL expression for the Location string
+    returns:
+        sql - the SQL expression for the match string
+    '''
+    sql = expression
+    for step in simplify_steps():
+        if step[0] == 'replace':
+            sql = f'REPLACE({sql},{sql_string_literal(step[1])},' \
+                f'{sql_string_literal(step[2])})'
+        elif step[0] == 'translate':
+            sql = f'TRANSLATE({sql},\n{sql_string_literal(step[1])},\n' \
+                f'{sql_string_literal(step[2])})'
+        elif step[0] == 'regexp_replace':
+            # Python \d is any decimal digit, RE2 \d is only 0-9
+            pattern = step[1].replace('\\d', '\\p{Nd}')
+            sql = f'REGEXP_REPLACE({sql},\n{sql_string_literal(pattern)},' \
+                f'{sql_string_literal(step[2])})'
+        elif step[0] == 'normalize_and_casefold':
+            sql = f'NORMALIZE_AND_CASEFOLD({sql},NFKC)'
+    return sql
+
+@lru_cache(maxsize=None)
+def super_simplify_function_sql():
+    ''' Get the BigQuery statement that makes a temporary SQL function, named
+        SUPER_SIMPLIFY_FUNCTION, with the same result as super_simplify().
+    returns:
+        sql - the CREATE TEMP FUNCTION statement
+    '''
+    return f'CREATE TEMP FUNCTION {SUPER_SIMPLIFY_FUNCTION}(s STRING) AS (\n' \
+        f'{super_simplify_sql("s")}\n);'
+
+def coordinate_steps():
+    ''' Get the operations that make the part of a Location string for a decimal 
+        coordinate with the same result as coordinate_match_str(), which is the format of
+        the coordinates in the match strings of the gazetteer. Each operation is a tuple,
+        one of:
+            ('trim',) - remove leading and trailing whitespace
+            ('safe_cast_numeric',) - the NUMERIC value, NULL if it is not a number
+            ('round', places) - round to places decimal places, halves away from 0
+            ('cast_string',) - the value as a STRING, without trailing zeros
+            ('ifnull', value) - value in place of NULL
+    returns:
+        steps - tuple of operations, in order
+    '''
+    return (('trim',), ('safe_cast_numeric',), ('round', 7), ('cast_string',),
+        ('ifnull', ''))
+
+def run_coordinate_steps(value, steps=None):
+    ''' Apply the operations from coordinate_steps() to a value in Python, as the SQL from
+        coordinate_match_sql() does in BigQuery.
+    parameters:
+        value - the coordinate value as a string, or None for NULL
+        steps - the operations (optional; default coordinate_steps())
+    returns:
+        coordstr - the part of the Location string
+    '''
+    if steps is None:
+        steps = coordinate_steps()
+    for step in steps:
+        if step[0] == 'ifnull':
+            if value is None:
+                value = step[1]
+        elif value is None:
+            continue
+        elif step[0] == 'trim':
+            value = value.strip()
+        elif step[0] == 'safe_cast_numeric':
+            value = numeric_value(value)
+        elif step[0] == 'round':
+            value = value.quantize(Decimal(1).scaleb(-step[1]),
+                context=coordinatecontext)
+        elif step[0] == 'cast_string':
+            value = numeric_str(value)
+    return value
+
+def coordinate_match_sql(column):
+    ''' Get a BigQuery SQL expression for the part of a Location string for a decimal
+        coordinate, as coordinate_match_str() makes it and as it is in the match strings
+        of the gazetteer. Coordinates are rounded to seven places, halves away from 0,
+        without trailing zeros (e.g., 0.50 is 0.5, 0 and -0.00000004 are 0).
+    parameters:
+        column - the quoted name of the coordinate column
+    returns:
+        sql - the SQL expression, '' if the value is not a number
+    '''
+    sql = column
+    for step in coordinate_steps():
+        if step[0] == 'trim':
+            sql = f'TRIM({sql})'
+        elif step[0] == 'safe_cast_numeric':
+            sql = f'SAFE_CAST({sql} AS NUMERIC)'
+        elif step[0] == 'round':
+            sql = f'ROUND({sql},{step[1]})'
+        elif step[0] == 'cast_string':
+            # NUMERIC values as STRING have no trailing zeros in the fraction.
+            sql = f'CAST({sql} AS STRING)'
+        elif step[0] == 'ifnull':
+            sql = f'IFNULL({sql},{sql_string_literal(step[1])})'
+    return sql
+
+def location_match_sql(termlist, header, columnmap=None):
+    ''' Get a BigQuery SQL expression for the Location string that location_match_str()
+        makes from the terms in termlist, for a table with the fields in header. Terms
+        without a field contribute nothing, as do empty (NULL) fields.
+    parameters:
+        termlist - list of the terms to use in the construction of the string (required)
+        header - list of the lowercase field names in the table (required)
+        columnmap - dict of the field to use for a term, if it is not the term itself
+            (optional)
+    returns:
+        sql - the SQL expression for the Location string
+    '''
+    if columnmap is None:
+        columnmap = {}
+    columns = set(header)
+
+    def column_sql(term):
+        column = columnmap.get(term, term)
+        if column not in columns:
+            return None
+        return f'`{column}`'
+
+    parts = []
+    for term in termlist:
+        column = column_sql(term)
+        if column is None:
+            parts.append("''")
+        elif term == 'decimallatitude' or term == 'decimallongitude':
+            parts.append(coordinate_match_sql(column))
+        elif term == 'verbatimlocality':
+            # verbatimLocality contributes only where it differs from locality
+            locality = column_sql('locality')
+            if locality is None:
+                locality = "''"
+            parts.append(f"IF(LOWER(TRIM(IFNULL({locality},'')))="
+                f"LOWER(TRIM(IFNULL({column},''))),'',IFNULL({column},''))")
+        else:
+            parts.append(f"IFNULL({column},'')")
+    # Every term is followed by a space, as in location_match_str()
+    return 'CONCAT(' + ",' ',".join(parts) + ",' ')"
+
+def match_strs_sql(header, columnmap=None):
+    ''' Get the BigQuery SQL select expressions for the three match string fields, for a
+        table with the fields in header. The expressions use the temporary function from
+        super_simplify_function_sql(), which must be made in the same query.
+    parameters:
+        header - list of the lowercase field names in the table (required)
+        columnmap - dict of the field to use for a term, if it is not the term itself,
+            e.g., {'countrycode': 'bels_interpreted_countrycode'} (optional)
+    returns:
+        sql - the select expressions, separated by commas
+    '''
+    expressions = []
+    for field, termlist in matchstrtermlists.items():
+        expressions.append(f'{SUPER_SIMPLIFY_FUNCTION}(' \
+            f'{location_match_sql(termlist, header, columnmap)}) AS {field}')
+    return ',\n'.join(expressions)
@@ -17,20 +17,20 @@ __author__ = "John Wieczorek"
 __contributors__ = ""
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = "resources.py"
-__version__ = __filename__ + ' ' + "2022-06-21T01:25-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T19:30-03:00"
 
 import base64
+import json
 import logging
 import os
 import time
 from flask import request
+from flask import Response
+from flask import stream_with_context
 from flask_restful import Resource
 from google.cloud import bigquery
 
 from bels_query import bels_original_georef
-from bels_query import get_best_sans_coords_georef_reduced
-from bels_query import get_best_with_verbatim_coords_georef_reduced
-from bels_query import get_best_with_coords_georef_reduced
 from bels_query import has_decimal_coords
 from bels_query import has_georef
 from bels_query import has_verbatim_coords
@@ -40,13 +40,58 @@ from dwca_terms import locationmatchverbatimcoordstermlist
 from dwca_terms import locationmatchwithcoordstermlist
 from dwca_vocab_utils import Darwinizer
 from dwca_utils import lower_dict_keys
+from georef_store import resolve_best_georef
+from georef_store import resolve_best_georefs
 from id_utils import location_match_str, super_simplify
+from json_utils import CustomJsonEncoder
+
+# Default maximum number of Locations in a BestGeorefBatch request
+BEST_GEOREF_BATCH_MAX = 1000
+
+# Number of Locations looked up together in a streamed BestGeorefBatch response
+BEST_GEOREF_STREAM_CHUNK_SIZE = 100
+
+def match_tiers(lowerloc):
+    ''' Get the tiers of matching that apply to a Location, in priority order.
+    parameters:
+        lowerloc - the Darwinized Location with lowercase field names and the best 
+            countrycode (required)
+    returns:
+        tiers - list of (matchtype, matchstr) tuples
+    '''
+    tiers = []
+    if has_decimal_coords(lowerloc) == True:
+        matchme = location_match_str(locationmatchwithcoordstermlist, lowerloc)
+        tiers.append(('with_coords', super_simplify(matchme)))
+    if has_verbatim_coords(lowerloc): 
+        matchme = location_match_str(locationmatchverbatimcoordstermlist, lowerloc)
+        tiers.append(('verbatim_coords', super_simplify(matchme)))
+    matchme = location_match_str(locationmatchsanscoordstermlist, lowerloc)
+    tiers.append(('sans_coords', super_simplify(matchme)))
+    return tiers
+
+def encode_georef(georef):
+    ''' Get a copy of a georeference in which the binary identifiers are base64 strings.
+    parameters:
+        georef - the georeference from a GeorefStore (required)
+    returns:
+        georef - a copy of the georeference that can be rendered as JSON
+    '''
+    georef = dict(georef)
+    for field in ['dwc_location_hash', 'locationid']:
+        if field in georef:
+            georef[field] = base64.b64encode(georef[field]).decode('utf-8')
+    return georef
 
 class BestGeoref(Resource):
-    def __init__(self, bels_client):
+    def __init__(self, bels_client, tier_executor=None):
         self.__name__='BestGeoref'
         self.bels_client = bels_client
         self.bq_client = bels_client.bq_client
+        self.georef_store = bels_client.georef_store
+        # If there is an executor, the applicable match tiers are looked up concurrently
+        # in it rather than one after the other.
+        self.tier_executor = tier_executor
         self.darwinizer = Darwinizer('./bels/vocabularies/darwin_cloud.txt')
         logging.basicConfig(level=logging.DEBUG)
 
@@ -95,47 +140,166 @@ class BestGeoref(Resource):
             logging.debug(f'BestGeoref request: {requestjson}\nresponse: {response}')
             return response, 200
         
-        if self.bq_client is None:
-            response = {"Message": {"status": "error", "result": "No BigQuery client."}}
+        if self.georef_store is None:
+            response = {"Message": {"status": "error", "result": "No georeference store."}}
             logging.debug(f'BestGeoref request: {requestjson}\nresponse: {response}')
             return response, 500
 
         bestcountrycode = self.bels_client.get_best_countrycode(lowerloc)
         lowerloc['countrycode'] = bestcountrycode
         result = None
-        matchstr = None
         if give_me == 'BEST_GEOREF':
             starttime = time.perf_counter()
-            if has_decimal_coords(lowerloc) == True:
-                matchme = location_match_str(locationmatchwithcoordstermlist, lowerloc)
-                matchstr = super_simplify(matchme)
-                result = get_best_with_coords_georef_reduced(self.bq_client, matchstr)
-                if result is None:
-                    print(f'No match with coords found {matchstr}')
-            if result is None and has_verbatim_coords(lowerloc): 
-                matchme = location_match_str(locationmatchverbatimcoordstermlist, lowerloc)
-                matchstr = super_simplify(matchme)
-                result = get_best_with_verbatim_coords_georef_reduced(self.bq_client, matchstr)
-                if result is None:
-                    print(f'No match with verbatim coords found {matchstr}')
-            if result is None:
-                matchme = location_match_str(locationmatchsanscoordstermlist, lowerloc)
-                matchstr = super_simplify(matchme)
-                result = get_best_sans_coords_georef_reduced(self.bq_client, matchstr)    
-                if result is None:
-                    print(f'No match sans coords found {matchstr}')
+            tiers = match_tiers(lowerloc)
+            result = resolve_best_georef(self.georef_store, tiers, self.tier_executor)
 
             querytime = time.perf_counter()-starttime
             if result:
-                for field in ['dwc_location_hash', 'locationid']:
-                    if field in result:
-                        result[field] = base64.b64encode(result[field]).decode('utf-8')
-                row.update(result)
+                row.update(encode_georef(result))
                 response = {"Message": {"status": "success", "elapsed_time": f'{querytime:1.3f}s', "result": row}}
                 logging.debug(f'BestGeoref request: {requestjson}\nresponse: {response}')
                 return response, 200
             else:
-                print(f'No georeference found')
+                print(f'No georeference found for {tiers}')
                 response = {"Message": {"status": "failure", "result": row}}
                 logging.debug(f'BestGeoref request: {requestjson}\nresponse: {response}')
                 return response, 200
+
+class BestGeorefBatch(Resource):
+    def __init__(self, bels_client, max_locations=None):
+        self.__name__='BestGeorefBatch'
+        self.bels_client = bels_client
+        self.georef_store = bels_client.georef_store
+        self.max_locations = max_locations
+        if self.max_locations is None:
+            self.max_locations = BEST_GEOREF_BATCH_MAX
+        # The Darwinizer keeps a plan for each distinct set of fields, so Locations
+        # with the same fields are Darwinized with one compiled plan.
+        self.darwinizer = Darwinizer('./bels/vocabularies/darwin_cloud.txt')
+        logging.basicConfig(level=logging.DEBUG)
+
+    def post(self):
+        if request.is_json == False:
+            response = {"Message": {"status": "error", "result": f"Request is empty or is not valid JSON."}}
+            logging.debug(f'BestGeorefBatch request: {request}\nresponse: {response}')
+            return response, 400
+
+        requestjson = request.get_json()
+        give_me = requestjson.get('give_me')
+        if give_me is None or give_me.upper() not in ['BEST_GEOREF']:
+            response = {"Message": {"status": "error", "result": f"Directive {give_me} not supported"}}
+            logging.debug(f'BestGeorefBatch request: {requestjson}\nresponse: {response}')
+            return response, 400
+
+        rows = requestjson.get('for_locations')
+        if rows is None or isinstance(rows, list) == False or len(rows)==0:
+            response = {"Message": {"status": "error", "result": f"No list of locations in 'for_locations'."}}
+            logging.debug(f'BestGeorefBatch request: {requestjson}\nresponse: {response}')
+            return response, 400
+
+        if len(rows) > self.max_locations:
+            response = {"Message": {"status": "error", "result": f"{len(rows)} locations in request, maximum is {self.max_locations}."}}
+            logging.debug(f'BestGeorefBatch request with {len(rows)} locations\nresponse: {response}')
+            return response, 413
+
+        if self.georef_store is None:
+            response = {"Message": {"status": "error", "result": "No georeference store."}}
+            logging.debug(f'BestGeorefBatch response: {response}')
+            return response, 500
+
+        # Stream the results as NDJSON if asked to, either with "stream": true in the 
+        # request or by accepting application/x-ndjson.
+        if requestjson.get('stream') == True or \
+            request.accept_mimetypes.best == 'application/x-ndjson':
+            return Response(stream_with_context(self.stream_results(rows)),
+                mimetype='application/x-ndjson')
+
+        starttime = time.perf_counter()
+        # All of the Locations are looked up together, one batch per tier.
+        results = [result for i, result in self.location_results(rows, len(rows))]
+        querytime = time.perf_counter()-starttime
+        response = {"Message": {"status": "success", "elapsed_time": f'{querytime:1.3f}s', "result": results}}
+        logging.debug(f'BestGeorefBatch request with {len(rows)} locations in {querytime:1.3f}s')
+        return response, 200
+
+    def stream_results(self, rows):
+        ''' Yield one NDJSON line with the result for each Location, in the order of the
+            request, as soon as the chunk of Locations it is in has been looked up, 
+            followed by a summary line with the counts of results by status and the
+            elapsed times.
+        '''
+        starttime = time.perf_counter()
+        firsttime = None
+        counts = {'success': 0, 'original': 0, 'failure': 0, 'error': 0}
+        for i, result in self.location_results(rows, BEST_GEOREF_STREAM_CHUNK_SIZE):
+            if firsttime is None:
+                firsttime = time.perf_counter()-starttime
+            status = result['status']
+            if status == 'success' and \
+                result['result'].get('bels_georeference_source') == 'original data':
+                counts['original'] += 1
+            else:
+                counts[status] += 1
+            yield json.dumps({'index': i, **result}, cls=CustomJsonEncoder) + '\n'
+
+        querytime = time.perf_counter()-starttime
+        lookups = counts['success'] + counts['failure']
+        summary = {'count': len(rows), **counts}
+        summary['hit_rate'] = None
+        if lookups > 0:
+            summary['hit_rate'] = counts['success']/lookups
+        summary['first_result_time'] = None
+        if firsttime is not None:
+            summary['first_result_time'] = f'{firsttime:1.3f}s'
+        summary['elapsed_time'] = f'{querytime:1.3f}s'
+        logging.debug(f'BestGeorefBatch streamed {len(rows)} locations: {summary}')
+        yield json.dumps({'summary': summary}) + '\n'
+
+    def location_results(self, rows, chunksize):
+        ''' Yield (index, result) for each Location in rows, in order. The Locations are
+            looked up in chunks of chunksize, with one batched lookup per tier for each
+            chunk. Locations that already have a georeference get it as the result
+            without a lookup.
+        '''
+        for start in range(0, len(rows), chunksize):
+            chunk = rows[start:start+chunksize]
+            # Results for the chunk. Locations that need a lookup are collected with 
+            # their match tiers to be looked up together.
+            results = [None]*len(chunk)
+            lookups = []
+            tierslist = []
+            for i, row in enumerate(chunk):
+                if isinstance(row, dict) == False or len(row)==0:
+                    results[i] = {"status": "error", "result": "No row data for location."}
+                    continue
+                loc = self.darwinizer.darwinize_dict(row_as_dict(row))
+                if loc is None:
+                    results[i] = {"status": "error", "result": "Darwinize failed for location."}
+                    continue
+                lowerloc = lower_dict_keys(loc)
+                if 'country' not in lowerloc and 'countrycode' not in lowerloc:
+                    results[i] = {"status": "error", "result": "No interpretable country field in location."}
+                    continue
+                # Short-cut if the row already has a georeference
+                if has_georef(loc):
+                    georef = bels_original_georef(lowerloc)
+                    georef['bels_countrycode'] = \
+                        self.bels_client.get_best_countrycode(lowerloc)
+                    results[i] = {"status": "success", "result": georef}
+                    continue
+                lowerloc['countrycode'] = self.bels_client.get_best_countrycode(lowerloc)
+                lookups.append(i)
+                tierslist.append(match_tiers(lowerloc))
+
+            # One batched lookup per tier for all of the distinct match strings
+            georefs = resolve_best_georefs(self.georef_store, tierslist)
+            for i, georef in zip(lookups, georefs):
+                row = dict(chunk[i])
+                if georef is None:
+                    results[i] = {"status": "failure", "result": row}
+                else:
+                    row.update(encode_georef(georef))
+                    results[i] = {"status": "success", "result": row}
+
+            for i, result in enumerate(results):
+                yield start+i, result
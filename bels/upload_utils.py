@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "upload_utils.py"
+__version__ = __filename__ + ' ' + "2026-10-18T22:50-03:00"
+
+# This file contains functions to stream a file uploaded to the BELS API to Google Cloud
+# Storage without holding all of it in memory. Only the beginning of the file is read
+# before the upload starts, enough to get the header (see read_upload_header()). That
+# prefix and the rest of the file are then written in chunks to a blob opened for
+# writing, which for Google Cloud Storage is a resumable upload, optionally gzipped on
+# the way. Files that are not comma-separated utf-8, such as TSV files, are converted to
+# it on the way (see upload_stream_as_csv()). The number of rows is estimated from the
+# bytes as they pass.
+#
+# The functions need only blob.open(), so LocalBucket and LocalBlob, which write to a
+# local directory, can stand in for a Google Cloud Storage bucket and its blobs in tests.
+
+import codecs
+import csv
+import gzip
+import io
+import os
+from contextlib import contextmanager
+
+from dwca_utils import csv_sniff
+from dwca_utils import read_prefix_header
+from local_matcher import LOCAL_MATCH_CHUNK_SIZE
+from local_matcher import RowCountEstimate
+from local_matcher import add_match_columns
+
+# Number of bytes sent to Google Cloud Storage at a time, a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = 8*1024*1024
+
+# Number of bytes read at a time from the start of an upload to find the header
+HEADER_READ_SIZE = 64*1024
+
+# Maximum number of bytes read from the start of an upload to find the header
+HEADER_MAX_SIZE = 1024*1024
+
+class LocalBucket():
+    ''' A stand-in for a Google Cloud Storage bucket in a local directory.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def blob(self, blob_name):
+        return LocalBlob(os.path.join(self.directory, blob_name))
+
+class LocalBlob():
+    ''' A stand-in for a Google Cloud Storage blob in a local file.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.name = path
+
+    def open(self, mode='r', chunk_size=None, ignore_flush=None, content_type=None,
+        **kwargs):
+        # The options of uploads to Google Cloud Storage do not apply to local files.
+        if 'w' in mode:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        return open(self.path, mode, **kwargs)
+
+class PrefixedStream(io.RawIOBase):
+    ''' A readable binary stream of the bytes already read from the start of a stream
+        followed by the rest of the stream, read at most readsize bytes at a time, which
+        gives every chunk read to a RowCountEstimate.
+    '''
+    def __init__(self, prefix, stream, estimate=None, readsize=None):
+        if readsize is None:
+            readsize = UPLOAD_CHUNK_SIZE
+        self.prefix = prefix
+        self.stream = stream
+        self.estimate = estimate
+        self.readsize = readsize
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if len(self.prefix) > 0:
+            data = self.prefix[:len(b)]
+            self.prefix = self.prefix[len(data):]
+        else:
+            data = self.stream.read(min(len(b), self.readsize))
+        n = len(data)
+        b[:n] = data
+        if self.estimate is not None:
+            self.estimate.update(data)
+        return n
+
+def read_upload_header(stream, readsize=None, maxsize=None):
+    ''' Read the beginning of an uploaded file until it holds the whole first record, 
+        and get the header from that record with the encoding and dialect detected in
+        what has been read.
+    parameters:
+        stream - binary stream of the uploaded file (required)
+        readsize - number of bytes to read at a time (optional; default HEADER_READ_SIZE)
+        maxsize - maximum number of bytes to read (optional; default HEADER_MAX_SIZE)
+    returns:
+        prefix - the bytes read
+        header - list of the fields in the header, or None if the first record does not
+            end with a line ending in the first maxsize bytes of the file
+        dialect - csv.dialect object with the detected attributes of the file, or None
+        encoding - the detected encoding of the file, or None
+    '''
+    if readsize is None:
+        readsize = HEADER_READ_SIZE
+    if maxsize is None:
+        maxsize = HEADER_MAX_SIZE
+    prefix = b''
+    header = None
+    dialect = None
+    encoding = None
+    while len(prefix) < maxsize:
+        chunk = stream.read(min(readsize, maxsize - len(prefix)))
+        if len(chunk) == 0:
+            break
+        prefix += chunk
+        # The first record can only end in a chunk with a line ending in it.
+        if chunk.find(b'\n') != -1 or chunk.find(b'\r') != -1:
+            dialect, encoding = csv_sniff(prefix, prefixsize=len(prefix))
+            header = read_prefix_header(prefix, dialect, encoding)
+            if header is not None:
+                break
+    return prefix, header, dialect, encoding
+
+def is_utf8_csv(dialect, encoding):
+    ''' Determine if a file with the given dialect and encoding can be loaded as it is,
+        as comma-separated utf-8.
+    parameters:
+        dialect - csv.dialect object with the attributes of the file (required)
+        encoding - the encoding of the file (required)
+    returns:
+        True if the file is comma-separated utf-8, otherwise False
+    '''
+    if dialect is None or dialect.delimiter != ',':
+        return False
+    if encoding is None:
+        return False
+    return codecs.lookup(encoding).name in ['utf-8', 'utf-8-sig']
+
+@contextmanager
+def open_upload(blob, compress=False, chunksize=None):
+    ''' Open a blob to write an upload to in chunks.
+    parameters:
+        blob - the Google Cloud Storage blob, or a LocalBlob (required)
+        compress - gzip the content (optional; default False)
+        chunksize - number of bytes sent at a time (optional; default UPLOAD_CHUNK_SIZE)
+    returns:
+        output - binary stream to write the content to
+    '''
+    if chunksize is None:
+        chunksize = UPLOAD_CHUNK_SIZE
+    content_type = 'text/csv'
+    if compress == True:
+        content_type = 'application/gzip'
+    with blob.open('wb', chunk_size=chunksize, ignore_flush=True,
+        content_type=content_type) as f:
+        if compress == True:
+            with gzip.GzipFile(fileobj=f, mode='wb') as output:
+                yield output
+        else:
+            yield f
+
+def upload_stream(blob, prefix, stream, compress=False, chunksize=None):
+    ''' Write an uploaded file to a blob in chunks.
+    parameters:
+        blob - the Google Cloud Storage blob, or a LocalBlob (required)
+        prefix - the bytes already read from the start of the file (required)
+        stream - binary stream of the rest of the file (required)
+        compress - gzip the content (optional; default False)
+        chunksize - number of bytes read and sent at a time (optional; default
+            UPLOAD_CHUNK_SIZE)
+    returns:
+        rowcount - the estimated number of rows after the header, from
+            RowCountEstimate
+    '''
+    if chunksize is None:
+        chunksize = UPLOAD_CHUNK_SIZE
+    estimate = RowCountEstimate()
+    source = PrefixedStream(prefix, stream, estimate, chunksize)
+    with open_upload(blob, compress, chunksize) as output:
+        while True:
+            chunk = source.read(chunksize)
+            if len(chunk) == 0:
+                break
+            output.write(chunk)
+    return estimate.rowcount()
+
+def upload_stream_with_match_columns(blob, prefix, stream, header, countryfieldlist,
+    countrycodes, compress=False, chunksize=None, dialect=None, encoding=None):
+    ''' Write an uploaded CSV file to a blob in chunks, with the match strings added as
+        columns by local_matcher.add_match_columns() on the way.
+    parameters:
+        blob - the Google Cloud Storage blob, or a LocalBlob (required)
+        prefix - the bytes already read from the start of the file (required)
+        stream - binary stream of the rest of the file (required)
+        header - list of the Darwinized, BigQuery-compatible field names to use in place
+            of the header in the file (required)
+        countryfieldlist - list of the country fields in the header in order of
+            priority, from bels_query.country_fields() (required)
+        countrycodes - dict of countrycode by upper case country (required)
+        compress - gzip the content (optional; default False)
+        chunksize - number of bytes read and sent at a time (optional; default
+            UPLOAD_CHUNK_SIZE)
+        dialect - csv.dialect object with the attributes of the file, if it is not
+            comma-separated (optional)
+        encoding - the encoding of the file (optional; default 'utf-8')
+    returns:
+        rowcount - the estimated number of rows after the header, from
+            RowCountEstimate, or None if the match columns could not be added
+    raises:
+        UnicodeDecodeError or csv.Error if the file can not be read with the encoding
+            and dialect, after part of it has been written
+    '''
+    if chunksize is None:
+        chunksize = UPLOAD_CHUNK_SIZE
+    estimate = RowCountEstimate()
+    if encoding is None:
+        encoding = 'utf-8'
+    source = io.BufferedReader(PrefixedStream(prefix, stream, estimate, chunksize),
+        chunksize)
+    input = io.TextIOWrapper(source, encoding=encoding, newline='')
+    with open_upload(blob, compress, chunksize) as f:
+        output = io.TextIOWrapper(f, encoding='utf-8', newline='', write_through=True)
+        rowcount = add_match_columns(input, output, header, countryfieldlist,
+            countrycodes, dialect=dialect)
+        output.flush()
+        # The upload stream is closed with the blob, not with the text wrapper.
+        output.detach()
+    if rowcount is None:
+        return None
+    return estimate.rowcount()
+
+def upload_stream_as_csv(blob, prefix, stream, dialect, encoding, compress=False,
+    chunksize=None):
+    ''' Write an uploaded file to a blob in chunks as comma-separated utf-8, converted 
+        from its dialect and encoding on the way.
+    parameters:
+        blob - the Google Cloud Storage blob, or a LocalBlob (required)
+        prefix - the bytes already read from the start of the file (required)
+        stream - binary stream of the rest of the file (required)
+        dialect - csv.dialect object with the attributes of the file (required)
+        encoding - the encoding of the file (required)
+        compress - gzip the content (optional; default False)
+        chunksize - number of bytes read and sent at a time (optional; default
+            UPLOAD_CHUNK_SIZE)
+    returns:
+        rowcount - the estimated number of rows after the header, from
+            RowCountEstimate
+    raises:
+        UnicodeDecodeError or csv.Error if the file can not be read with the encoding
+            and dialect, after part of it has been written
+    '''
+    if chunksize is None:
+        chunksize = UPLOAD_CHUNK_SIZE
+    estimate = RowCountEstimate()
+    source = io.BufferedReader(PrefixedStream(prefix, stream, estimate, chunksize),
+        chunksize)
+    input = io.TextIOWrapper(source, encoding=encoding, newline='')
+    with open_upload(blob, compress, chunksize) as f:
+        output = io.TextIOWrapper(f, encoding='utf-8', newline='', write_through=True)
+        writer = csv.writer(output)
+        rows = []
+        for row in csv.reader(input, dialect=dialect):
+            rows.append(row)
+            if len(rows) == LOCAL_MATCH_CHUNK_SIZE:
+                writer.writerows(rows)
+                rows = []
+        writer.writerows(rows)
+        output.flush()
+        # The upload stream is closed with the blob, not with the text wrapper.
+        output.detach()
+    return estimate.rowcount()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "avro_utils_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T22:20-03:00"
+
+# This file contains unit tests for the functions in avro_utils.
+#
+# Example:
+#
+# python avro_utils_tests.py
+
+import csv
+import io
+import unittest
+
+import fastavro
+
+from avro_utils import avro_schema
+from avro_utils import avro_to_csv
+from avro_utils import csv_to_avro
+from avro_utils import csv_value
+
+class AvroUtilsTestFramework():
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+
+    # following are files used as input during the tests, don't remove these
+    benchmarkfile = testdatapath + 'test_benchmark_1000.csv'
+
+class AvroUtilsTestCase(unittest.TestCase):
+    header = ['id', 'country', 'locality', 'decimallatitude']
+    content = 'ID,Country,Locality,Lat\r\n' + \
+        '1,Denmark,"Elbæk\nSkov",55.7\r\n' + \
+        '2,,"West Point, ""VA""",\r\n' + \
+        '3,France\r\n' + \
+        '4,Peru,Lima,-12.0,extra\r\n'
+
+    def setUp(self):
+        self.framework = AvroUtilsTestFramework()
+
+    def tearDown(self):
+        self.framework = None
+
+    def test_avro_schema(self):
+        print('Running test_avro_schema')
+        schema = avro_schema(self.header)
+        self.assertEqual(schema['name'], 'bels_row')
+        self.assertEqual([field['name'] for field in schema['fields']], self.header)
+        for field in schema['fields']:
+            self.assertEqual(field['type'], ['null', 'string'])
+
+    def test_csv_to_avro(self):
+        print('Running test_csv_to_avro')
+        output = io.BytesIO()
+        rowcount = csv_to_avro(io.StringIO(self.content, newline=''), output,
+            self.header, chunksize=3)
+        self.assertEqual(rowcount, 4)
+
+        # The header replaces the one in the file, empty values are NULL and rows are
+        # padded or truncated to the header
+        output.seek(0)
+        reader = fastavro.reader(output)
+        self.assertEqual(reader.codec, 'deflate')
+        records = list(reader)
+        self.assertEqual(records[0], {'id': '1', 'country': 'Denmark',
+            'locality': 'Elbæk\nSkov', 'decimallatitude': '55.7'})
+        self.assertIsNone(records[1]['country'])
+        self.assertEqual(records[1]['locality'], 'West Point, "VA"')
+        self.assertIsNone(records[2]['locality'])
+        self.assertEqual(records[3]['decimallatitude'], '-12.0')
+
+        self.assertIsNone(csv_to_avro(io.StringIO(self.content), io.BytesIO(), []))
+
+    def test_avro_to_csv(self):
+        print('Running test_avro_to_csv')
+        # The shards of an export have the same schema. The header is written once.
+        shards = []
+        for content in [self.content, 'x\r\n5,Chile,Arica,-18.5\r\n']:
+            shard = io.BytesIO()
+            csv_to_avro(io.StringIO(content, newline=''), shard, self.header)
+            shard.seek(0)
+            shards.append(shard)
+        output = io.StringIO(newline='')
+        self.assertEqual(avro_to_csv(shards, output), 5)
+        output.seek(0)
+        rows = list(csv.reader(output))
+        self.assertEqual(rows[0], self.header)
+        self.assertEqual(rows[1], ['1', 'Denmark', 'Elbæk\nSkov', '55.7'])
+        self.assertEqual(rows[2], ['2', '', 'West Point, "VA"', ''])
+        self.assertEqual(rows[5], ['5', 'Chile', 'Arica', '-18.5'])
+
+        # BigQuery exports typed fields
+        schema = fastavro.parse_schema({'type': 'record', 'name': 'result',
+            'fields': [{'name': 'bels_decimallatitude', 'type': ['null', 'double']},
+            {'name': 'bels_best_of_n_georeferences', 'type': ['null', 'long']},
+            {'name': 'flag', 'type': ['null', 'boolean']}]})
+        shard = io.BytesIO()
+        fastavro.writer(shard, schema, [{'bels_decimallatitude': 37.476215,
+            'bels_best_of_n_georeferences': 12, 'flag': True},
+            {'bels_decimallatitude': None, 'bels_best_of_n_georeferences': None,
+            'flag': False}])
+        shard.seek(0)
+        output = io.StringIO(newline='')
+        self.assertEqual(avro_to_csv([shard], output, writeheader=False), 2)
+        self.assertEqual(output.getvalue(), '37.476215,12,true\r\n,,false\r\n')
+        self.assertEqual(csv_value(None), '')
+
+    def test_round_trip(self):
+        print('Running test_round_trip')
+        # A benchmark file is the same after conversion to Avro and back
+        with open(self.framework.benchmarkfile, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        with open(self.framework.benchmarkfile, 'r', newline='', encoding='utf-8') as f:
+            shard = io.BytesIO()
+            self.assertEqual(csv_to_avro(f, shard, rows[0]), len(rows)-1)
+        shard.seek(0)
+        output = io.StringIO(newline='')
+        avro_to_csv([shard], output)
+        output.seek(0)
+        self.assertEqual(list(csv.reader(output)), rows)
+
+if __name__ == '__main__':
+    print('=== avro_utils_tests.py ===')
+    unittest.main()
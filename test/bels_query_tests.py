@@ -16,7 +16,7 @@
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2021 Rauthiflor LLC"
 __filename__ = "bels_query_tests.py"
-__version__ = __filename__ + ' ' + "2022-06-08T17:35-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
 
 # This file contains unit tests for the query functions in bels 
 # (Biodiversity Enhanced Location Services).
@@ -36,6 +36,8 @@ __version__ = __filename__ + ' ' + "2022-06-08T17:35-03:00"
 #  {'error': 'invalid_grant', 'error_description': 'Bad Request'})
 
 from decimal import *
+import csv
+import io
 import unittest
 #import os
 #os.environ["GOOGLE_APPLICATION_CREDENTIALS"]="../bels/auth.json"
@@ -66,9 +68,29 @@ from bels_query import get_best_with_coords_georef_reduced
 from bels_query import get_best_with_verbatim_coords_georef_reduced
 from bels_query import get_location_by_id
 from bels_query import get_location_by_hashid
+from bels_query import get_best_georefs_reduced
+from bels_query import query_best_sans_coords_georef_reduced
+from bels_query import query_best_with_coords_georef_reduced
+from bels_query import query_job_config
+from bels_query import get_best_sans_coords_georefs_reduced
 from bels_query import has_georef
+from bels_query import BigQueryGeorefStore
 from bels_query import row_as_dict
 from bels_query import bigquerify_header
+from bels_query import process_import_table_script
+from bels_query import matcher_clause
+from bels_query import export_table_avro
+from bels_query import query_location_by_id
+from local_matcher import add_match_columns
+from local_matcher import countrycode_lookup_dict
+from match_sql import match_strs_sql
+from match_sql import matchcolumnfieldlist
+from match_sql import matchstrtermlists
+from match_sql import sql_string_literal
+from match_sql import super_simplify_function_sql
+from match_sql import SUPER_SIMPLIFY_FUNCTION
+from georef_store import export_store_rows
+from georef_store import reduced_georef
 
 class BELSQueryTestFramework():
     # testdatapath is the location of example files to test with
@@ -86,10 +108,234 @@ class BELSQueryTestFramework():
     locsanscoordsbestgeoreffilemulti = testdatapath + 'test_best_georefs_sans_coords_for_locations.csv'
     locswithcoordsbestgeoreffile = testdatapath + 'test_loc_with_with_coords_best_georef.csv'
     locswithverbatimcoordsbestgeoreffile = testdatapath + 'test_loc_with_verbatimcoords_best_georef.csv'
+    matchstringsgoldenfile = testdatapath + 'test_match_strings_golden.csv'
+    benchmark100file = testdatapath + 'test_benchmark_100.csv'
 
     def dispose(self):
         return True
 
+class LocalRows(list):
+    @property
+    def total_rows(self):
+        return len(self)
+
+class LocalQueryJob():
+    def __init__(self, rows):
+        self.rows = LocalRows(rows)
+        self.destination = self.rows
+
+    def result(self):
+        return self.rows
+
+class LocalBigQueryClient():
+    ''' A stand-in for a bigquery.Client() that answers the parameterized best 
+        georeference queries from a CSV export of a matchme_*_best_georef table, and 
+        keeps the queries it was asked to run.
+    '''
+    def __init__(self, matchtype, exportfile):
+        self.rows = {}
+        for values in export_store_rows(matchtype, [exportfile]):
+            self.rows[values[0]] = reduced_georef(matchtype, values)
+        self.queries = []
+
+    def query(self, query, job_config=None):
+        parameter = job_config.query_parameters[0]
+        if hasattr(parameter, 'values'):
+            keys = parameter.values
+        else:
+            keys = [parameter.value]
+        self.queries.append((query, keys))
+        return LocalQueryJob([self.rows[key] for key in keys if key in self.rows])
+
+    def get_table(self, table):
+        return table
+
+    def list_rows(self, table, max_results=None):
+        return LocalRows(table[:max_results])
+
+class LocalBlob():
+    def __init__(self, name):
+        self.name = name
+
+class LocalBucket():
+    def __init__(self):
+        self.blobnames = []
+
+    def list_blobs(self, prefix=''):
+        return [LocalBlob(name) for name in self.blobnames if name.startswith(prefix)]
+
+class LocalStorageClient():
+    ''' A stand-in for a storage.Client() with one bucket, whose blobs are written by a
+        LocalExtractClient.
+    '''
+    def __init__(self):
+        self.bucket = LocalBucket()
+
+    def get_bucket(self, bucketname):
+        return self.bucket
+
+class LocalExtractClient():
+    ''' A stand-in for a bigquery.Client() that writes two shard blobs into a
+        LocalStorageClient bucket for every extract job, and keeps the jobs it was asked
+        to run.
+    '''
+    def __init__(self, storage_client):
+        self.bucket = storage_client.bucket
+        self.extracts = []
+
+    def extract_table(self, table_id, destination_uri, job_config=None):
+        self.extracts.append((table_id, destination_uri))
+        path = destination_uri[destination_uri.find('/', len('gs://'))+1:]
+        for shard in range(2):
+            self.bucket.blobnames.append(path.replace('*', f'{shard:012d}'))
+        return LocalQueryJob([])
+
+class BELSBatchQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.framework = BELSQueryTestFramework()
+        self.client = LocalBigQueryClient('sans_coords', 
+            self.framework.matchmesanscoordsbestgeoreffile)
+
+    def tearDown(self):
+        self.framework.dispose()
+        self.framework = None
+
+    def test_get_best_georefs_reduced(self):
+        print('Running test_get_best_georefs_reduced')
+        matchstrs = list(self.client.rows)
+        self.assertEqual(len(matchstrs), 10)
+        # Repeated, missing and None match strings
+        keys = matchstrs + matchstrs[:4] + ['nowatthisshouldreturnaresult', None]
+
+        result = get_best_sans_coords_georefs_reduced(self.client, keys, batchsize=3)
+        self.assertEqual(result, self.client.rows)
+        # 11 distinct match strings in batches of 3
+        self.assertEqual(len(self.client.queries), 4)
+        for query, batch in self.client.queries:
+            self.assertIn('matchme_sans_coords IN UNNEST(@keys)', query)
+            self.assertLessEqual(len(batch), 3)
+        self.assertEqual(sum(len(batch) for query, batch in self.client.queries), 11)
+
+        # One query for all of the match strings with the default batch size
+        self.client.queries = []
+        result = get_best_georefs_reduced(self.client, 'sans_coords', keys)
+        self.assertEqual(result, self.client.rows)
+        self.assertEqual(len(self.client.queries), 1)
+
+        self.assertEqual(get_best_georefs_reduced(self.client, 'sans_coords', []), {})
+        self.assertIsNone(get_best_georefs_reduced(self.client, 'nonsense', keys))
+
+    def test_bigquery_georef_store_batch(self):
+        print('Running test_bigquery_georef_store_batch')
+        store = BigQueryGeorefStore(self.client)
+        matchstrs = list(self.client.rows)
+        result = store.get_best_georefs_reduced('sans_coords', matchstrs)
+        self.assertEqual(result, self.client.rows)
+        self.assertEqual(len(self.client.queries), 1)
+        self.assertEqual(store.get_best_georefs_reduced('nonsense', matchstrs), {})
+
+    def test_export_table_avro(self):
+        print('Running test_export_table_avro')
+        storage_client = LocalStorageClient()
+        client = LocalExtractClient(storage_client)
+        uri = 'gs://localityservice/bels_output/tmp/results-*.avro'
+        shards = ['bels_output/tmp/results-000000000000.avro',
+            'bels_output/tmp/results-000000000001.avro']
+        self.assertIsNone(export_table_avro(client, 'table', 'gs://b/results.avro',
+            storage_client))
+        self.assertEqual(client.extracts, [])
+        # Every export runs its own extract job, even after the shards of an earlier 
+        # export of the same table to the same destination were deleted
+        for i in range(2):
+            self.assertEqual(export_table_avro(client, 'table', uri, storage_client),
+                shards)
+            self.assertEqual(len(client.extracts), i+1)
+            storage_client.bucket.blobnames = []
+        self.assertFalse(hasattr(export_table_avro, 'cache_info'))
+        self.assertTrue(hasattr(query_location_by_id, 'cache_info'))
+
+    def test_parameterized_queries(self):
+        print('Running test_parameterized_queries')
+        # Query strings are built once and hold no match strings
+        query = query_best_sans_coords_georef_reduced()
+        self.assertIs(query, query_best_sans_coords_georef_reduced())
+        self.assertIn('matchme_sans_coords=@matchstr', query)
+        self.assertIsNot(query_best_with_coords_georef_reduced(), 
+            query_best_with_coords_georef_reduced('other.dataset.table'))
+        self.assertIs(query_job_config('matchstr', 'STRING', 'dkelbaekskov'),
+            query_job_config('matchstr', 'STRING', 'dkelbaekskov'))
+
+        matchstr = 'dkelbaekskov'
+        result = get_best_sans_coords_georef_reduced(self.client, matchstr)
+        self.assertEqual(result, self.client.rows[matchstr])
+        self.assertEqual(self.client.queries[-1], (query, [matchstr]))
+
+        # Match strings with quotes are values, not part of the query
+        matchstr = "usnewyorko'brienslanding"
+        self.assertIsNone(get_best_sans_coords_georef_reduced(self.client, matchstr))
+        self.assertEqual(self.client.queries[-1], (query, [matchstr]))
+
+    def test_process_import_table_script(self):
+        print('Running test_process_import_table_script')
+        query = process_import_table_script('localityservice.belsapi.t', 
+            'localityservice.results.t', ['countrycode', 'country'])
+        # Each tier is joined once and the best tier is picked in one pass
+        self.assertNotIn('NOT IN', query)
+        self.assertNotIn('INSERT INTO georefs', query)
+        for table in ['matchme_with_coords_best_georef', 
+            'matchme_verbatimcoords_best_georef', 'matchme_sans_coords_best_georef']:
+            self.assertEqual(query.count(f'localityservice.gazetteer.{table}`'), 1)
+        self.assertEqual(query.count('QUALIFY ROW_NUMBER() OVER (PARTITION BY bels_id '
+            'ORDER BY bels_tier)=1'), 1)
+        self.assertIn('a.bels_matchwithcoords=b.matchme_with_coords', query)
+        self.assertIn("0 AS bels_tier", query)
+        self.assertIn("'match sans coords' AS bels_match_type", query)
+        self.assertIn('IF(countrycode IS NULL,country,countrycode) AS bels_match_country',
+            query)
+        self.assertIn('CREATE OR REPLACE TABLE `localityservice.results.t`', query)
+
+        query = process_import_table_script('localityservice.belsapi.t', 
+            'localityservice.results.t', ['country'], 
+            georefsclause='CREATE TEMP TABLE georefs AS (SELECT 1);')
+        self.assertIn('CREATE TEMP TABLE georefs AS (SELECT 1);', query)
+        self.assertNotIn('QUALIFY', query)
+        self.assertIsNone(process_import_table_script('localityservice.belsapi.t', 
+            'localityservice.results.t', []))
+
+    def test_matcher_clause(self):
+        print('Running test_matcher_clause')
+        # Without the header the match strings are made with the JavaScript UDFs
+        self.assertIn('functions.matchString(TO_JSON_STRING(t), "withcoords")', 
+            matcher_clause())
+        header = ['country', 'countrycode', 'locality', 'decimallatitude']
+        clause = matcher_clause(header)
+        self.assertNotIn('functions.', clause)
+        self.assertIn(super_simplify_function_sql(), clause)
+        self.assertIn('`bels_interpreted_countrycode`', clause)
+        self.assertNotIn('`countrycode`', clause)
+        query = process_import_table_script('localityservice.belsapi.t', 
+            'localityservice.results.t', ['countrycode', 'country'], header=header)
+        self.assertIn(clause, query)
+        self.assertNotIn('functions.', query)
+
+    def test_process_matched_table_script(self):
+        print('Running test_process_matched_table_script')
+        # With the match columns in the input table the script only does the joins
+        query = process_import_table_script('localityservice.belsapi.t', 
+            'localityservice.results.t', ['countrycode', 'country'], 
+            header=['country', 'countrycode', 'locality'] + matchcolumnfieldlist,
+            matchcolumns=True)
+        self.assertNotIn('countrycode_lookup', query)
+        self.assertNotIn('CREATE TEMP TABLE interpreted', query)
+        self.assertNotIn(SUPER_SIMPLIFY_FUNCTION, query)
+        self.assertNotIn('functions.', query)
+        self.assertIn('QUALIFY ROW_NUMBER() OVER (PARTITION BY bels_id', query)
+        self.assertIn('a.bels_matchsanscoords=b.matchme_sans_coords', query)
+        self.assertIn('FROM \n  `localityservice.belsapi.t`', query)
+        self.assertIn('CREATE OR REPLACE TABLE `localityservice.results.t`', query)
+        self.assertIsNone(process_import_table_script('localityservice.belsapi.t', 
+            'localityservice.results.t', [], matchcolumns=True))
+
 class BELSQueryTestCase(unittest.TestCase):
     def setUp(self):
         self.framework = BELSQueryTestFramework()
@@ -254,6 +500,70 @@ class BELSQueryTestCase(unittest.TestCase):
             'bels_best_of_n_georeferences':1, 'bels_match_type':'original georeference'}
         self.assertEqual(result, expected)
 
+    def test_match_strs_sql(self):
+        print('Running test_match_strs_sql')
+        # The match strings made in BigQuery are those of the golden corpus
+        with open(self.framework.matchstringsgoldenfile, 'r', newline='', 
+            encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        header = [field for field in rows[0] if field not in matchstrtermlists]
+        structs = []
+        for i, row in enumerate(rows):
+            values = [f'{i} AS bels_row']
+            for field in header:
+                value = 'NULL'
+                if len(row[field]) > 0:
+                    value = sql_string_literal(row[field])
+                values.append(f'{value} AS `{field}`')
+            structs.append('STRUCT(' + ','.join(values) + ')')
+        query = f"""{super_simplify_function_sql()}
+SELECT bels_row,
+{match_strs_sql(header)}
+FROM UNNEST([{','.join(structs)}])
+ORDER BY bels_row"""
+        result = self.BQ.query(query).result()
+        for found in result:
+            row = rows[found['bels_row']]
+            for field in matchstrtermlists:
+                self.assertEqual(found[field], row[field])
+        self.assertEqual(result.total_rows, len(rows))
+
+    def test_match_columns_parity(self):
+        print('Running test_match_columns_parity')
+        # The match columns added to a file before it is loaded are those the 
+        # georeference script makes in BigQuery
+        with open(self.framework.benchmark100file, 'r', newline='', 
+            encoding='utf-8') as f:
+            header = bigquerify_header(darwinize_list(next(csv.reader(f)), 
+                self.framework.darwincloudfile, case='l'))
+            f.seek(0)
+            output = io.StringIO(newline='')
+            add_match_columns(f, output, header, ['v_countrycode', 'country'], 
+                countrycode_lookup_dict())
+        output.seek(0)
+        rows = list(csv.DictReader(output))
+        structs = []
+        for i, row in enumerate(rows):
+            values = [f'{i} AS bels_row']
+            for field in header + ['bels_interpreted_countrycode']:
+                value = 'NULL'
+                if len(row[field]) > 0:
+                    value = sql_string_literal(row[field])
+                values.append(f'{value} AS `{field}`')
+            structs.append('STRUCT(' + ','.join(values) + ')')
+        query = f"""{super_simplify_function_sql()}
+SELECT bels_row,
+{match_strs_sql(header + ['bels_interpreted_countrycode'], 
+    {'countrycode': 'bels_interpreted_countrycode'})}
+FROM UNNEST([{','.join(structs)}])
+ORDER BY bels_row"""
+        result = self.BQ.query(query).result()
+        for found in result:
+            row = rows[found['bels_row']]
+            for field in matchstrtermlists:
+                self.assertEqual(found[field], row[field])
+        self.assertEqual(result.total_rows, len(rows))
+
     def test_bigquerify_header(self):
         print('Running test_bigquerify_header')
         input_fields = ['a', '1', '', '_', '$', u'ł', 'm"@#%', 'test', 'test', 'test', \
@@ -15,7 +15,7 @@
 
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
-__version__ = "dwca_utils_tests.py 2022-06-08T23:42-03:00"
+__version__ = "dwca_utils_tests.py 2026-10-18T23:50-03:00"
 __adapted_from__ = "https://github.com/kurator-org/kurator-validation/blob/master/packages/kurator_dwca/test/dwca_utils_test.py"
 
 # This file contains unit tests for the functions in dwca_utils.
@@ -24,7 +24,9 @@ __adapted_from__ = "https://github.com/kurator-org/kurator-validation/blob/maste
 #
 # python dwca_utils_test.py
 
+import io
 import os
+import pickle
 import unittest
 import csv
 
@@ -38,19 +40,30 @@ from dwca_utils import csv_field_checker
 from dwca_utils import csv_file_dialect
 from dwca_utils import csv_file_encoding
 from dwca_utils import csv_file_dialect
+from dwca_utils import csv_prefix_dialect
+from dwca_utils import csv_prefix_encoding
+from dwca_utils import csv_sniff
 from dwca_utils import dialects_equal
 from dwca_utils import dwc_ordered_header
 from dwca_utils import extract_fields_from_row
 from dwca_utils import extract_value_counts_from_file
 from dwca_utils import extract_values_from_row
 from dwca_utils import extract_values_from_file
+from dwca_utils import FileProfile
+from dwca_utils import file_profile
 from dwca_utils import get_guid
 from dwca_utils import header_map
 from dwca_utils import merge_headers
 from dwca_utils import purge_non_printing_from_file
 from dwca_utils import read_header
+from dwca_utils import read_csv_row
+from dwca_utils import read_prefix_header
+from dwca_utils import read_sniff_sample
+from dwca_utils import record_chunks
+from dwca_utils import scan_records
 from dwca_utils import split_path
 from dwca_utils import strip_list
+from dwca_utils import term_completeness_from_file
 from dwca_utils import term_rowcount_from_file
 from dwca_utils import tsv_dialect
 from dwca_utils import ustripstr
@@ -100,6 +113,7 @@ class DWCAUtilsTestFramework():
     testencoding = testdatapath + 'test_encoding.txt'
     testnonprinting = testdatapath + 'test_nonprinting_out.txt'
     newlinecondenser = testdatapath + 'test_newlinecondenser_out.txt'
+    profilefile = testdatapath + 'test_file_profile.csv'
 
     def dispose(self):
         csvwriteheaderfile = self.csvwriteheaderfile
@@ -126,6 +140,8 @@ class DWCAUtilsTestFramework():
             os.remove(testnonprinting)
         if os.path.isfile(newlinecondenser):
             os.remove(newlinecondenser)
+        if os.path.isfile(self.profilefile):
+            os.remove(self.profilefile)
         return True
 
 class DWCAUtilsTestCase(unittest.TestCase):
@@ -359,6 +375,247 @@ class DWCAUtilsTestCase(unittest.TestCase):
         self.assertFalse(dialect.strict,
             'strict not set to False for csv file')
 
+    def test_csv_prefix_dialect(self):
+        print('Running test_csv_prefix_dialect')
+        for inputfile in [self.framework.csvreadheaderfile,
+            self.framework.csvreadheaderfile2, self.framework.tsvreadheaderfile]:
+            with open(inputfile, 'rb') as f:
+                prefix = f.read(1000)
+            dialect = csv_prefix_dialect(prefix)
+            expected = csv_file_dialect(inputfile)
+            self.assertEqual(dialect.delimiter, expected.delimiter,
+                'incorrect delimiter detected for prefix of %s' % inputfile)
+            self.assertEqual(dialect.quoting, expected.quoting,
+                'incorrect quoting detected for prefix of %s' % inputfile)
+
+        # Line endings are as they are in the prefix
+        dialect = csv_prefix_dialect(b'"a","b"\r\n1,2\r\n')
+        self.assertEqual(dialect.delimiter, ',')
+        self.assertEqual(dialect.lineterminator, '\r\n')
+        self.assertIsNone(csv_prefix_dialect(b''))
+
+    def test_csv_sniff(self):
+        print('Running test_csv_sniff')
+        # The same dialect as csv_file_dialect() from the file or from its bytes
+        for inputfile in [self.framework.csvreadheaderfile,
+            self.framework.tsvreadheaderfile]:
+            dialect, encoding = csv_sniff(inputfile)
+            self.assertTrue(dialects_equal(dialect, csv_file_dialect(inputfile)),
+                'sniffed dialect does not match file dialect for %s' % inputfile)
+            self.assertEqual(encoding, 'utf-8')
+            with open(inputfile, 'rb') as f:
+                dialect, encoding = csv_sniff(f.read())
+            self.assertEqual(dialect.delimiter,
+                csv_file_dialect(inputfile).delimiter)
+
+        # A sniff result can be given to the file functions
+        dialect, encoding = csv_sniff(self.framework.csvreadheaderfile)
+        header = read_header(self.framework.csvreadheaderfile, dialect, encoding)
+        self.assertEqual(header, read_header(self.framework.csvreadheaderfile))
+
+        # Only the prefix and the sampled blocks are read
+        content = b'id,locality\n' + \
+            b''.join(b'%d,Lima centro\n' % i for i in range(8000)) + \
+            'Perú, Bogotá, Río\n'.encode('latin-1')*20
+        dialect, encoding = csv_sniff(content)
+        self.assertEqual(encoding, 'utf-8')
+        dialect, encoding = csv_sniff(content, samples=3)
+        self.assertEqual(content[-18:].decode(encoding), 'Perú, Bogotá, Río\n')
+        self.assertEqual(dialect.delimiter, ',')
+
+        # A given encoding is not detected
+        dialect, encoding = csv_sniff(content, encoding='latin-1')
+        self.assertEqual(encoding, 'latin-1')
+
+        self.assertEqual(csv_sniff(None), (None, None))
+        self.assertEqual(csv_sniff(self.framework.testdatapath + 'nosuchfile'),
+            (None, None))
+
+    def test_read_sniff_sample(self):
+        print('Running test_read_sniff_sample')
+        content = b''.join(b'%05d\n' % i for i in range(1000))
+        prefix, blocks = read_sniff_sample(io.BytesIO(content), prefixsize=60,
+            samples=4, blocksize=30)
+        self.assertEqual(prefix, content[:60])
+        self.assertEqual(len(blocks), 4)
+        for block in blocks:
+            # Each block has whole lines from the rest of the file
+            self.assertEqual(content.find(b'\n' + block) % 6, 5)
+            self.assertTrue(block.endswith(b'\n'))
+        self.assertEqual(blocks[-1], content[-24:])
+
+        # The whole file is in the prefix
+        prefix, blocks = read_sniff_sample(io.BytesIO(content), samples=4)
+        self.assertEqual(prefix, content)
+        self.assertEqual(blocks, [])
+
+    def test_file_profile(self):
+        print('Running test_file_profile')
+        inputfile = self.framework.csvreadheaderfile
+        profile = file_profile(inputfile)
+        self.assertTrue(profile.current())
+        self.assertEqual(profile.header, read_header(inputfile))
+        self.assertTrue(dialects_equal(profile.dialect, csv_file_dialect(inputfile)))
+        self.assertEqual(profile.encoding, 'utf-8')
+        self.assertEqual(profile.get_rowcount(), 8)
+        self.assertEqual(len(profile.get_record_offsets()), 1)
+
+        # The same profile while the file is unchanged
+        self.assertIs(file_profile(inputfile), profile)
+
+        # The file functions give the same results with the profile
+        self.assertEqual(term_completeness_from_file(inputfile, profile=profile),
+            term_completeness_from_file(inputfile))
+        self.assertEqual(extract_value_counts_from_file(inputfile, ['country'],
+            profile=profile), [('United States', 8)])
+        self.assertEqual(term_rowcount_from_file(inputfile, 'country',
+            profile=profile), 8)
+
+        # A profile of a file that has changed is not used
+        profilefile = self.framework.profilefile
+        with open(profilefile, 'w', newline='', encoding='utf-8') as f:
+            f.write('id,country\r\n1,Peru\r\n')
+        profile = file_profile(profilefile)
+        self.assertEqual(profile.get_rowcount(), 1)
+        with open(profilefile, 'w', newline='', encoding='utf-8') as f:
+            f.write('id\tcountry\tlocality\n1\tPeru\tLima\n2\tChile\tArica\n')
+        self.assertFalse(profile.current())
+        self.assertEqual(read_header(profilefile, profile=profile),
+            ['id', 'country', 'locality'])
+        newprofile = file_profile(profilefile)
+        self.assertIsNot(newprofile, profile)
+        self.assertEqual(newprofile.get_rowcount(), 2)
+        self.assertIsNone(file_profile(self.framework.testdatapath + 'nosuchfile'))
+
+    def test_scan_records(self):
+        print('Running test_scan_records')
+        # Line endings in quoted and escaped values do not end records, empty lines are
+        # not records, and a quote that does not start a value is not a quote.
+        content = 'id,locality,remarks\r\n1,"a\nb",5" long\r\n\r\n' + \
+            '2,x,"q ""y""\r\nz"\r\n3, "s\rt",\\"\n4,Perú,\\\nx\n5,last,x'
+        profilefile = self.framework.profilefile
+        with open(profilefile, 'w', newline='', encoding='utf-8') as f:
+            f.write(content)
+        dialect = csv_dialect()
+        rows = list(read_csv_row(profilefile, dialect, 'utf-8'))
+        self.assertEqual(len(rows), 5)
+
+        rowcount, offsets = scan_records(profilefile, dialect, 'utf-8', interval=2)
+        self.assertEqual(rowcount, 5)
+        data = content.encode('utf-8')
+        self.assertEqual(len(offsets), 3)
+        for i, offset in enumerate(offsets):
+            self.assertTrue(data[offset:].startswith(b'%d,' % (2*i+1)))
+
+        # Records are counted by reading them if the offsets can not be found
+        with open(profilefile, 'w', newline='', encoding='utf-16') as f:
+            f.write(content)
+        self.assertEqual(scan_records(profilefile, dialect, 'utf-16'), (5, None))
+        self.assertEqual(scan_records(None, dialect, 'utf-8'), (None, None))
+
+    def test_read_csv_row_start(self):
+        print('Running test_read_csv_row_start')
+        # Records with quoted line endings, in a file with a byte order mark
+        content = 'id,"locality",remarks\r\n'
+        for i in range(50):
+            content += '%d,"Lima\r\n%d","say ""%d""\n"\r\n' % (i, i, i)
+        profilefile = self.framework.profilefile
+        with open(profilefile, 'w', newline='', encoding='utf-8-sig') as f:
+            f.write(content)
+        profile = FileProfile(profilefile, interval=7)
+        rows = list(read_csv_row(profilefile, profile.dialect, profile.encoding))
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[9]['locality'], 'Lima\r\n9')
+
+        # Starting from the index gives the same rows as reading from the beginning
+        for start, stop in [(0, None), (1, 2), (7, 8), (13, 30), (45, None), (49, 60),
+            (50, None), (20, 10)]:
+            expected = rows[start:stop]
+            for p in [profile, None]:
+                got = list(read_csv_row(profilefile, profile.dialect, profile.encoding,
+                    start=start, stop=stop, profile=p))
+                s = 'rows %s to %s do not match expectation' % (start, stop)
+                self.assertEqual(got, expected, s)
+
+        # The index of a file that has changed is not used
+        with open(profilefile, 'a', newline='', encoding='utf-8') as f:
+            f.write('50,Arica,\r\n')
+        got = list(read_csv_row(profilefile, profile.dialect, profile.encoding, start=49,
+            profile=profile))
+        self.assertEqual([row['id'] for row in got], ['49', '50'])
+
+    def test_record_chunks(self):
+        print('Running test_record_chunks')
+        content = 'id,locality\r\n'
+        for i in range(100):
+            content += '%d,"%s"\r\n' % (i, 'x\n'*(i % 5))
+        profilefile = self.framework.profilefile
+        with open(profilefile, 'w', newline='', encoding='utf-8') as f:
+            f.write(content)
+        profile = file_profile(profilefile, interval=10)
+        self.assertEqual(profile.interval, 10)
+        rows = list(read_csv_row(profilefile, profile.dialect, profile.encoding))
+
+        # The chunks start at indexed records and together hold every record once
+        for chunkcount in [1, 3, 4, 10, 20]:
+            chunks = record_chunks(profile, chunkcount)
+            self.assertLessEqual(len(chunks), chunkcount)
+            self.assertEqual(chunks[0][0], 0)
+            self.assertEqual(chunks[-1][1], 100)
+            chunkrows = []
+            for start, stop in chunks:
+                self.assertEqual(start % 10, 0)
+                chunkrows += list(read_csv_row(profilefile, profile.dialect,
+                    profile.encoding, start=start, stop=stop, profile=profile))
+            self.assertEqual(chunkrows, rows)
+        self.assertEqual(len(record_chunks(profile, 4)), 4)
+
+        # A profile with the index every 10 records is not the one every 20
+        self.assertEqual(file_profile(profilefile, interval=20).interval, 20)
+        self.assertIsNone(record_chunks(None, 2))
+
+        # A profile sent to another process reads the same chunks
+        profile = file_profile(profilefile, interval=10)
+        copy = pickle.loads(pickle.dumps(profile))
+        self.assertEqual(copy.dialect.delimiter, profile.dialect.delimiter)
+        self.assertEqual(list(read_csv_row(profilefile, copy.dialect, copy.encoding,
+            start=30, stop=45, profile=copy)), rows[30:45])
+
+    def test_read_prefix_header(self):
+        print('Running test_read_prefix_header')
+        for inputfile in [self.framework.csvreadheaderfile,
+            self.framework.tsvreadheaderfile]:
+            with open(inputfile, 'rb') as f:
+                prefix = f.read(1000)
+            header = read_prefix_header(prefix)
+            expected = read_header(inputfile)
+            s = 'header (%s) from prefix of %s does not match expectation (%s)' \
+                % (header, inputfile, expected)
+            self.assertEqual(header, expected, s)
+
+        # Quoted fields, with a delimiter and a line ending in them
+        header = read_prefix_header(b'"id","Country, name","loc\r\nality"\r\n1,a')
+        self.assertEqual(header, ['id', 'Country, name', 'loc\r\nality'])
+
+        # Byte order mark
+        header = read_prefix_header(b'\xef\xbb\xbfid,country\n')
+        self.assertEqual(header, ['id', 'country'])
+
+        # Tab-separated
+        header = read_prefix_header(b'id\tcountry\tlocality\r1\tPeru\tLima\r')
+        self.assertEqual(header, ['id', 'country', 'locality'])
+
+        # Not utf-8
+        header = read_prefix_header('Localité,país\r\nx,y\r\n'.encode('latin-1'),
+            encoding='latin-1')
+        self.assertEqual(header, ['Localité', 'país'])
+
+        # The first record must end in the prefix
+        self.assertIsNone(read_prefix_header(b'id,country'))
+        self.assertIsNone(read_prefix_header(b'"id","loc\nality'))
+        self.assertIsNone(read_prefix_header(b'"id","loc\nality\n'))
+        self.assertIsNone(read_prefix_header(b''))
+
     def test_read_header1(self):
         print('Running test_read_header1')
         csvreadheaderfile = self.framework.csvreadheaderfile
@@ -806,6 +1063,16 @@ class DWCAUtilsTestCase(unittest.TestCase):
         s = 'represents_int 1.001 result (%s) does not match expectation (%s)' % (result, expected)
         self.assertEqual(result, expected, s)
     
+    def test_csv_prefix_encoding(self):
+        print('Running test_csv_prefix_encoding')
+        # A prefix with only ASCII in it is taken to be utf-8
+        self.assertEqual(csv_prefix_encoding(b'id,country\n1,Peru\n'), 'utf-8')
+        self.assertEqual(csv_prefix_encoding(b''), 'utf-8')
+        self.assertEqual(csv_prefix_encoding(b'\xef\xbb\xbfid\n'), 'UTF-8-SIG')
+        encoding = csv_prefix_encoding('id,locality\n1,Perú\n'.encode('utf-8'))
+        self.assertEqual(encoding, 'utf-8')
+        self.assertIsNone(csv_prefix_encoding(None))
+
     def test_csv_file_encoding(self):
         print('Running test_csv_file_encoding')
         encodedfile_utf8 = self.framework.encodedfile_utf8
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "dwca_vocab_utils_benchmark.py"
+__version__ = __filename__ + ' ' + "2026-10-18T14:00-03:00"
+
+# This file contains micro-benchmarks for Darwinizing the rows of a file with the
+# functions in dwca_vocab_utils. The rows are those of test_benchmark_10000.csv, repeated
+# to make 100000 dicts. Each benchmark reports dicts per second.
+#
+# Example:
+#
+# PYTHONPATH=../bels python dwca_vocab_utils_benchmark.py
+
+import csv
+import time
+
+from dwca_utils import csv_file_dialect
+from dwca_vocab_utils import darwin_cloud_vocab_dict_from_file
+from dwca_vocab_utils import darwinize_dict
+from dwca_vocab_utils import Darwinizer
+from dwca_vocab_utils import DarwinizePlan
+
+# 2026-10-18 Benchmarks, 100000 dicts of 45 fields
+# darwinize_dict(), vocabulary parsed per call:     159 dicts/s (on 200 dicts)
+# darwinize_dict(), cached vocabulary:            22095 dicts/s
+# Darwinizer.darwinize_dict():                    31366 dicts/s
+#
+# 2026-10-18 Benchmarks, after the DarwinizePlan
+# darwinize_dict(), cached vocabulary:            23642 dicts/s
+# Darwinizer.darwinize_dict():                   151572 dicts/s
+# DarwinizePlan.darwinize_dict():                170465 dicts/s
+
+testdatapath = '../data/tests/'
+vocabpath = '../bels/vocabularies/'
+darwincloudfile = vocabpath + 'darwin_cloud.txt'
+benchmarkfile = testdatapath + 'test_benchmark_10000.csv'
+dictcount = 100000
+uncachedcount = 200
+
+def uncached_darwinize_dict(inputdict):
+    # The work darwinize_dict() did for every call before the vocabulary was cached.
+    csv_file_dialect(darwincloudfile)
+    darwin_cloud_vocab_dict_from_file(darwincloudfile)
+    return darwinize_dict(inputdict, darwincloudfile)
+
+def cached_darwinize_dict(inputdict):
+    return darwinize_dict(inputdict, darwincloudfile)
+
+def benchmark_dicts():
+    with open(benchmarkfile, 'r', encoding='utf-8') as f:
+        rows = [row for row in csv.DictReader(f)]
+    dicts = []
+    while len(dicts) < dictcount:
+        dicts.extend(rows[:dictcount-len(dicts)])
+    return dicts
+
+def dicts_per_second(function, dicts):
+    starttime = time.perf_counter()
+    for inputdict in dicts:
+        function(inputdict)
+    elapsedtime = time.perf_counter()-starttime
+    return len(dicts)/elapsedtime
+
+def main():
+    dicts = benchmark_dicts()
+    print(f'{len(dicts)} dicts of {len(dicts[0])} fields')
+
+    rate = dicts_per_second(uncached_darwinize_dict, dicts[:uncachedcount])
+    print(f'darwinize_dict(), vocabulary parsed per call: {rate:1.0f} dicts/s '
+          f'(on {uncachedcount} dicts)')
+
+    rate = dicts_per_second(cached_darwinize_dict, dicts)
+    print(f'darwinize_dict(), cached vocabulary: {rate:1.0f} dicts/s')
+
+    darwinizer = Darwinizer(darwincloudfile)
+    rate = dicts_per_second(darwinizer.darwinize_dict, dicts)
+    print(f'Darwinizer.darwinize_dict(): {rate:1.0f} dicts/s')
+
+    plan = DarwinizePlan(list(dicts[0]), darwincloudfile)
+    rate = dicts_per_second(plan.darwinize_dict, dicts)
+    print(f'DarwinizePlan.darwinize_dict(): {rate:1.0f} dicts/s')
+
+if __name__ == '__main__':
+    print('=== dwca_vocab_utils_benchmark.py ===')
+    main()
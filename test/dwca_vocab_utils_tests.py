@@ -16,7 +16,7 @@
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = "dwca_vocab_utils_tests.py"
-__version__ = __filename__ + ' ' + "2022-06-09T00:21-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T14:00-03:00"
 __adapted_from__ = "https://github.com/kurator-org/kurator-validation/blob/master/packages/kurator_dwca/test/dwca_vocab_utils_test.py"
 
 # This file contains unit tests for the functions in dwca_vocab_utils.
@@ -26,6 +26,7 @@ __adapted_from__ = "https://github.com/kurator-org/kurator-validation/blob/maste
 # python dwca_vocab_utils_tests.py
 
 import os
+import shutil
 import unittest
 import csv
 
@@ -34,9 +35,11 @@ from dwca_terms import geogkeytermlist
 from dwca_terms import vocabfieldlist
 from dwca_utils import csv_dialect
 from dwca_utils import extract_values_from_file
+from dwca_utils import lower_dict_keys
 from dwca_utils import read_header
 from dwca_utils import tsv_dialect
 from dwca_utils import ustripstr
+from dwca_vocab_utils import cached_darwin_cloud_vocab_dict
 from dwca_vocab_utils import compose_dict_from_key
 from dwca_vocab_utils import compose_key_from_list
 from dwca_vocab_utils import compose_key_from_row
@@ -44,6 +47,7 @@ from dwca_vocab_utils import darwin_cloud_vocab_dict_from_file
 from dwca_vocab_utils import darwinize_list
 from dwca_vocab_utils import darwinize_dict
 from dwca_vocab_utils import Darwinizer
+from dwca_vocab_utils import DarwinizePlan
 from dwca_vocab_utils import distinct_vocabs_to_file
 from dwca_vocab_utils import matching_vocab_dict_from_file
 from dwca_vocab_utils import missing_vocab_list_from_file
@@ -80,6 +84,8 @@ class DWCAVocabUtilsTestFramework():
     recommendedreporttestfile = testdatapath + 'test_term_recommended_report.txt'
     termcountreporttestfile = testdatapath + 'test_term_count_report.txt'
     counttestfile = testdatapath + 'test_three_specimen_records.txt'
+    darwincloudcopyfile = testdatapath + 'test_darwin_cloud_copy.txt'
+    benchmarkfile = testdatapath + 'test_benchmark_1000.csv'
 
     def dispose(self):
         tsvfromcsvfile1 = self.tsvfromcsvfile1
@@ -97,6 +103,8 @@ class DWCAVocabUtilsTestFramework():
             os.remove(termcountreporttestfile)
         if os.path.isfile(testvocabfile):
             os.remove(testvocabfile)
+        if os.path.isfile(self.darwincloudcopyfile):
+            os.remove(self.darwincloudcopyfile)
         return True
 
 class DWCAVocabUtilsTestCase(unittest.TestCase):
@@ -673,6 +681,34 @@ class DWCAVocabUtilsTestCase(unittest.TestCase):
         s += 'in entry %s' % entry
         self.assertEqual(seek, expected, s)
 
+    def test_cached_darwin_cloud_vocab_dict(self):
+        print('Running test_cached_darwin_cloud_vocab_dict')
+        darwincloudfile = self.framework.darwincloudcopyfile
+        shutil.copyfile(self.framework.darwincloudfile, darwincloudfile)
+
+        clouddict = cached_darwin_cloud_vocab_dict(darwincloudfile)
+        self.assertEqual(clouddict, darwin_cloud_vocab_dict_from_file(darwincloudfile))
+        self.assertNotIn('CACHETESTTERM', clouddict)
+
+        # The vocabulary is not loaded again while the file is unchanged
+        self.assertIs(cached_darwin_cloud_vocab_dict(darwincloudfile), clouddict)
+        self.assertIs(Darwinizer(darwincloudfile).darwinclouddict, clouddict)
+
+        # The vocabulary is loaded again after the file changes
+        with open(darwincloudfile, 'a', encoding='utf-8') as f:
+            f.write('\r\nCACHETESTTERM\tlocality\t1\tdwc\t\t')
+        stat = os.stat(darwincloudfile)
+        os.utime(darwincloudfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        newclouddict = cached_darwin_cloud_vocab_dict(darwincloudfile)
+        self.assertIsNot(newclouddict, clouddict)
+        self.assertEqual(newclouddict['CACHETESTTERM']['standard'], 'locality')
+        result = darwinize_list(['cachetestterm'], darwincloudfile)
+        self.assertEqual(result, ['locality'])
+        result = darwinize_dict({'CacheTestTerm':'here'}, darwincloudfile)
+        self.assertEqual(result, {'locality':'here'})
+
+        self.assertIsNone(cached_darwin_cloud_vocab_dict('nosuchfile.txt'))
+
     def test_darwinizer(self):
         print('Running test_darwinizer')
         darwincloudfile = self.framework.darwincloudfile
@@ -684,7 +720,49 @@ class DWCAVocabUtilsTestCase(unittest.TestCase):
         
         s = f'Output\n{outputdict}\ndoes not match expected\n{expected}'
         self.assertEqual(outputdict, expected, s)
+
+        # The default vocabulary is the Darwin Cloud distributed with bels
+        darwinizer = Darwinizer()
+        outputdict = darwinizer.darwinize_dict(inputdict)
+        self.assertEqual(outputdict, expected, s)
         
+    def test_darwinize_plan(self):
+        print('Running test_darwinize_plan')
+        darwincloudfile = self.framework.darwincloudfile
+        darwinizer = Darwinizer(darwincloudfile)
+
+        header = ["", " ", "Collector", "año", "SPECIAL ", "Id", "v_continent"]
+        plan = DarwinizePlan(header, darwincloudfile)
+        expected = ["UNNAMED_COLUMN_1", "UNNAMED_COLUMN_2", "recordedBy", "year", 
+            "SPECIAL", "Id", "continent"]
+        self.assertEqual(plan.fieldnames, expected)
+        plan = DarwinizePlan(header, darwincloudfile, namespace=True, case='l')
+        expected = ["unnamed_column_1", "unnamed_column_2", "dwc:recordedby", "dwc:year", 
+            "special", "id", "dwc:continent"]
+        self.assertEqual(plan.fieldnames, expected)
+
+        # Rows missing values get None, as from csv.DictReader
+        plan = darwinizer.plan(header)
+        outputdict = plan.darwinize_row(['1', '2', '3'])
+        expected = {"UNNAMED_COLUMN_1":"1", "UNNAMED_COLUMN_2":"2", "recordedBy":"3", 
+            "year":None, "SPECIAL":None, "Id":None, "continent":None}
+        self.assertEqual(outputdict, expected)
+
+        # A dict with other keys is still Darwinized correctly
+        outputdict = plan.darwinize_dict({"Collector":"3", "":"1"})
+        self.assertEqual(outputdict, {"recordedBy":"3", "UNNAMED_COLUMN_1":"1"})
+
+        # Same results as darwinize_dict() and Darwinizer for the rows of a file
+        with open(self.framework.benchmarkfile, 'r', encoding='utf-8') as f:
+            rows = [row for row in csv.DictReader(f)]
+        plan = DarwinizePlan(list(rows[0]), darwincloudfile)
+        lowerplan = DarwinizePlan(list(rows[0]), darwincloudfile, case='l')
+        for row in rows:
+            self.assertEqual(plan.darwinize_dict(row), darwinizer.darwinize_dict(row))
+            self.assertEqual(lowerplan.darwinize_dict(row), 
+                lower_dict_keys(darwinize_dict(row, darwincloudfile)))
+        self.assertEqual(len(darwinizer.plans), 1)
+
 if __name__ == '__main__':
     print('=== dwca_vocab_utils_test.py ===')
     #setup_actor_logging({'loglevel':'DEBUG'})
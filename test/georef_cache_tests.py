@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "georef_cache_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:57-03:00"
+
+# This file contains unit tests for the functions in georef_cache.
+#
+# Example:
+#
+# python georef_cache_tests.py
+
+import os
+import time
+import unittest
+
+from georef_cache import CachedGeorefStore
+from georef_cache import georef_cache_key
+from georef_cache import GeorefCache
+from georef_cache import georef_store_version
+from georef_cache import MemoryGeorefCache
+from georef_cache import SQLiteGeorefCache
+from georef_store import GeorefStore
+from georef_store import load_georef_store
+from georef_store import SQLiteGeorefStore
+
+class CountingGeorefStore(GeorefStore):
+    # A GeorefStore that answers from another store and keeps the lookups it was
+    # asked to do.
+    def __init__(self, store):
+        self.store = store
+        self.lookups = []
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        self.lookups.append((matchtype, matchstr))
+        return self.store.get_best_georef_reduced(matchtype, matchstr)
+
+class GeorefCacheTestFramework():
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+
+    # following are files used as input during the tests, don't remove these
+    sanscoordsfile = testdatapath + 'test_matchme_sans_coords_best_georef.csv'
+
+    # following are files output during the tests, remove these in dispose()
+    storefile = testdatapath + 'test_georef_cache_store.db'
+    cachefile = testdatapath + 'test_georef_cache.db'
+
+    def dispose(self):
+        for file in [self.storefile, self.cachefile, self.cachefile + '-wal',
+            self.cachefile + '-shm']:
+            if os.path.isfile(file):
+                os.remove(file)
+        return True
+
+class GeorefCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.framework = GeorefCacheTestFramework()
+        self.framework.dispose()
+        load_georef_store(self.framework.storefile, 'sans_coords',
+            [self.framework.sanscoordsfile])
+        self.store = SQLiteGeorefStore(self.framework.storefile)
+
+    def tearDown(self):
+        self.store.close()
+        self.framework.dispose()
+        self.framework = None
+
+    def check_cache(self, cache):
+        # LRU and negative caching behave the same in every kind of cache
+        georef = {'bels_match_string': 'a', 'bels_decimallatitude': 1.5}
+        key = georef_cache_key('sans_coords', 'a')
+        self.assertEqual(cache.lookup(key), (False, None))
+        cache.store(key, georef)
+        self.assertEqual(cache.lookup(key), (True, georef))
+        cache.store(georef_cache_key('sans_coords', 'b'), None)
+        self.assertEqual(cache.lookup(georef_cache_key('sans_coords', 'b')), (True, None))
+        # Another version of the gazetteer has other keys
+        self.assertEqual(cache.lookup(georef_cache_key('sans_coords', 'a', 'v2')),
+            (False, None))
+
+        # 'a' was used after 'b', so 'b' is evicted first
+        cache.lookup(key)
+        cache.store(georef_cache_key('sans_coords', 'c'), None)
+        self.assertEqual(cache.size(), 3)
+        cache.store(georef_cache_key('sans_coords', 'd'), None)
+        self.assertEqual(cache.size(), 3)
+        self.assertEqual(cache.lookup(georef_cache_key('sans_coords', 'b')),
+            (False, None))
+        self.assertEqual(cache.lookup(key), (True, georef))
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['negative_hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['sets'], 4)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 3)
+        self.assertEqual(stats['maxsize'], 3)
+        self.assertEqual(stats['hit_rate'], 4/7)
+
+    def test_georef_cache_interface(self):
+        print('Running test_georef_cache_interface')
+        # A GeorefCache that does not provide lookup(), store() and size() can not be 
+        # made
+        class IncompleteGeorefCache(GeorefCache):
+            def lookup(self, key):
+                return (False, None)
+        with self.assertRaises(TypeError):
+            GeorefCache()
+        with self.assertRaises(TypeError):
+            IncompleteGeorefCache()
+
+    def test_memory_georef_cache(self):
+        print('Running test_memory_georef_cache')
+        self.check_cache(MemoryGeorefCache(maxsize=3))
+
+        # Entries expire after ttl seconds
+        cache = MemoryGeorefCache(ttl=0.05)
+        key = georef_cache_key('sans_coords', 'a')
+        cache.store(key, None)
+        self.assertEqual(cache.lookup(key), (True, None))
+        time.sleep(0.1)
+        self.assertEqual(cache.lookup(key), (False, None))
+        self.assertEqual(cache.get_stats()['expirations'], 1)
+        self.assertEqual(cache.size(), 0)
+
+        # Changes to a result do not change the cached result
+        cache = MemoryGeorefCache()
+        georef = {'bels_match_string': 'a'}
+        cache.store(key, georef)
+        georef['bels_match_string'] = 'b'
+        found, result = cache.lookup(key)
+        result['bels_match_string'] = 'c'
+        self.assertEqual(cache.lookup(key), (True, {'bels_match_string': 'a'}))
+
+    def test_sqlite_georef_cache(self):
+        print('Running test_sqlite_georef_cache')
+        cache = SQLiteGeorefCache(self.framework.cachefile, maxsize=3)
+        self.check_cache(cache)
+        # Another connection to the same file, as from another process, sees the entries
+        othercache = SQLiteGeorefCache(self.framework.cachefile, maxsize=3)
+        key = georef_cache_key('sans_coords', 'a')
+        self.assertEqual(othercache.lookup(key)[0], True)
+        othercache.store(georef_cache_key('sans_coords', 'e'), {'bels_match_string': 'e'})
+        self.assertEqual(cache.lookup(georef_cache_key('sans_coords', 'e')),
+            (True, {'bels_match_string': 'e'}))
+        othercache.close()
+        cache.close()
+
+        cache = SQLiteGeorefCache(self.framework.cachefile, ttl=-1)
+        cache.store(key, None)
+        self.assertEqual(cache.lookup(key), (False, None))
+        self.assertEqual(cache.get_stats()['expirations'], 1)
+        cache.close()
+
+    def test_georef_store_version(self):
+        print('Running test_georef_store_version')
+        self.assertIsNone(georef_store_version(None))
+        self.assertIsNone(georef_store_version(''))
+        self.assertIsNone(georef_store_version(self.framework.cachefile))
+        version = georef_store_version(self.framework.storefile)
+        self.assertIsNotNone(version)
+        self.assertEqual(georef_store_version(self.framework.storefile), version)
+
+        # Rebuilding the store changes its version
+        stat = os.stat(self.framework.storefile)
+        os.utime(self.framework.storefile,
+            ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertNotEqual(georef_store_version(self.framework.storefile), version)
+
+    def test_cached_georef_store(self):
+        print('Running test_cached_georef_store')
+        for cache in [MemoryGeorefCache(),
+            SQLiteGeorefCache(self.framework.cachefile)]:
+            countingstore = CountingGeorefStore(self.store)
+            store = CachedGeorefStore(countingstore, cache, version='2026-10-18')
+            target = self.store.get_best_sans_coords_georef_reduced('dkelbaekskov')
+            self.assertIsNotNone(target)
+            for i in range(3):
+                self.assertEqual(store.get_best_sans_coords_georef_reduced(
+                    'dkelbaekskov'), target)
+                self.assertIsNone(store.get_best_sans_coords_georef_reduced(
+                    'nosuchlocation'))
+            # Only the first lookups, including the miss, went to the store
+            self.assertEqual(countingstore.lookups, [('sans_coords', 'dkelbaekskov'),
+                ('sans_coords', 'nosuchlocation')])
+
+            # Batched lookups only go to the store for match strings not in the cache
+            matchstrs = ['dkelbaekskov', 'usvirginianewkentcountywestpoint',
+                'nosuchlocation', 'otherlocation', 'dkelbaekskov']
+            result = store.get_best_georefs_reduced('sans_coords', matchstrs)
+            self.assertEqual(result, self.store.get_best_georefs_reduced('sans_coords',
+                matchstrs))
+            self.assertEqual(countingstore.lookups[2:], [
+                ('sans_coords', 'usvirginianewkentcountywestpoint'),
+                ('sans_coords', 'otherlocation')])
+            store.get_best_georefs_reduced('sans_coords', matchstrs)
+            self.assertEqual(len(countingstore.lookups), 4)
+
+            stats = store.get_stats()
+            self.assertEqual(stats['version'], '2026-10-18')
+            self.assertEqual(stats['misses'], 4)
+            self.assertEqual(stats['sets'], 4)
+            cache.close()
+
+if __name__ == '__main__':
+    print('=== georef_cache_tests.py ===')
+    unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "georef_script_benchmark.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
+
+# This file contains a benchmark of the georeference script of process_import_table() in
+# BigQuery, comparing the tiers resolved in a single pass (georefs_clause()) with the 
+# tiers appended one after the other with NOT IN anti-joins, as the script used to do.
+# The single pass script is also run with the match strings made with built-in SQL 
+# functions (match_sql.py) instead of the JavaScript UDFs. Each benchmark file in Google
+# Cloud Storage is imported into BigQuery once and every script is run on it. The 
+# benchmark reports the bytes processed, the slot time and the elapsed time of each 
+# script and the number of rows matched on each tier, which must be the same for the 
+# anti-join and the single pass. The SQL match strings have the separators that the 
+# gazetteer match strings have, which the UDF match strings lack, so their tier counts
+# can be higher.
+#
+# Run it with credentials for the localityservice project, with the benchmark files in 
+# gcspath, and record the results here with the date, as in job_test.py.
+#
+# Example:
+#
+# PYTHONPATH=../bels python georef_script_benchmark.py
+
+import logging
+import time
+
+from google.cloud import bigquery
+
+from bels_query import BQ_OUTPUT_DATASET
+from bels_query import BQ_PROJECT
+from bels_query import bigquerify_header
+from bels_query import country_fields
+from bels_query import delete_table
+from bels_query import import_table
+from bels_query import process_import_table_script
+from dwca_vocab_utils import darwinize_list
+
+testdatapath = '../data/tests/'
+dwccloudfile = '../bels/vocabularies/darwin_cloud.txt'
+benchmarkfiles = ['test_benchmark_10000.csv', 'test_benchmark_100000.csv']
+# The 100000-row file is only in Cloud Storage. The benchmark files from 100 rows up have
+# the same header, so it is read from a local one.
+headerfile = 'test_benchmark_10000.csv'
+gcspath = 'gs://localityservice/jobs/'
+
+# The part of the script that made the table georefs before georefs_clause()
+antijoingeorefsclause = \
+"""
+-- CREATE table georefs from matchme_with_coords
+CREATE TEMP TABLE georefs AS (
+SELECT
+  a.bels_id,
+  interpreted_decimallatitude AS bels_decimallatitude,
+  interpreted_decimallongitude AS bels_decimallongitude,
+  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
+  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
+  v_georeferencedby AS bels_georeferencedby,
+  v_georeferenceddate AS bels_georeferenceddate,
+  v_georeferenceprotocol AS bels_georeferenceprotocol,
+  v_georeferencesources AS bels_georeferencesources,
+  v_georeferenceremarks AS bels_georeferenceremarks,
+  georef_score AS bels_georeference_score,
+  source AS bels_georeference_source,
+  georef_count AS bels_best_of_n_georeferences,
+  'match using coords' AS bels_match_type
+FROM
+  matcher a,
+  `localityservice.gazetteer.matchme_with_coords_best_georef` b
+WHERE
+  a.bels_matchwithcoords=b.matchme_with_coords
+);
+
+-- APPEND verbatim coords matches to georefs
+INSERT INTO georefs (
+SELECT
+  a.bels_id,
+  interpreted_decimallatitude AS bels_decimallatitude,
+  interpreted_decimallongitude AS bels_decimallongitude,
+  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
+  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
+  v_georeferencedby AS bels_georeferencedby,
+  v_georeferenceddate AS bels_georeferenceddate,
+  v_georeferenceprotocol AS bels_georeferenceprotocol,
+  v_georeferencesources AS bels_georeferencesources,
+  v_georeferenceremarks AS bels_georeferenceremarks,
+  georef_score AS bels_georeference_score,
+  source AS bels_georeference_source,
+  georef_count AS bels_best_of_n_georeferences,
+  'match using verbatim coords' AS bels_match_type
+FROM
+  matcher a,
+  `localityservice.gazetteer.matchme_verbatimcoords_best_georef` b
+WHERE
+  a.bels_matchverbatimcoords=b.matchme AND
+  a.bels_id NOT IN (
+SELECT 
+  bels_id
+FROM georefs
+)
+);
+
+-- APPEND sans coords matches to georefs
+INSERT INTO georefs (
+SELECT
+  a.bels_id,
+  interpreted_decimallatitude AS bels_decimallatitude,
+  interpreted_decimallongitude AS bels_decimallongitude,
+  IF(interpreted_decimallatitude IS NULL,NULL,'epsg:4326') AS bels_geodeticdatum,
+  SAFE_CAST(round(unc_numeric,0) AS INT64) AS bels_coordinateuncertaintyinmeters,
+  v_georeferencedby AS bels_georeferencedby,
+  v_georeferenceddate AS bels_georeferenceddate,
+  v_georeferenceprotocol AS bels_georeferenceprotocol,
+  v_georeferencesources AS bels_georeferencesources,
+  v_georeferenceremarks AS bels_georeferenceremarks,
+  georef_score AS bels_georeference_score,
+  source AS bels_georeference_source,
+  georef_count AS bels_best_of_n_georeferences,
+  'match sans coords' AS bels_match_type
+FROM
+  matcher a,
+  `localityservice.gazetteer.matchme_sans_coords_best_georef` b
+WHERE
+  a.bels_matchsanscoords=b.matchme_sans_coords AND
+  a.bels_id NOT IN (
+SELECT 
+  bels_id
+FROM georefs
+)
+);
+"""
+
+def file_header(filename):
+    # Get the Darwinized, BigQuery-compatible header of a local benchmark file.
+    with open(testdatapath + filename, 'r', encoding='utf-8') as f:
+        header = f.readline().strip().split(',')
+    return bigquerify_header(darwinize_list(header, dwccloudfile, case='l'))
+
+def tier_counts(bq_client, table_id):
+    # Get the number of rows matched on each tier in an output table.
+    query = f"""SELECT bels_match_type, COUNT(*) AS count FROM `{table_id}` 
+GROUP BY bels_match_type ORDER BY bels_match_type"""
+    return {row['bels_match_type']: row['count'] 
+        for row in bq_client.query(query).result()}
+
+def run_script(bq_client, input_table_id, output_table_id, countryfieldlist, 
+    georefsclause=None, header=None):
+    query = process_import_table_script(input_table_id, output_table_id, 
+        countryfieldlist, georefsclause, header)
+    starttime = time.perf_counter()
+    query_job = bq_client.query(query)
+    query_job.result()
+    elapsed = time.perf_counter() - starttime
+    return query_job.total_bytes_processed, query_job.slot_millis, elapsed
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    bq_client = bigquery.Client()
+    header = file_header(headerfile)
+    for filename in benchmarkfiles:
+        countryfieldlist = country_fields(header)
+        table_name = filename.split('.')[0]
+        input_table_id = import_table(bq_client, gcspath + filename, header, 
+            table_name=table_name)
+        counts = {}
+        for name, georefsclause, matchheader in [
+            ('anti-join', antijoingeorefsclause, None), ('single pass', None, None),
+            ('SQL matcher', None, header)]:
+            output_table_id = f'{BQ_PROJECT}.{BQ_OUTPUT_DATASET}.{table_name}_' + \
+                name.replace(' ', '_').replace('-', '_')
+            bytes_processed, slot_millis, elapsed = run_script(bq_client, 
+                input_table_id, output_table_id, countryfieldlist, georefsclause, 
+                matchheader)
+            print(f'{table_name}: {name}: bytes {bytes_processed} '
+                f'slot ms {slot_millis} elapsed {elapsed:1.3f}s')
+            counts[name] = tier_counts(bq_client, output_table_id)
+            delete_table(bq_client, output_table_id)
+        print(f'{table_name}: tier counts {counts["single pass"]}')
+        print(f'{table_name}: SQL matcher tier counts {counts["SQL matcher"]}')
+        if counts['anti-join'] != counts['single pass']:
+            print(f'{table_name}: tier counts differ: {counts}')
+        delete_table(bq_client, input_table_id)
+
+if __name__ == '__main__':
+    print('=== georef_script_benchmark.py ===')
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "georef_store_benchmark.py"
+__version__ = __filename__ + ' ' + "2026-10-18T17:50-03:00"
+
+# This file contains a benchmark of the latency of finding the best georeference for a
+# Location with resolve_best_georef(), looking up the match tiers one after the other
+# and all at once. The lookups are done in a local SQLite store of the test exports of
+# the gazetteer tables behind a stand-in that adds the latency of a remote lookup (log
+# normal, median LOOKUP_LATENCY seconds) to each lookup. The requests are a mix of
+# Locations that match on each tier and Locations that match on none. The benchmark
+# reports the p50 and p99 latency per request.
+#
+# Example:
+#
+# PYTHONPATH=../bels python georef_store_benchmark.py
+
+import csv
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from georef_store import GeorefStore
+from georef_store import load_georef_store
+from georef_store import resolve_best_georef
+from georef_store import SQLiteGeorefStore
+
+# 2026-10-18 Benchmarks, 200 requests, median lookup latency 0.020s
+# one tier at a time:  p50 0.052s  p99 0.115s
+# all tiers at once:   p50 0.028s  p99 0.068s
+
+testdatapath = '../data/tests/'
+storefile = testdatapath + 'test_georef_store_benchmark.db'
+exportfiles = [
+    ('sans_coords', testdatapath + 'test_matchme_sans_coords_best_georef.csv',
+        'matchme_sans_coords'),
+    ('verbatim_coords', testdatapath + 'test_matchme_verbatim_coords_best_georef.csv',
+        'matchme'),
+    ('with_coords', testdatapath + 'test_matchme_with_coords_best_georef.csv',
+        'matchme_with_coords')]
+requestcount = 200
+LOOKUP_LATENCY = 0.02
+
+class LatencyGeorefStore(GeorefStore):
+    # A stand-in for a remote GeorefStore that answers from a local store after a
+    # random delay.
+    def __init__(self, store, latency, seed=0):
+        self.store = store
+        self.latency = latency
+        self.random = random.Random(seed)
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        time.sleep(self.latency*self.random.lognormvariate(0, 0.5))
+        return self.store.get_best_georef_reduced(matchtype, matchstr)
+
+def benchmark_requests():
+    # The match tiers for Locations that have coordinates and verbatim coordinates, and
+    # match on each of the tiers, or on none of them.
+    matchstrs = {}
+    for matchtype, exportfile, matchfield in exportfiles:
+        with open(exportfile, 'r', encoding='utf-8') as f:
+            matchstrs[matchtype] = [row[matchfield] for row in csv.DictReader(f)]
+    requests = []
+    rand = random.Random(1)
+    for i in range(requestcount):
+        hit = ['with_coords', 'verbatim_coords', 'sans_coords', None][i % 4]
+        tiers = []
+        for matchtype in ['with_coords', 'verbatim_coords', 'sans_coords']:
+            if matchtype == hit:
+                tiers.append((matchtype, rand.choice(matchstrs[matchtype])))
+            else:
+                tiers.append((matchtype, f'nosuchlocation{i}'))
+        requests.append(tiers)
+    return requests
+
+def latencies(store, requests, executor=None):
+    times = []
+    for tiers in requests:
+        starttime = time.perf_counter()
+        resolve_best_georef(store, tiers, executor)
+        times.append(time.perf_counter()-starttime)
+    times.sort()
+    return times[len(times)//2], times[int(len(times)*0.99)]
+
+def main():
+    if os.path.isfile(storefile):
+        os.remove(storefile)
+    for matchtype, exportfile, matchfield in exportfiles:
+        load_georef_store(storefile, matchtype, [exportfile])
+    store = SQLiteGeorefStore(storefile)
+    requests = benchmark_requests()
+    print(f'{len(requests)} requests, median lookup latency {LOOKUP_LATENCY:1.3f}s')
+
+    p50, p99 = latencies(LatencyGeorefStore(store, LOOKUP_LATENCY), requests)
+    print(f'one tier at a time: p50 {p50:1.3f}s p99 {p99:1.3f}s')
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        p50, p99 = latencies(LatencyGeorefStore(store, LOOKUP_LATENCY), requests,
+            executor)
+    print(f'all tiers at once: p50 {p50:1.3f}s p99 {p99:1.3f}s')
+
+    store.close()
+    os.remove(storefile)
+
+if __name__ == '__main__':
+    print('=== georef_store_benchmark.py ===')
+    main()
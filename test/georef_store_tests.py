@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "georef_store_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:57-03:00"
+
+# This file contains unit tests for the functions in georef_store.
+#
+# Example:
+#
+# python georef_store_tests.py
+
+import csv
+import gzip
+import os
+import shutil
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import georef_store
+from georef_store import build_georef_index
+from georef_store import load_georef_store
+from georef_store import match_string_hash
+from georef_store import MmapGeorefStore
+from georef_store import matchtypelist
+from georef_store import open_georef_store
+from georef_store import GeorefStore
+from georef_store import reducedgeoreffieldlist
+from georef_store import resolve_best_georef
+from georef_store import resolve_best_georefs
+from georef_store import SQLiteGeorefStore
+
+class GeorefStoreTestFramework():
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+
+    # following are files used as input during the tests, don't remove these
+    sanscoordsfile = testdatapath + 'test_matchme_sans_coords_best_georef.csv'
+    verbatimcoordsfile = testdatapath + 'test_matchme_verbatim_coords_best_georef.csv'
+    withcoordsfile = testdatapath + 'test_matchme_with_coords_best_georef.csv'
+
+    # following are files output during the tests, remove these in dispose()
+    storefile = testdatapath + 'test_georef_store.db'
+    gzipfile = testdatapath + 'test_matchme_sans_coords_best_georef.csv.gz'
+    indexdir = testdatapath + 'test_georef_index'
+    collisionfile = testdatapath + 'test_georef_collisions.csv'
+
+    def dispose(self):
+        for file in [self.storefile, self.gzipfile, self.collisionfile]:
+            if os.path.isfile(file):
+                os.remove(file)
+        if os.path.isdir(self.indexdir):
+            shutil.rmtree(self.indexdir)
+        return True
+
+class DelayedGeorefStore(GeorefStore):
+    # A GeorefStore that answers from another store after a delay for each match type,
+    # and keeps the lookups it was asked to do.
+    def __init__(self, store, delays):
+        self.store = store
+        self.delays = delays
+        self.lookups = []
+        self.lock = threading.Lock()
+
+    def get_best_georef_reduced(self, matchtype, matchstr):
+        with self.lock:
+            self.lookups.append(matchtype)
+        time.sleep(self.delays.get(matchtype, 0))
+        return self.store.get_best_georef_reduced(matchtype, matchstr)
+
+    def get_best_georefs_reduced(self, matchtype, matchstrs):
+        with self.lock:
+            self.lookups.append((matchtype, list(matchstrs)))
+        return self.store.get_best_georefs_reduced(matchtype, matchstrs)
+
+class GeorefStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.framework = GeorefStoreTestFramework()
+        self.framework.dispose()
+
+    def tearDown(self):
+        self.framework.dispose()
+        self.framework = None
+
+    def load_test_store(self):
+        storefile = self.framework.storefile
+        for matchtype, inputfile in [
+            ('sans_coords', self.framework.sanscoordsfile),
+            ('verbatim_coords', self.framework.verbatimcoordsfile),
+            ('with_coords', self.framework.withcoordsfile)]:
+            rowcount = load_georef_store(storefile, matchtype, [inputfile])
+            self.assertEqual(rowcount, 10)
+        return SQLiteGeorefStore(storefile)
+
+    def test_georef_store_interface(self):
+        print('Running test_georef_store_interface')
+        # A GeorefStore that does not provide get_best_georef_reduced() can not be made
+        class IncompleteGeorefStore(GeorefStore):
+            def get_best_georefs_reduced(self, matchtype, matchstrs):
+                return {}
+        with self.assertRaises(TypeError):
+            GeorefStore()
+        with self.assertRaises(TypeError):
+            IncompleteGeorefStore()
+
+    def test_load_georef_store(self):
+        print('Running test_load_georef_store')
+        storefile = self.framework.storefile
+        self.assertIsNone(load_georef_store(storefile, 'nonsense',
+            [self.framework.sanscoordsfile]))
+        self.assertIsNone(load_georef_store(storefile, 'sans_coords',
+            ['nosuchfile.csv']))
+
+        store = self.load_test_store()
+        matchstr = 'northamericauswisconsinrichlandco5milesseofrichlandcenter'
+        result = store.get_best_sans_coords_georef_reduced(matchstr)
+        target = {
+            'bels_countrycode': 'US',
+            'bels_match_string': matchstr,
+            'bels_decimallatitude': 43.285569,
+            'bels_decimallongitude': -90.320967,
+            'bels_geodeticdatum':'epsg:4326',
+            'bels_coordinateuncertaintyinmeters': 969,
+            'bels_georeferencedby': None,
+            'bels_georeferenceddate': '2020-03-20',
+            'bels_georeferenceprotocol': 'GEOLocate Web Application',
+            'bels_georeferencesources': 'GEOLocate Batch Processing Tool',
+            'bels_georeferenceremarks': None,
+            'bels_georeference_score': 28,
+            'bels_georeference_source': None,
+            'bels_best_of_n_georeferences': 1,
+            'bels_match_type':'match sans coords'
+        }
+        self.assertEqual(result, target)
+        self.assertEqual(list(result), reducedgeoreffieldlist)
+
+        # Loading again replaces the existing entries
+        store.close()
+        rowcount = load_georef_store(storefile, 'sans_coords',
+            [self.framework.sanscoordsfile])
+        self.assertEqual(rowcount, 10)
+        store = SQLiteGeorefStore(storefile)
+        self.assertEqual(store.get_best_sans_coords_georef_reduced(matchstr), target)
+        store.close()
+
+    def test_load_georef_store_gzip(self):
+        print('Running test_load_georef_store_gzip')
+        with open(self.framework.sanscoordsfile, 'rb') as f:
+            with gzip.open(self.framework.gzipfile, 'wb') as g:
+                shutil.copyfileobj(f, g)
+        storefile = self.framework.storefile
+        rowcount = load_georef_store(storefile, 'sans_coords',
+            [self.framework.gzipfile])
+        self.assertEqual(rowcount, 10)
+        store = SQLiteGeorefStore(storefile)
+        result = store.get_best_sans_coords_georef_reduced('dkelbaekskov')
+        self.assertEqual(result['bels_coordinateuncertaintyinmeters'], 5000)
+        # Tables not loaded have no georeferences
+        self.assertIsNone(store.get_best_with_coords_georef_reduced('dkelbaekskov'))
+        store.close()
+
+    def test_sqlite_georef_store(self):
+        print('Running test_sqlite_georef_store')
+        store = self.load_test_store()
+        for matchtype, inputfile, matchfield, bels_match_type in [
+            ('sans_coords', self.framework.sanscoordsfile, 'matchme_sans_coords',
+                'match sans coords'),
+            ('verbatim_coords', self.framework.verbatimcoordsfile, 'matchme',
+                'match using verbatim coords'),
+            ('with_coords', self.framework.withcoordsfile, 'matchme_with_coords',
+                'match with coords')]:
+            with open(inputfile, 'r', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    matchstr = row[matchfield]
+                    result = store.get_best_georef_reduced(matchtype, matchstr)
+                    self.assertEqual(result['bels_match_string'], matchstr)
+                    self.assertEqual(result['bels_match_type'], bels_match_type)
+                    self.assertEqual(result['bels_countrycode'],
+                        row['best_interpreted_countrycode'])
+                    self.assertEqual(result['bels_georeference_score'],
+                        int(row['georef_score']))
+
+        self.assertIsNone(store.get_best_sans_coords_georef_reduced('nosuchlocation'))
+        self.assertIsNone(store.get_best_georef_reduced('nonsense', 'dkelbaekskov'))
+        result = store.get_best_with_verbatim_coords_georef_reduced(
+            'usvirginianewkentcountywestpoint')
+        self.assertEqual(result['bels_decimallatitude'], 37.476215)
+
+        # Batched lookups give the same results, for match strings that have one
+        with open(self.framework.sanscoordsfile, 'r', encoding='utf-8') as f:
+            matchstrs = [row['matchme_sans_coords'] for row in csv.DictReader(f)]
+        result = store.get_best_georefs_reduced('sans_coords', 
+            matchstrs + matchstrs[:2] + ['nosuchlocation', None])
+        self.assertEqual(list(result), matchstrs)
+        for matchstr in matchstrs:
+            self.assertEqual(result[matchstr], 
+                store.get_best_sans_coords_georef_reduced(matchstr))
+        store.close()
+
+    def test_mmap_georef_store(self):
+        print('Running test_mmap_georef_store')
+        indexdir = self.framework.indexdir
+        for matchtype, inputfile in [
+            ('sans_coords', self.framework.sanscoordsfile),
+            ('verbatim_coords', self.framework.verbatimcoordsfile),
+            ('with_coords', self.framework.withcoordsfile)]:
+            rowcount = build_georef_index(indexdir, matchtype, [inputfile])
+            self.assertEqual(rowcount, 10)
+        self.assertIsNone(build_georef_index(indexdir, 'nonsense', 
+            [self.framework.sanscoordsfile]))
+        self.assertEqual(sorted(os.listdir(indexdir)), 
+            ['matchme_sans_coords_best_georef.dat', 
+             'matchme_sans_coords_best_georef.idx',
+             'matchme_verbatimcoords_best_georef.dat', 
+             'matchme_verbatimcoords_best_georef.idx',
+             'matchme_with_coords_best_georef.dat', 
+             'matchme_with_coords_best_georef.idx'])
+
+        # Same results as from the SQLite store
+        sqlitestore = self.load_test_store()
+        mmapstore = open_georef_store(indexdir)
+        self.assertIsInstance(mmapstore, MmapGeorefStore)
+        for matchtype, inputfile, matchfield in [
+            ('sans_coords', self.framework.sanscoordsfile, 'matchme_sans_coords'),
+            ('verbatim_coords', self.framework.verbatimcoordsfile, 'matchme'),
+            ('with_coords', self.framework.withcoordsfile, 'matchme_with_coords')]:
+            with open(inputfile, 'r', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    matchstr = row[matchfield]
+                    result = mmapstore.get_best_georef_reduced(matchtype, matchstr)
+                    target = sqlitestore.get_best_georef_reduced(matchtype, matchstr)
+                    self.assertIsNotNone(result)
+                    self.assertEqual(result, target)
+        self.assertIsNone(mmapstore.get_best_sans_coords_georef_reduced('nosuchlocation'))
+        self.assertIsNone(mmapstore.get_best_georef_reduced('nonsense', 'dkelbaekskov'))
+        mmapstore.close()
+        sqlitestore.close()
+        self.assertIsNone(open_georef_store('nosuchstore'))
+
+    def test_mmap_georef_store_batches_and_collisions(self):
+        print('Running test_mmap_georef_store_batches_and_collisions')
+        # Match strings that are loaded twice keep the last values loaded, and match 
+        # strings are told apart even if their hashes are the same.
+        matchstrs = [f'location{i}' for i in range(50)] + ['location7']
+        with open(self.framework.collisionfile, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['matchme_sans_coords', 'georef_count'])
+            for i, matchstr in enumerate(matchstrs):
+                writer.writerow([matchstr, i])
+
+        indexdir = self.framework.indexdir
+        hash = georef_store.match_string_hash
+        batchsize = georef_store.GEOREF_INDEX_SORT_BATCH_SIZE
+        georef_store.match_string_hash = lambda matchstr: len(matchstr)
+        georef_store.GEOREF_INDEX_SORT_BATCH_SIZE = 7
+        try:
+            rowcount = build_georef_index(indexdir, 'sans_coords', 
+                [self.framework.collisionfile])
+            self.assertEqual(rowcount, 51)
+            store = MmapGeorefStore(indexdir)
+            for i, matchstr in enumerate(matchstrs[:50]):
+                result = store.get_best_sans_coords_georef_reduced(matchstr)
+                if matchstr == 'location7':
+                    self.assertEqual(result['bels_best_of_n_georeferences'], 50)
+                else:
+                    self.assertEqual(result['bels_best_of_n_georeferences'], i)
+            self.assertIsNone(store.get_best_sans_coords_georef_reduced('location99'))
+            store.close()
+        finally:
+            georef_store.match_string_hash = hash
+            georef_store.GEOREF_INDEX_SORT_BATCH_SIZE = batchsize
+        self.assertNotEqual(match_string_hash('location1'), 
+            match_string_hash('location2'))
+
+    def test_resolve_best_georef(self):
+        print('Running test_resolve_best_georef')
+        store = self.load_test_store()
+        withcoords = 'fr050.36943711.5957684'
+        verbatimcoords = 'usvirginianewkentcountywestpoint'
+        sanscoords = 'dkelbaekskov'
+        self.assertIsNotNone(store.get_best_with_coords_georef_reduced(withcoords))
+        for tiers, matchtype in [
+            ([('with_coords', withcoords), ('verbatim_coords', verbatimcoords),
+              ('sans_coords', sanscoords)], 'match with coords'),
+            ([('with_coords', 'nosuchlocation'), ('verbatim_coords', verbatimcoords),
+              ('sans_coords', sanscoords)], 'match using verbatim coords'),
+            ([('with_coords', 'nosuchlocation'), ('sans_coords', sanscoords)], 
+              'match sans coords'),
+            ([('sans_coords', sanscoords)], 'match sans coords')]:
+            result = resolve_best_georef(store, tiers)
+            self.assertEqual(result['bels_match_type'], matchtype)
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                self.assertEqual(resolve_best_georef(store, tiers, executor), result)
+        tiers = [('with_coords', 'nosuchlocation'), ('sans_coords', 'nosuchlocation')]
+        self.assertIsNone(resolve_best_georef(store, tiers))
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            self.assertIsNone(resolve_best_georef(store, tiers, executor))
+
+        tiers = [('with_coords', withcoords), ('verbatim_coords', verbatimcoords),
+              ('sans_coords', sanscoords)]
+        # The highest priority tier with a georeference wins even when it is the slowest
+        delayedstore = DelayedGeorefStore(store, {'with_coords': 0.2})
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            result = resolve_best_georef(delayedstore, tiers, executor)
+        self.assertEqual(result['bels_match_type'], 'match with coords')
+        self.assertEqual(sorted(delayedstore.lookups), sorted(matchtypelist))
+
+        # Lookups of lower priority tiers that have not started are cancelled
+        delayedstore = DelayedGeorefStore(store, 
+            {'with_coords': 0.1, 'verbatim_coords': 0.1})
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            result = resolve_best_georef(delayedstore, tiers, executor)
+        self.assertEqual(result['bels_match_type'], 'match with coords')
+        self.assertNotIn('sans_coords', delayedstore.lookups)
+        store.close()
+
+    def test_resolve_best_georefs(self):
+        print('Running test_resolve_best_georefs')
+        store = self.load_test_store()
+        withcoords = 'fr050.36943711.5957684'
+        verbatimcoords = 'usvirginianewkentcountywestpoint'
+        sanscoords = 'dkelbaekskov'
+        tierslist = [
+            [('with_coords', withcoords), ('verbatim_coords', verbatimcoords),
+             ('sans_coords', sanscoords)],
+            [('with_coords', 'nosuchlocation'), ('verbatim_coords', verbatimcoords),
+             ('sans_coords', sanscoords)],
+            [('with_coords', 'nosuchlocation'), ('sans_coords', sanscoords)],
+            [('sans_coords', 'nosuchlocation')],
+            [('sans_coords', sanscoords)],
+            []]
+        countingstore = DelayedGeorefStore(store, {})
+        georefs = resolve_best_georefs(countingstore, tierslist)
+        self.assertEqual(len(georefs), len(tierslist))
+        for georef, tiers in zip(georefs, tierslist):
+            self.assertEqual(georef, resolve_best_georef(store, tiers))
+        self.assertEqual([georef['bels_match_type'] for georef in georefs[:3]],
+            ['match with coords', 'match using verbatim coords', 'match sans coords'])
+        self.assertIsNone(georefs[3])
+        self.assertIsNone(georefs[5])
+
+        # One batch per tier, each only for Locations without a georeference yet
+        self.assertEqual(countingstore.lookups, [
+            ('with_coords', [withcoords, 'nosuchlocation', 'nosuchlocation']),
+            ('verbatim_coords', [verbatimcoords]),
+            ('sans_coords', [sanscoords, 'nosuchlocation', sanscoords])])
+        self.assertEqual(resolve_best_georefs(store, []), [])
+        store.close()
+
+if __name__ == '__main__':
+    print('=== georef_store_tests.py ===')
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "id_utils_benchmark.py"
+__version__ = __filename__ + ' ' + "2026-10-18T11:20-03:00"
+
+# This file contains micro-benchmarks for the match string functions in id_utils. The
+# match strings are constructed from the Locations in the benchmark files in
+# data/tests. Each benchmark reports rows or strings per second.
+#
+# Example:
+#
+# PYTHONPATH=../bels python id_utils_benchmark.py
+
+import csv
+import glob
+import re
+import time
+
+from id_utils import casefold_and_normalize
+from id_utils import diacriticsremovalmap
+from id_utils import location_match_str
+from id_utils import location_match_strs
+from id_utils import remove_symbols
+from id_utils import remove_whitespace
+from id_utils import save_numbers
+from id_utils import simplify_diacritics
+from id_utils import SuperSimplifier
+from dwca_terms import locationmatchsanscoordstermlist
+from dwca_terms import locationmatchverbatimcoordstermlist
+from dwca_terms import locationmatchwithcoordstermlist
+from dwca_utils import lower_dict_keys
+from dwca_vocab_utils import Darwinizer
+
+# 2026-10-18 Benchmarks, all three match strings for the 11111 Locations in all
+# test_benchmark_*.csv files, including building the columns for the batch
+# location_match_str() x3:              46767 rows/s
+# location_match_strs():                70831 rows/s
+#
+# 2026-10-18 Benchmarks, sans coords match strings from all test_benchmark_*.csv files
+# 11111 strings, 7652 distinct
+# Five passes, sequential diacritics:   6801 strings/s
+# Five passes:                         72229 strings/s
+# SuperSimplifier, cold cache:        108460 strings/s
+# SuperSimplifier, warm cache:       5711034 strings/s
+
+testdatapath = '../data/tests/'
+vocabpath = '../bels/vocabularies/'
+darwincloudfile = vocabpath + 'darwin_cloud.txt'
+
+def sequential_simplify_diacritics(inputstr):
+    # simplify_diacritics() as it was before the translation table.
+    for entry in diacriticsremovalmap:
+        inputstr = re.sub(entry['letters'], entry['base'], inputstr)
+    return inputstr
+
+def five_passes_sequential_diacritics(idstr):
+    # super_simplify() as it was before the translation table.
+    sd = sequential_simplify_diacritics(idstr)
+    rs = remove_symbols(sd)
+    ncsd = casefold_and_normalize(rs)
+    sn = save_numbers(ncsd)
+    return remove_whitespace(sn)
+
+def five_passes(idstr):
+    # super_simplify() as it was before the SuperSimplifier.
+    sd = simplify_diacritics(idstr)
+    rs = remove_symbols(sd)
+    ncsd = casefold_and_normalize(rs)
+    sn = save_numbers(ncsd)
+    return remove_whitespace(sn)
+
+def benchmark_locations():
+    darwinizer = Darwinizer(darwincloudfile)
+    locs = []
+    for benchmarkfile in sorted(glob.glob(testdatapath + 'test_benchmark_*.csv')):
+        with open(benchmarkfile, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                locs.append(lower_dict_keys(darwinizer.darwinize_dict(row)))
+    return locs
+
+def benchmark_match_strings(locs):
+    matchstrs = []
+    for loc in locs:
+        matchstrs.append(location_match_str(locationmatchsanscoordstermlist, loc))
+    return matchstrs
+
+def per_row_match_strs(locs):
+    # location_match_str() three times per row, as in BestGeoref.post().
+    for loc in locs:
+        location_match_str(locationmatchwithcoordstermlist, loc)
+        location_match_str(locationmatchverbatimcoordstermlist, loc)
+        location_match_str(locationmatchsanscoordstermlist, loc)
+
+def batch_match_strs(locs):
+    termlist = list(locationmatchwithcoordstermlist)
+    columns = [[loc.get(term) for loc in locs] for term in termlist]
+    location_match_strs(termlist, columns)
+
+def rows_per_second(function, locs):
+    starttime = time.perf_counter()
+    function(locs)
+    elapsedtime = time.perf_counter()-starttime
+    return len(locs)/elapsedtime
+
+def strings_per_second(function, matchstrs):
+    starttime = time.perf_counter()
+    for matchstr in matchstrs:
+        function(matchstr)
+    elapsedtime = time.perf_counter()-starttime
+    return len(matchstrs)/elapsedtime
+
+def main():
+    locs = benchmark_locations()
+    rate = rows_per_second(per_row_match_strs, locs)
+    print(f'location_match_str() x3: {rate:1.0f} rows/s')
+
+    rate = rows_per_second(batch_match_strs, locs)
+    print(f'location_match_strs(): {rate:1.0f} rows/s')
+
+    matchstrs = benchmark_match_strings(locs)
+    print(f'{len(matchstrs)} strings, {len(set(matchstrs))} distinct')
+
+    rate = strings_per_second(five_passes_sequential_diacritics, matchstrs)
+    print(f'Five passes, sequential diacritics: {rate:1.0f} strings/s')
+
+    rate = strings_per_second(five_passes, matchstrs)
+    print(f'Five passes: {rate:1.0f} strings/s')
+
+    simplifier = SuperSimplifier()
+    rate = strings_per_second(simplifier.simplify, matchstrs)
+    print(f'SuperSimplifier, cold cache: {rate:1.0f} strings/s')
+
+    rate = strings_per_second(simplifier.simplify, matchstrs)
+    print(f'SuperSimplifier, warm cache: {rate:1.0f} strings/s')
+    print(f'{simplifier.cache_info()}')
+
+if __name__ == '__main__':
+    print('=== id_utils_benchmark.py ===')
+    main()
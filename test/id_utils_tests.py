@@ -16,7 +16,7 @@
 __author__ = "John Wieczorek"
 __copyright__ = "Copyright 2022 Rauthiflor LLC"
 __filename__ = "id_utils_tests.py"
-__version__ = __filename__ + ' ' + "2022-06-09T00:23-03:00"
+__version__ = __filename__ + ' ' + "2026-10-18T23:20-03:00"
 
 # This file contains unit tests for the functions in id_utils.
 #
@@ -25,18 +25,24 @@ __version__ = __filename__ + ' ' + "2022-06-09T00:23-03:00"
 # python id_utils_tests.py
 
 import base64
+import csv
+import re
 import unittest
 from decimal import *
 
 from id_utils import simplify_diacritics
+from id_utils import diacriticsremovalmap
 from id_utils import casefold_and_normalize
+from id_utils import coordinate_match_str
 from id_utils import location_match_str
+from id_utils import location_match_strs
 from id_utils import location_str
 from id_utils import dwc_location_hash
 from id_utils import remove_symbols
 from id_utils import remove_whitespace
 from id_utils import save_numbers
 from id_utils import super_simplify
+from id_utils import SuperSimplifier
 from dwca_utils import lower_dict_keys
 from dwca_terms import locationmatchwithcoordstermlist
 from dwca_terms import locationmatchverbatimcoordstermlist
@@ -46,14 +52,41 @@ class IDUtilsTestFramework():
     def dispose(self):
         return True
 
+def sequential_simplify_diacritics(inputstr, removalmap):
+    ''' Reference implementation of simplify_diacritics() that applies each substitution 
+        in removalmap in sequence, as simplify_diacritics() used to and as the BigQuery 
+        function simplifyDiacritics does.
+    '''
+    for entry in removalmap:
+        inputstr = re.sub(entry['letters'], entry['base'], inputstr)
+    return inputstr
+
+def udf_diacritics_removal_map(udffile):
+    ''' Get the substitutions in the BigQuery function simplifyDiacritics as a removal 
+        map with the same structure as id_utils.diacriticsremovalmap.
+    '''
+    with open(udffile, 'r', encoding='utf-8') as f:
+        udf = f.read()
+    removalmap = []
+    pattern = r"\{'base':\s*'(\w+)',\s*'letters':\s*/\[(.*?)\]/g\}"
+    for base, letters in re.findall(pattern, udf):
+        removalmap.append({'base':base, 'letters':'[' + re.escape(letters) + ']'})
+    return removalmap
+
 class IDUtilsTestCase(unittest.TestCase):
     # testdatapath is the location of example files to test with
     testdatapath = '../data/tests/'
     # vocabpath is the location of vocabulary files to test with
     vocabpath = '../bels/vocabularies/'
 
+    # gazetteerpath is the location of the BigQuery function definitions
+    gazetteerpath = '../gazetteer/'
+
     # following are files used as input during the tests, don't remove these
     darwincloudfile = vocabpath + 'darwin_cloud.txt'
+    diacriticsudffile = gazetteerpath + 'udf_simplifyDiacritics.sql'
+    diacriticsfile = testdatapath + 'test_diacritical_occurrences.txt'
+    benchmarkfile = testdatapath + 'test_benchmark_1000.csv'
 
     loc1 = { 
         'dummyfield':'',
@@ -136,6 +169,45 @@ class IDUtilsTestCase(unittest.TestCase):
         simpstr = simplify_diacritics(teststr)
         self.assertEqual(simpstr, target)
 
+    def test_simplify_diacritics_parity(self):
+        print('Running test_simplify_diacritics_parity')
+        letters = ''
+        for entry in diacriticsremovalmap:
+            letters += re.sub(r'\\u([0-9A-Fa-f]{4})', 
+                lambda m: chr(int(m.group(1), 16)), entry['letters'][1:-1])
+        # Every letter in the map, one at a time and all together
+        for letter in letters:
+            self.assertEqual(simplify_diacritics(letter), 
+                sequential_simplify_diacritics(letter, diacriticsremovalmap))
+        self.assertEqual(simplify_diacritics(letters), 
+            sequential_simplify_diacritics(letters, diacriticsremovalmap))
+
+        # Every line in a file full of diacritics
+        with open(self.diacriticsfile, 'r', encoding='utf-8') as f:
+            for line in f:
+                self.assertEqual(simplify_diacritics(line), 
+                    sequential_simplify_diacritics(line, diacriticsremovalmap))
+
+    def test_simplify_diacritics_udf_parity(self):
+        print('Running test_simplify_diacritics_udf_parity')
+        udfmap = udf_diacritics_removal_map(self.diacriticsudffile)
+        self.assertEqual(len(udfmap), 86)
+        letters = set()
+        for entry in udfmap:
+            letters.update(entry['letters'][1:-1].replace('\\',''))
+        for entry in diacriticsremovalmap:
+            letters.update(re.sub(r'\\u([0-9A-Fa-f]{4})', 
+                lambda m: chr(int(m.group(1), 16)), entry['letters'][1:-1]))
+        differences = {}
+        for letter in letters:
+            udfletter = sequential_simplify_diacritics(letter, udfmap)
+            if simplify_diacritics(letter) != udfletter:
+                differences[letter] = udfletter
+        # Known differences: the UDF has a space where it should have \u00C2, and it 
+        # maps \u00DF to 'ss' (see https://github.com/VertNet/bels/issues/2)
+        target = {' ':'A', '\u00C2':'\u00C2', '\u00DF':'ss'}
+        self.assertEqual(differences, target)
+
     def test_remove_symbols(self):
         print('Running test_remove_symbols')
         teststr='’<>:‒–—―…!«»‐?‘’“”;⁄␠·&@*•^¤¢$€£¥₩₪†‡°¡¿¬#№%‰‱¶′§~¨_|¦⁂☞∴‽※}{\\]\\[\\"\\)\\('
@@ -169,6 +241,36 @@ class IDUtilsTestCase(unittest.TestCase):
         simpstr=super_simplify(teststr)
         self.assertEqual(simpstr, target)
         
+    def test_super_simplifier(self):
+        print('Running test_super_simplifier')
+        teststrs = ['1.5 mi. N., 6,6 km S.; 2-4 T 1/2 km up H/T; .5 mi. 9. 15 -+5m T-A',
+            '', ' \t\r\n', 'Görlitz-Biesnitz, {Gartensparte ("Am Löhnschen Park")}',
+            '\u0061\u0301\u2168\u0041\u030A\u2167 áBçDèFGHïJKłMñoœPQRßTûVWXÿž',
+            'Москва', '½ km N. of ²3 - ³4 , +5']
+        with open(self.diacriticsfile, 'r', encoding='utf-8') as f:
+            for line in f:
+                teststrs.append(line)
+        with open(self.benchmarkfile, 'r', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                teststrs.append(' '.join(row))
+
+        simplifier = SuperSimplifier(maxsize=10)
+        for teststr in teststrs:
+            target = remove_whitespace(save_numbers(casefold_and_normalize(
+                remove_symbols(simplify_diacritics(teststr)))))
+            self.assertEqual(simplifier.simplify(teststr), target)
+            self.assertEqual(super_simplify(teststr), target)
+
+        simplifier.cache_clear()
+        simplifier.simplify('a')
+        simplifier.simplify('b')
+        simplifier.simplify('a')
+        info = simplifier.cache_info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.currsize, 2)
+        self.assertEqual(info.maxsize, 10)
+
     def test_casefold_and_normalize(self):
         print('Running test_casefold_and_normalize')
         teststr=u'\u0061\u0301\u2168\u0041\u030A\u2167 áBçDèFGHïJKłMñoœPQRßTûVWXÿž'
@@ -262,6 +364,52 @@ class IDUtilsTestCase(unittest.TestCase):
         target='2 3 4 5 6 7 8 9  11 12 13 14 15 16 17 18 19 20 21.1234567 -22.1234567 '
         self.assertEqual(locstr, target)
 
+    def test_coordinate_match_str(self):
+        print('Running test_coordinate_match_str')
+        # Coordinates are as in the match strings of the gazetteer, rounded to seven 
+        # places as BigQuery NUMERIC values, with the zero before the decimal point
+        for value, target in [('0', '0'), ('0.1167', '0.1167'), ('0.30', '0.3'), 
+            ('0.5', '0.5'), ('-0.25', '-0.25'), ('-0.00000004', '0'), ('-0', '0'),
+            ('0.00000005', '0.0000001'), ('-78.370', '-78.37'), ('10.00000000', '10'),
+            ('-33.12345675', '-33.1234568'), ('1E+2', '100'), 
+            (Decimal(21.12345675), '21.1234567'), (0.5, '0.5'), ('55,802706', None),
+            ('NaN', None), ('', None), (None, None)]:
+            self.assertEqual(coordinate_match_str(value), target, value)
+
+    def test_location_match_strs(self):
+        print('Running test_location_match_strs')
+        with open(self.benchmarkfile, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            termlist = [field.lower().replace('v_','',1) for field in next(reader)]
+            rows = [row for row in reader]
+        # Rows with values location_match_str() has to skip or treat specially
+        edgeterms = ['countrycode', 'locality', 'verbatimlocality', 'decimallatitude', 
+            'decimallongitude']
+        edgerows = [
+            ['RU', 'unknown', 'UNKNOWN ', '55,802706', '-0'],
+            [None, None, 'Moscow', Decimal('21.12345675'), Decimal(-22.12345675)],
+            ['5', Decimal(9), '9', 'N', None],
+            ['', '', None, '0.00000005', '180.0'],
+            ['5', 'Moscow', '', '-0.00000004', '1E+2']
+        ]
+        for termlist, rows in [(termlist, rows), (edgeterms, edgerows)]:
+            targets = ([], [], [])
+            for row in rows:
+                loc = dict(zip(termlist, row))
+                targets[0].append(location_match_str(locationmatchwithcoordstermlist, loc))
+                targets[1].append(
+                    location_match_str(locationmatchverbatimcoordstermlist, loc))
+                targets[2].append(location_match_str(locationmatchsanscoordstermlist, loc))
+            columns = [list(column) for column in zip(*rows)]
+            matchstrs = location_match_strs(termlist, columns)
+            self.assertEqual(matchstrs, targets)
+            matchstrs = location_match_strs(termlist, rows, columnar=False)
+            self.assertEqual(matchstrs, targets)
+
+        self.assertEqual(location_match_strs(edgeterms, []), ([], [], []))
+        self.assertEqual(location_match_strs(edgeterms, [], columnar=False), 
+            ([], [], []))
+
 if __name__ == '__main__':
     print('=== id_utils_test.py ===')
     #setup_actor_logging({'loglevel':'DEBUG'})
@@ -66,6 +66,10 @@ logging.basicConfig(level=logging.INFO)
 # }
 ## 6825038 records. Size: 430MB Format: CSV Compression: GZIP Prep: 0.42s Import: 209s 
 ## Georef: 596s Export: 257s Elapsed: 852s
+## The match strings for the same file can be constructed locally, with one worker
+## process per CPU, after downloading and uncompressing it:
+## PYTHONPATH=../bels python ../bels/match_normalizer.py -i ./idigbio_2021-02-13a13.csv 
+##   -o ./idigbio_matchstrs.csv -w 8 -c 16777216
 
 # upload_file_to_test = 'gs://localityservice/Geographyexport.csv'
 # event = {
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "local_matcher_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:55-03:00"
+
+# This file contains unit tests for the functions in local_matcher.
+#
+# Example:
+#
+# python local_matcher_tests.py
+
+import csv
+import gzip
+import io
+import os
+import unittest
+
+from dwca_vocab_utils import darwinize_list
+from georef_store import load_georef_store
+from georef_store import SQLiteGeorefStore
+from id_utils import location_match_str
+from local_matcher import add_match_columns
+from local_matcher import choose_bulk_engine
+from local_matcher import countrycode_lookup_dict
+from local_matcher import estimate_row_count
+from local_matcher import local_match_file
+from local_matcher import local_match_rows
+from local_matcher import RowCountEstimate
+from local_matcher import localmatchfieldlist
+from match_sql import matchcolumnfieldlist
+from match_sql import matchstrtermlists
+from match_sql import run_coordinate_steps
+from match_sql import run_simplify_steps
+
+class LocalMatcherTestFramework():
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+
+    # following are files used as input during the tests, don't remove these
+    exportfiles = [
+        ('sans_coords', testdatapath + 'test_matchme_sans_coords_best_georef.csv'),
+        ('verbatim_coords', testdatapath + 'test_matchme_verbatim_coords_best_georef.csv'),
+        ('with_coords', testdatapath + 'test_matchme_with_coords_best_georef.csv')]
+    countrycodefile = '../data/countrycode_lookup.csv'
+    dwccloudfile = '../bels/vocabularies/darwin_cloud.txt'
+    benchmarkfiles = [testdatapath + 'test_benchmark_1.csv',
+        testdatapath + 'test_benchmark_10.csv', testdatapath + 'test_benchmark_100.csv',
+        testdatapath + 'test_benchmark_1000.csv']
+
+    # following are files output during the tests, remove these in dispose()
+    storefile = testdatapath + 'test_local_matcher_store.db'
+    inputfile = testdatapath + 'test_local_matcher_input.csv'
+    gzinputfile = testdatapath + 'test_local_matcher_input.csv.gz'
+    outputfile = testdatapath + 'test_local_matcher_output.csv.gz'
+
+    def dispose(self):
+        for file in [self.storefile, self.inputfile, self.gzinputfile,
+            self.outputfile]:
+            if os.path.isfile(file):
+                os.remove(file)
+        return True
+
+class LocalMatcherTestCase(unittest.TestCase):
+    # A Location that matches on each tier and one that does not match
+    header = ['id', 'country', 'countrycode', 'stateprovince', 'county', 'locality',
+        'minimumelevationinmeters', 'minimumdistanceabovesurfaceinmeters',
+        'decimallatitude', 'decimallongitude', 'geodeticdatum',
+        'coordinateuncertaintyinmeters', 'georeferenceprotocol',
+        'georeferenceverificationstatus']
+    rows = [
+        ['1', 'France', '', '', '', '', '0', '-5', '50.3694371', '1.5957684', 'WGS84',
+            '24', 'GPS', 'unverified'],
+        ['2', '', 'US', 'Virginia', 'New Kent County', 'West Point', '', '', '', '', '',
+            '', '', ''],
+        ['3', 'Denmark', 'Danmark', '', '', 'Elbæk Skov', '', '', '', '', '', '', '',
+            ''],
+        ['4', 'Nowhere', '', '', '', 'Nowhere', '', '', '', '', '', '', '', '']]
+
+    # Locations with coordinates under 1 in magnitude and the match strings with 
+    # coordinates that the JavaScript UDFs of the georeference script made for them,
+    # with the coordinates written by roundToSeven() in matchString
+    udfheader = ['id', 'country', 'locality', 'decimallatitude', 'decimallongitude']
+    udfrows = [
+        (['1', 'Ecuador', 'Cotacachi', '0.30', '-78.37'], 'eccotacachi0.3-78.37'),
+        (['2', 'Gabon', 'Ilha', '-0.00000004', '0.5'], 'gailha00.5'),
+        (['3', 'Peru', 'Lima', '-12.1666', '-0.1167'], 'pelima-12.1666-0.1167'),
+        (['4', 'Kenya', 'Nairobi', '0', '36.8'], 'kenairobi036.8'),
+        (['5', 'France', 'Paris', '48.8566000', '2.3522'], 'frparis48.85662.3522')]
+
+    def setUp(self):
+        self.framework = LocalMatcherTestFramework()
+        self.framework.dispose()
+        for matchtype, exportfile in self.framework.exportfiles:
+            load_georef_store(self.framework.storefile, matchtype, [exportfile])
+        self.store = SQLiteGeorefStore(self.framework.storefile)
+        self.countrycodes = countrycode_lookup_dict(self.framework.countrycodefile)
+
+    def tearDown(self):
+        self.store.close()
+        self.framework.dispose()
+        self.framework = None
+
+    def test_countrycode_lookup_dict(self):
+        print('Running test_countrycode_lookup_dict')
+        self.assertEqual(self.countrycodes['DENMARK'], 'DK')
+        self.assertEqual(countrycode_lookup_dict(), self.countrycodes)
+        self.assertIsNone(countrycode_lookup_dict('nosuchfile.csv'))
+
+    def test_estimate_row_count(self):
+        print('Running test_estimate_row_count')
+        self.assertEqual(estimate_row_count(b'a,b\n1,2\n3,4\n'), 2)
+        self.assertEqual(estimate_row_count(b'a,b\r\n1,2\r\n3,4'), 2)
+        self.assertEqual(estimate_row_count(b'a,b\r1,2\r3,4\r'), 2)
+        self.assertEqual(estimate_row_count(b'a,b'), 0)
+        self.assertEqual(estimate_row_count(b''), 0)
+        self.assertIsNone(estimate_row_count(None))
+        content = io.BytesIO()
+        with gzip.GzipFile(fileobj=content, mode='wb') as f:
+            f.write(b'a,b\n1,2\n')
+        self.assertIsNone(estimate_row_count(content.getvalue()))
+
+        # The running estimate is the same however the content is split
+        for content in [b'a,b\r\n1,2\r\n3,4', b'a,b\r1,2\r3,4\r', b'a',
+            content.getvalue()]:
+            for size in [1, 2, 5]:
+                estimate = RowCountEstimate()
+                for i in range(0, len(content), size):
+                    estimate.update(content[i:i+size])
+                self.assertEqual(estimate.rowcount(), estimate_row_count(content))
+        self.assertEqual(RowCountEstimate().rowcount(), 0)
+
+    def test_choose_bulk_engine(self):
+        print('Running test_choose_bulk_engine')
+        # Every file is matched in BigQuery unless local matching is asked for
+        self.assertEqual(choose_bulk_engine(1), 'bigquery')
+        self.assertEqual(choose_bulk_engine(1, 10000), 'local')
+        self.assertEqual(choose_bulk_engine(10000, 10000), 'local')
+        self.assertEqual(choose_bulk_engine(10001, 10000), 'bigquery')
+        self.assertEqual(choose_bulk_engine(None, 10000), 'bigquery')
+        self.assertEqual(choose_bulk_engine(100, maxrows=10), 'bigquery')
+        self.assertEqual(choose_bulk_engine(0, maxrows=0), 'bigquery')
+        self.assertEqual(choose_bulk_engine(1, maxrows=0), 'bigquery')
+
+    def test_local_match_rows(self):
+        print('Running test_local_match_rows')
+        countryfieldlist = ['countrycode', 'country']
+        matchrows = local_match_rows(self.header, self.rows, countryfieldlist,
+            self.store, self.countrycodes)
+        results = [dict(zip(localmatchfieldlist, row)) for row in matchrows]
+
+        self.assertEqual(results[0]['bels_match_country'], 'France')
+        self.assertEqual(results[0]['bels_interpreted_countrycode'], 'FR')
+        self.assertEqual(results[0]['bels_matchwithcoords'], 'fr050.36943711.5957684')
+        self.assertEqual(results[0]['bels_match_type'], 'match using coords')
+        self.assertEqual(results[0]['bels_decimallatitude'], 50.369437)
+        self.assertEqual(results[0]['bels_geodeticdatum'], 'epsg:4326')
+
+        self.assertEqual(results[1]['bels_interpreted_countrycode'], 'US')
+        self.assertEqual(results[1]['bels_match_type'], 'match using verbatim coords')
+        self.assertEqual(results[1]['bels_coordinateuncertaintyinmeters'], 5774)
+
+        # The countrycode field comes first, but it is interpreted as well
+        self.assertEqual(results[2]['bels_match_country'], 'Danmark')
+        self.assertEqual(results[2]['bels_interpreted_countrycode'], 'DK')
+        self.assertEqual(results[2]['bels_matchsanscoords'], 'dkelbaekskov')
+        self.assertEqual(results[2]['bels_match_type'], 'match sans coords')
+
+        self.assertIsNone(results[3]['bels_interpreted_countrycode'])
+        self.assertIsNone(results[3]['bels_decimallatitude'])
+        self.assertIsNone(results[3]['bels_geodeticdatum'])
+        self.assertIsNone(results[3]['bels_match_type'])
+
+        self.assertEqual(local_match_rows(self.header, [], countryfieldlist,
+            self.store, self.countrycodes), [])
+
+    def test_local_match_file(self):
+        print('Running test_local_match_file')
+        # The header in the file is replaced and rows may be short
+        with open(self.framework.inputfile, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Id', 'Country'] + self.header[2:])
+            for row in self.rows[:3]:
+                writer.writerow(row)
+            writer.writerow(self.rows[3][:6])
+
+        self.assertIsNone(local_match_file('nosuchfile.csv',
+            self.framework.outputfile, self.header, ['country'], self.store,
+            self.countrycodes))
+        self.assertIsNone(local_match_file(self.framework.inputfile,
+            self.framework.outputfile, self.header, None, self.store,
+            self.countrycodes))
+
+        # Chunks of two rows
+        rowcount = local_match_file(self.framework.inputfile,
+            self.framework.outputfile, self.header, ['countrycode', 'country'],
+            self.store, self.countrycodes, chunksize=2)
+        self.assertEqual(rowcount, 4)
+        with gzip.open(self.framework.outputfile, 'rt', newline='',
+            encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(list(rows[0].keys()), self.header + localmatchfieldlist)
+        self.assertEqual([row['bels_match_type'] for row in rows],
+            ['match using coords', 'match using verbatim coords', 'match sans coords',
+            ''])
+        self.assertEqual(rows[2]['locality'], 'Elbæk Skov')
+        self.assertEqual(rows[1]['bels_decimallatitude'], '37.476215')
+        self.assertEqual(rows[3]['georeferenceverificationstatus'], '')
+
+        # Uploads can be gzipped
+        with open(self.framework.inputfile, 'rb') as f, \
+            gzip.open(self.framework.gzinputfile, 'wb') as output:
+            output.write(f.read())
+        self.assertEqual(local_match_file(self.framework.gzinputfile,
+            self.framework.outputfile, self.header, ['countrycode', 'country'],
+            self.store, self.countrycodes), 4)
+        with gzip.open(self.framework.outputfile, 'rt', newline='',
+            encoding='utf-8') as f:
+            self.assertEqual(list(csv.DictReader(f)), rows)
+
+        # Tab-separated
+        with open(self.framework.inputfile, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, dialect=csv.excel_tab)
+            writer.writerow(['Id', 'Country'] + self.header[2:])
+            for row in self.rows:
+                writer.writerow(row)
+        self.assertEqual(local_match_file(self.framework.inputfile,
+            self.framework.outputfile, self.header, ['countrycode', 'country'],
+            self.store, self.countrycodes, dialect=csv.excel_tab), 4)
+        with gzip.open(self.framework.outputfile, 'rt', newline='',
+            encoding='utf-8') as f:
+            self.assertEqual(list(csv.DictReader(f)), rows)
+
+    def test_add_match_columns(self):
+        print('Running test_add_match_columns')
+        countryfieldlist = ['countrycode', 'country']
+        input = io.StringIO(newline='')
+        writer = csv.writer(input)
+        writer.writerow(['Id', 'Country'] + self.header[2:])
+        writer.writerows(self.rows)
+        input.seek(0)
+        output = io.StringIO(newline='')
+        rowcount = add_match_columns(input, output, self.header, countryfieldlist,
+            self.countrycodes, chunksize=3)
+        self.assertEqual(rowcount, 4)
+
+        # The added columns are those of the georeference script, with NULL as ''
+        output.seek(0)
+        rows = list(csv.reader(output))
+        self.assertEqual(rows[0], self.header + matchcolumnfieldlist)
+        matchrows = local_match_rows(self.header, self.rows, countryfieldlist,
+            self.store, self.countrycodes)
+        for row, inputrow, matchrow in zip(rows[1:], self.rows, matchrows):
+            self.assertEqual(row[:len(self.header)], inputrow)
+            self.assertEqual(row[len(self.header):],
+                ['' if v is None else v for v in matchrow[:len(matchcolumnfieldlist)]])
+
+        self.assertIsNone(add_match_columns(input, output, self.header, [],
+            self.countrycodes))
+        self.assertIsNone(add_match_columns(input, output, self.header,
+            countryfieldlist, None))
+
+    def test_match_columns_sql_parity(self):
+        print('Running test_match_columns_sql_parity')
+        # The match columns added to the benchmark files are those the georeference
+        # script makes with match_sql.py, run here with run_simplify_steps(). Empty
+        # fields are NULL in BigQuery, which the SQL treats as empty strings.
+        for benchmarkfile in self.framework.benchmarkfiles:
+            with open(benchmarkfile, 'r', newline='', encoding='utf-8') as f:
+                header = darwinize_list(next(csv.reader(f)),
+                    self.framework.dwccloudfile, case='l')
+                f.seek(0)
+                countryfieldlist = [field for field in ['interpreted_countrycode',
+                    'countrycode', 'v_countrycode', 'country'] if field in header]
+                output = io.StringIO(newline='')
+                rowcount = add_match_columns(f, output, header, countryfieldlist,
+                    self.countrycodes)
+            output.seek(0)
+            rows = list(csv.DictReader(output))
+            self.assertEqual(len(rows), rowcount)
+            self.assertGreater(rowcount, 0)
+            for row in rows:
+                country = None
+                for field in countryfieldlist:
+                    if len(row[field]) > 0:
+                        country = row[field]
+                        break
+                self.assertEqual(row['bels_match_country'],
+                    '' if country is None else country)
+                countrycode = None
+                if country is not None:
+                    countrycode = self.countrycodes.get(country.upper())
+                self.assertEqual(row['bels_interpreted_countrycode'],
+                    '' if countrycode is None else countrycode)
+
+                interpreted = {field: row[field] for field in header}
+                interpreted['countrycode'] = row['bels_interpreted_countrycode']
+                for field, termlist in matchstrtermlists.items():
+                    if field == 'bels_matchwithcoords':
+                        # The coordinates as the SQL makes them, NULL if empty
+                        idstr = location_match_str(termlist[:-2], interpreted)
+                        for term in termlist[-2:]:
+                            value = interpreted.get(term)
+                            idstr += run_coordinate_steps(value if value else None)
+                            idstr += ' '
+                    else:
+                        idstr = location_match_str(termlist, interpreted)
+                    self.assertEqual(row[field], run_simplify_steps(idstr))
+
+    def test_match_columns_udf_parity(self):
+        print('Running test_match_columns_udf_parity')
+        # The match strings with coordinates are those the JavaScript UDFs made
+        input = io.StringIO(newline='')
+        writer = csv.writer(input)
+        writer.writerow(self.udfheader)
+        writer.writerows([row for row, matchstr in self.udfrows])
+        input.seek(0)
+        output = io.StringIO(newline='')
+        add_match_columns(input, output, self.udfheader, ['country'], self.countrycodes)
+        output.seek(0)
+        rows = list(csv.DictReader(output))
+        self.assertEqual([row['bels_matchwithcoords'] for row in rows],
+            [matchstr for row, matchstr in self.udfrows])
+        self.assertEqual(rows[1]['bels_matchsanscoords'], 'gailha')
+
+        matchrows = local_match_rows(self.udfheader,
+            [row for row, matchstr in self.udfrows], ['country'], self.store,
+            self.countrycodes)
+        i = localmatchfieldlist.index('bels_matchwithcoords')
+        self.assertEqual([matchrow[i] for matchrow in matchrows],
+            [matchstr for row, matchstr in self.udfrows])
+
+if __name__ == '__main__':
+    print('=== local_matcher_tests.py ===')
+    unittest.main()
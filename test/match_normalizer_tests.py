@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "match_normalizer_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:56-03:00"
+
+# This file contains unit tests for the functions in match_normalizer.
+#
+# Example:
+#
+# python match_normalizer_tests.py
+
+import os
+import unittest
+
+from match_normalizer import chunk_interval
+from match_normalizer import chunk_ranges
+from match_normalizer import normalize_file
+from dwca_utils import FileProfile
+from dwca_utils import file_profile
+from dwca_utils import RECORD_INDEX_INTERVAL
+from id_utils import location_match_str
+from id_utils import super_simplify
+from dwca_utils import lower_dict_keys
+from dwca_utils import safe_read_csv_row
+from dwca_vocab_utils import Darwinizer
+from dwca_terms import locationmatchwithcoordstermlist
+from dwca_terms import locationmatchverbatimcoordstermlist
+from dwca_terms import locationmatchsanscoordstermlist
+
+class MatchNormalizerTestCase(unittest.TestCase):
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+    # vocabpath is the location of vocabulary files to test with
+    vocabpath = '../bels/vocabularies/'
+
+    # following are files used as input during the tests, don't remove these
+    darwincloudfile = vocabpath + 'darwin_cloud.txt'
+    benchmarkfile = testdatapath + 'test_benchmark_1000.csv'
+    shortfieldsfile = testdatapath + 'test_bad_fieldcount1.txt'
+
+    # following are files output during the tests, remove these in tearDown()
+    quotedfile = testdatapath + 'test_match_normalizer_quoted.csv'
+
+    def tearDown(self):
+        if os.path.isfile(self.quotedfile):
+            os.remove(self.quotedfile)
+
+    def row_by_row_match_strs(self, inputfile):
+        # The match strings as find_best_georef() constructs them, one row at a time.
+        darwinizer = Darwinizer(self.darwincloudfile)
+        matchstrs = []
+        for row in safe_read_csv_row(inputfile):
+            lowerloc = lower_dict_keys(darwinizer.darwinize_dict(row))
+            matchstrs.append(tuple(super_simplify(location_match_str(termlist, lowerloc))
+                for termlist in [locationmatchwithcoordstermlist,
+                    locationmatchverbatimcoordstermlist,
+                    locationmatchsanscoordstermlist]))
+        return matchstrs
+
+    def test_chunk_ranges(self):
+        print('Running test_chunk_ranges')
+        filesize = os.path.getsize(self.benchmarkfile)
+        profile = FileProfile(self.benchmarkfile, interval=1)
+        offsets = profile.get_record_offsets()
+        maxrecordsize = max(end - start for start, end in
+            zip(offsets, offsets[1:] + [filesize]))
+
+        for chunksize in [1, 1000, 50000, filesize, 10*filesize]:
+            ranges = chunk_ranges(self.benchmarkfile, chunksize, profile)
+            # The ranges cover all of the records after the header, in order, without 
+            # gaps
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], 1000)
+            for previous, next in zip(ranges, ranges[1:]):
+                self.assertEqual(previous[1], next[0])
+            # No range is larger than chunksize by more than about two records
+            for start, stop in ranges[:-1]:
+                self.assertLess(offsets[stop] - offsets[start],
+                    chunksize + 2*maxrecordsize)
+        self.assertEqual(len(chunk_ranges(self.benchmarkfile, 10*filesize, profile)), 1)
+        self.assertEqual(len(chunk_ranges(self.benchmarkfile, 1, profile)), 1000)
+        # Ranges start at indexed records
+        profile = FileProfile(self.benchmarkfile)
+        self.assertEqual(chunk_ranges(self.benchmarkfile, 10000, profile), [(0, 1000)])
+        # Without a profile, records are indexed often enough for the chunk size
+        ranges = chunk_ranges(self.benchmarkfile, 10000)
+        chunkcount = -(-(filesize - offsets[0]) // 10000)
+        self.assertGreater(len(ranges), chunkcount // 2)
+        self.assertLessEqual(len(ranges), chunkcount)
+        self.assertIsNone(chunk_ranges('nosuchfile.csv'))
+
+    def test_chunk_interval(self):
+        print('Running test_chunk_interval')
+        self.assertEqual(chunk_interval(self.benchmarkfile, 1), 1)
+        interval = chunk_interval(self.benchmarkfile, 10000)
+        self.assertGreater(interval, 1)
+        self.assertLess(interval, 10)
+        self.assertGreater(chunk_interval(self.benchmarkfile), interval)
+        self.assertLessEqual(chunk_interval(self.benchmarkfile), RECORD_INDEX_INTERVAL)
+        self.assertEqual(chunk_interval(self.benchmarkfile, 1024**3), 
+            RECORD_INDEX_INTERVAL)
+        self.assertIsNone(chunk_interval('nosuchfile.csv'))
+
+    def test_normalize_file(self):
+        print('Running test_normalize_file')
+        target = self.row_by_row_match_strs(self.benchmarkfile)
+        self.assertEqual(len(target), 1000)
+
+        matchstrs = list(normalize_file(self.benchmarkfile, self.darwincloudfile,
+            workers=1))
+        self.assertEqual(matchstrs, target)
+
+        matchstrs = list(normalize_file(self.benchmarkfile, self.darwincloudfile,
+            workers=3, chunksize=20000))
+        self.assertEqual(matchstrs, target)
+
+        # Each worker gets a range with the default chunk size
+        matchstrs = list(normalize_file(self.benchmarkfile, self.darwincloudfile,
+            workers=4))
+        self.assertEqual(matchstrs, target)
+        filesize = os.path.getsize(self.benchmarkfile)
+        self.assertEqual(len(chunk_ranges(self.benchmarkfile, -(-filesize // 4),
+            file_profile(self.benchmarkfile))), 4)
+
+    def test_normalize_file_short_rows(self):
+        print('Running test_normalize_file_short_rows')
+        target = self.row_by_row_match_strs(self.shortfieldsfile)
+        matchstrs = list(normalize_file(self.shortfieldsfile, self.darwincloudfile,
+            workers=2, chunksize=1))
+        self.assertEqual(matchstrs, target)
+
+    def test_normalize_file_quoted_line_ends(self):
+        print('Running test_normalize_file_quoted_line_ends')
+        # Line ends in quoted values do not end rows, wherever the ranges end
+        with open(self.quotedfile, 'w', newline='', encoding='utf-8') as f:
+            f.write('Country,Locality,Lat,Lng\n')
+            for i in range(40):
+                f.write('Peru,"Lima\nkm %d, ""Norte""\r\n",-12.%d,-77.0\n' % (i, i))
+        target = self.row_by_row_match_strs(self.quotedfile)
+        self.assertEqual(len(target), 40)
+        for interval in [None, 1, 3]:
+            profile = FileProfile(self.quotedfile, interval=interval)
+            for workers in [1, 2]:
+                matchstrs = list(normalize_file(self.quotedfile, self.darwincloudfile,
+                    workers=workers, chunksize=100, profile=profile))
+                self.assertEqual(matchstrs, target)
+
+        # Empty lines are not rows
+        with open(self.quotedfile, 'w', newline='', encoding='utf-8') as f:
+            f.write('Country,Locality\n\nPeru,Lima\n\n\nChile,Arica\n')
+        target = self.row_by_row_match_strs(self.quotedfile)
+        self.assertEqual(len(target), 2)
+        profile = FileProfile(self.quotedfile, interval=1)
+        self.assertEqual(list(normalize_file(self.quotedfile, self.darwincloudfile,
+            workers=2, chunksize=1, profile=profile)), target)
+
+if __name__ == '__main__':
+    print('=== match_normalizer_tests.py ===')
+    unittest.main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "match_sql_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:20-03:00"
+
+# This file contains unit tests for the functions in match_sql and the golden corpus of
+# match strings shared with the BigQuery test in bels_query_tests.py.
+#
+# Example:
+#
+# python match_sql_tests.py
+
+import csv
+import json
+import re
+import shutil
+import subprocess
+import unittest
+
+from dwca_terms import locationmatchsanscoordstermlist
+from dwca_terms import locationmatchverbatimcoordstermlist
+from dwca_terms import locationmatchwithcoordstermlist
+from id_utils import coordinate_match_str
+from id_utils import location_match_str
+from id_utils import location_match_strs
+from id_utils import super_simplify
+from match_sql import character_class
+from match_sql import coordinate_match_sql
+from match_sql import coordinate_steps
+from match_sql import location_match_sql
+from match_sql import match_strs_sql
+from match_sql import matchstrtermlists
+from match_sql import run_coordinate_steps
+from match_sql import run_simplify_steps
+from match_sql import simplify_steps
+from match_sql import sql_string_literal
+from match_sql import super_simplify_function_sql
+from match_sql import whitespacechars
+
+class MatchSQLTestFramework():
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+
+    # following are files used as input during the tests, don't remove these
+    goldenfile = testdatapath + 'test_match_strings_golden.csv'
+    matchstringudffile = '../gazetteer/udf_matchString.sql'
+
+    def golden_rows(self):
+        # The Locations and expected match strings of the golden corpus
+        with open(self.goldenfile, 'r', newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+class MatchSQLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.framework = MatchSQLTestFramework()
+        self.rows = self.framework.golden_rows()
+
+    def tearDown(self):
+        self.framework = None
+
+    def test_golden_corpus(self):
+        print('Running test_golden_corpus')
+        # The corpus holds the results of location_match_str() and super_simplify()
+        self.assertGreater(len(self.rows), 50)
+        for row in self.rows:
+            for field, termlist in matchstrtermlists.items():
+                self.assertEqual(super_simplify(location_match_str(termlist, row)),
+                    row[field])
+
+        termlist = locationmatchwithcoordstermlist
+        columns = [[row[term] for row in self.rows] for term in termlist]
+        withcoords, verbatimcoords, sanscoords = location_match_strs(termlist, columns)
+        self.assertEqual([super_simplify(s) for s in withcoords],
+            [row['bels_matchwithcoords'] for row in self.rows])
+        self.assertEqual([super_simplify(s) for s in sanscoords],
+            [row['bels_matchsanscoords'] for row in self.rows])
+
+    def test_simplify_steps(self):
+        print('Running test_simplify_steps')
+        # The steps of the SQL give the same results as super_simplify()
+        for row in self.rows:
+            for field, termlist in matchstrtermlists.items():
+                self.assertEqual(run_simplify_steps(location_match_str(termlist, row)),
+                    row[field])
+        for idstr in ['1..2', '1.,', 'a..b', '.5 -.25', '+1.5 / 2', '-a- ,b, .c.',
+            'x　y z ', '١٢.٣ km', '₂.x', 'Straße', '']:
+            self.assertEqual(run_simplify_steps(idstr), super_simplify(idstr))
+
+        # The characters in whitespacechars are the whitespace of Python regular
+        # expressions
+        self.assertEqual(whitespacechars,
+            ''.join(chr(c) for c in range(0x110000) if re.match(r'\s', chr(c))))
+
+    def test_coordinate_steps(self):
+        print('Running test_coordinate_steps')
+        # The coordinates made by the steps of the SQL give the match strings of the
+        # golden corpus
+        termlist = locationmatchwithcoordstermlist
+        self.assertEqual(termlist[-2:], ['decimallatitude', 'decimallongitude'])
+        for row in self.rows:
+            idstr = location_match_str(termlist[:-2], row)
+            for term in termlist[-2:]:
+                value = row[term] if len(row[term]) > 0 else None
+                coordstr = run_coordinate_steps(value)
+                expected = coordinate_match_str(row[term])
+                self.assertEqual(coordstr, '' if expected is None else expected)
+                idstr += coordstr + ' '
+            self.assertEqual(run_simplify_steps(idstr), row['bels_matchwithcoords'])
+
+        # Coordinates are in the format of the gazetteer match strings, with the zero
+        # before the decimal point and without trailing zeros
+        for value, expected in [('0', '0'), ('0.1167', '0.1167'), ('0.30', '0.3'),
+            ('-0.25', '-0.25'), ('-0.00000004', '0'), ('-0.0', '0'),
+            ('10.00000000', '10'), ('0.00000005', '0.0000001'),
+            ('-33.12345675', '-33.1234568'), ('0.000000049', '0'), ('1e-3', '0.001'),
+            (' 42.1 ', '42.1'),
+            ('+71.1234567', '71.1234567'), ('NaN', ''), ('1_0', ''), ('1e29', ''),
+            ('not a number', ''), ('', ''), (None, '')]:
+            self.assertEqual(run_coordinate_steps(value), expected, value)
+            if value is not None:
+                self.assertEqual(coordinate_match_str(value) or '', expected, value)
+
+        sql = coordinate_match_sql('`decimallatitude`')
+        self.assertEqual(sql, "IFNULL(CAST(ROUND(SAFE_CAST(TRIM(`decimallatitude`) " + \
+            "AS NUMERIC),7) AS STRING),'')")
+        self.assertEqual(len(coordinate_steps()), 5)
+
+    @unittest.skipIf(shutil.which('node') is None, 'node is not installed')
+    def test_coordinates_udf_parity(self):
+        print('Running test_coordinates_udf_parity')
+        # The coordinates are those of the JavaScript UDF matchString, run in node,
+        # except where the UDF does not round as BigQuery does for the gazetteer: it 
+        # rounds negative halves up and writes values under 1e-6 with an exponent.
+        with open(self.framework.matchstringudffile, 'r', encoding='utf-8') as f:
+            udf = f.read()
+        function = re.search(r'function roundToSeven\(num\) \{.*?\n\s*\}', udf,
+            re.DOTALL).group(0)
+        values = sorted(set(row[term] for row in self.rows
+            for term in ['decimallatitude', 'decimallongitude']
+            if len(row[term]) > 0 and row[term] == row[term].strip()))
+        values += ['0', '0.1167', '0.30', '0.5', '-0.25', '-0.00000004', '-0.0',
+            '10.00000000', '45.12345675']
+        script = function + '\n' + \
+            'const values = JSON.parse(require("fs").readFileSync(0, "utf8"));\n' + \
+            'console.log(JSON.stringify(values.map(v => ' + \
+            'isNaN(v) || isNaN(parseFloat(v)) ? "" : "" + (+roundToSeven(v)))));'
+        result = subprocess.run(['node', '-e', script], input=json.dumps(values),
+            capture_output=True, text=True, check=True)
+        compared = 0
+        for value, udfstr in zip(values, json.loads(result.stdout)):
+            if udfstr.find('e') != -1 or \
+                re.fullmatch(r'-\d*\.\d{7}50*', value) is not None:
+                continue
+            self.assertEqual(coordinate_match_str(value) or '', udfstr, value)
+            compared += 1
+        self.assertGreater(compared, 100)
+
+    def test_sql_string_literal(self):
+        print('Running test_sql_string_literal')
+        self.assertEqual(sql_string_literal("o'brien"), "'o\\'brien'")
+        self.assertEqual(sql_string_literal('a\\b'), "'a\\\\b'")
+        self.assertEqual(sql_string_literal('æ\t'), "'\\u00e6\\u0009'")
+        self.assertEqual(sql_string_literal('\U0001f600'), "'\\U0001f600'")
+
+    def test_character_class(self):
+        print('Running test_character_class')
+        self.assertEqual(character_class('cba-'), '[\\-a-c]')
+        self.assertEqual(character_class(']^\\'), '[\\\\-\\^]')
+        for chars in ['cba-', ']^\\[', 'xz']:
+            pattern = character_class(chars)
+            for c in chars:
+                self.assertIsNotNone(re.fullmatch(pattern, c))
+            self.assertIsNone(re.fullmatch(pattern, 'y'))
+
+    def test_match_strs_sql(self):
+        print('Running test_match_strs_sql')
+        # The SQL uses no JavaScript UDFs and is ASCII
+        function = super_simplify_function_sql()
+        self.assertTrue(function.startswith('CREATE TEMP FUNCTION superSimplify('))
+        self.assertNotIn('functions.', function)
+        self.assertTrue(function.isascii())
+        self.assertNotIn('\\d', function)
+        self.assertIn('\\p{Nd}', function)
+        for step in simplify_steps():
+            if step[0] == 'translate':
+                self.assertEqual(len(step[1]), len(step[2]))
+                self.assertEqual(len(set(step[1])), len(step[1]))
+
+        header = ['bels_interpreted_countrycode', 'countrycode', 'locality',
+            'verbatimlocality', 'decimallatitude']
+        sql = match_strs_sql(header, {'countrycode': 'bels_interpreted_countrycode'})
+        self.assertTrue(sql.isascii())
+        self.assertNotIn('`countrycode`', sql)
+        self.assertEqual(sql.count('`bels_interpreted_countrycode`'), 3)
+        self.assertIn('AS bels_matchwithcoords', sql)
+        self.assertIn('AS bels_matchverbatimcoords', sql)
+        self.assertIn('AS bels_matchsanscoords', sql)
+
+        # Every term has a part followed by a space. Terms without a field are empty.
+        sql = location_match_sql(locationmatchsanscoordstermlist, header)
+        self.assertEqual(sql.count(",' '"), len(locationmatchsanscoordstermlist))
+        self.assertNotIn('decimallatitude', sql)
+        sql = location_match_sql(locationmatchwithcoordstermlist, header)
+        self.assertIn('SAFE_CAST(TRIM(`decimallatitude`) AS NUMERIC)', sql)
+        self.assertNotIn('`decimallongitude`', sql)
+        # Without locality, verbatimLocality is compared to an empty string
+        sql = location_match_sql(locationmatchverbatimcoordstermlist,
+            ['verbatimlocality'])
+        self.assertIn("LOWER(TRIM(IFNULL('','')))", sql)
+
+if __name__ == '__main__':
+    print('=== match_sql_tests.py ===')
+    unittest.main()
@@ -24,6 +24,50 @@ PYTHONPATH=../bels python job_test.py
 date
 #python: 0s
 
+PYTHONPATH=../bels python match_normalizer_tests.py
+date
+#python: 0s
+
+PYTHONPATH=../bels python georef_store_tests.py
+date
+#python: 0s
+
+PYTHONPATH=../bels python georef_cache_tests.py
+date
+#python: 0s
+
+PYTHONPATH=../bels python local_matcher_tests.py
+date
+#python: 0s
+
+PYTHONPATH=../bels python match_sql_tests.py
+date
+#python: 0s
+
+PYTHONPATH=../bels python avro_utils_tests.py
+date
+#python: 0s
+
+PYTHONPATH=../bels python upload_utils_tests.py
+date
+#python: 0s
+
+#PYTHONPATH=../bels python id_utils_benchmark.py
+date
+#python: 0s
+
+#PYTHONPATH=../bels python dwca_vocab_utils_benchmark.py
+date
+#python: 0s
+
+#PYTHONPATH=../bels python georef_store_benchmark.py
+date
+#python: 0s
+
+#PYTHONPATH=../bels python georef_script_benchmark.py
+date
+#python: 0s
+
 #PYTHONPATH=../bels python resources_test.py
 d#ate
 #python: 0s
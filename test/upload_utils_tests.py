@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+__author__ = "John Wieczorek"
+__copyright__ = "Copyright 2026 Rauthiflor LLC"
+__filename__ = "upload_utils_tests.py"
+__version__ = __filename__ + ' ' + "2026-10-18T23:30-03:00"
+
+# This file contains unit tests for the functions in upload_utils, with a LocalBucket in
+# place of the Google Cloud Storage bucket.
+#
+# Example:
+#
+# python upload_utils_tests.py
+
+import csv
+import gzip
+import io
+import os
+import shutil
+import unittest
+
+from local_matcher import add_match_columns
+from local_matcher import countrycode_lookup_dict
+from local_matcher import estimate_row_count
+from upload_utils import LocalBucket
+from upload_utils import is_utf8_csv
+from upload_utils import read_upload_header
+from upload_utils import upload_stream
+from upload_utils import upload_stream_as_csv
+from upload_utils import upload_stream_with_match_columns
+
+class ReadSizeStream(io.BytesIO):
+    # A stream that keeps the size of the largest read from it
+    maxread = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.maxread = max(self.maxread, len(data))
+        return data
+
+class UploadUtilsTestFramework():
+    # testdatapath is the location of example files to test with
+    testdatapath = '../data/tests/'
+
+    # following are files used as input during the tests, don't remove these
+    benchmarkfile = testdatapath + 'test_benchmark_1000.csv'
+    countrycodefile = '../data/countrycode_lookup.csv'
+
+    # following are directories output during the tests, remove these in dispose()
+    bucketdir = testdatapath + 'test_upload_bucket'
+
+    def dispose(self):
+        if os.path.isdir(self.bucketdir):
+            shutil.rmtree(self.bucketdir)
+        return True
+
+class UploadUtilsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.framework = UploadUtilsTestFramework()
+        self.framework.dispose()
+        self.bucket = LocalBucket(self.framework.bucketdir)
+        with open(self.framework.benchmarkfile, 'rb') as f:
+            self.content = f.read()
+
+    def tearDown(self):
+        self.framework.dispose()
+        self.framework = None
+
+    def upload(self, blob_name, content, **kwargs):
+        # Upload content as from a request, returning the estimated row count and the
+        # size of the largest read
+        stream = ReadSizeStream(content)
+        prefix = read_upload_header(stream, readsize=1000)[0]
+        rowcount = upload_stream(self.bucket.blob(blob_name), prefix, stream, **kwargs)
+        return rowcount, stream.maxread
+
+    def test_read_upload_header(self):
+        print('Running test_read_upload_header')
+        stream = io.BytesIO(self.content)
+        prefix, header, dialect, encoding = read_upload_header(stream, readsize=100)
+        # The prefix ends with the first chunk with the end of the first record in it
+        self.assertEqual(len(prefix) % 100, 0)
+        self.assertGreater(prefix.find(b'\n'), len(prefix) - 100)
+        self.assertEqual(self.content[:len(prefix)], prefix)
+        with open(self.framework.benchmarkfile, 'r', newline='', encoding='utf-8') as f:
+            self.assertEqual(header, next(csv.reader(f)))
+        self.assertTrue(is_utf8_csv(dialect, encoding))
+
+        # A quoted header with a line ending in it is read until the record ends
+        content = b'"id","loc\nality",country\r\n1,a,b\r\n'
+        prefix, header, dialect, encoding = read_upload_header(io.BytesIO(content),
+            readsize=8)
+        self.assertEqual(header, ['id', 'loc\nality', 'country'])
+        self.assertEqual(prefix, content[:32])
+
+        # Tab-separated, with a byte order mark
+        content = b'\xef\xbb\xbfid\tcountry\n1\tPeru\n'
+        prefix, header, dialect, encoding = read_upload_header(io.BytesIO(content))
+        self.assertEqual(header, ['id', 'country'])
+        self.assertEqual(dialect.delimiter, '\t')
+        self.assertFalse(is_utf8_csv(dialect, encoding))
+
+        # No header without a line ending
+        self.assertEqual(read_upload_header(io.BytesIO(b'a,b')),
+            (b'a,b', None, None, None))
+        self.assertEqual(read_upload_header(io.BytesIO(b'')), (b'', None, None, None))
+        prefix, header, dialect, encoding = read_upload_header(
+            io.BytesIO(b'"a\n' + b'a'*50), readsize=10, maxsize=25)
+        self.assertEqual(len(prefix), 25)
+        self.assertIsNone(header)
+
+    def test_upload_stream(self):
+        print('Running test_upload_stream')
+        rowcount, maxread = self.upload('in/a', self.content, chunksize=4096)
+        self.assertEqual(rowcount, estimate_row_count(self.content))
+        self.assertLessEqual(maxread, 4096)
+        with self.bucket.blob('in/a').open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+        rowcount, maxread = self.upload('in/a.csv.gz', self.content, compress=True)
+        self.assertEqual(rowcount, estimate_row_count(self.content))
+        with gzip.open(self.bucket.blob('in/a.csv.gz').path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+        rowcount, maxread = self.upload('in/b', b'a,b')
+        self.assertEqual(rowcount, 0)
+
+    def test_upload_stream_with_match_columns(self):
+        print('Running test_upload_stream_with_match_columns')
+        header = ['id', 'country', 'locality']
+        countrycodes = countrycode_lookup_dict(self.framework.countrycodefile)
+        content = 'Id,Country,Locality\r\n1,Denmark,"Elbæk\nSkov"\r\n2,Peru,Lima\r\n'
+        content = content.encode('utf-8')
+        expected = io.StringIO(newline='')
+        add_match_columns(io.StringIO(content.decode('utf-8'), newline=''), expected,
+            header, ['country'], countrycodes)
+
+        for compress in [False, True]:
+            stream = ReadSizeStream(content)
+            prefix = read_upload_header(stream, readsize=8)[0]
+            blob = self.bucket.blob('in/c')
+            rowcount = upload_stream_with_match_columns(blob, prefix, stream, header,
+                ['country'], countrycodes, compress=compress, chunksize=16)
+            self.assertEqual(rowcount, 3)
+            self.assertLessEqual(stream.maxread, 16)
+            if compress == True:
+                with gzip.open(blob.path, 'rb') as f:
+                    uploaded = f.read()
+            else:
+                with blob.open('rb') as f:
+                    uploaded = f.read()
+            self.assertEqual(uploaded.decode('utf-8'), expected.getvalue())
+
+        # Coordinates under 1 in magnitude are as the JavaScript UDF matchString wrote
+        # them, with the zero before the decimal point
+        content = b'Id,Country,Locality,Lat,Lng\r\n' + \
+            b'1,Ecuador,Cotacachi,0.30,-78.37\r\n2,Gabon,Ilha,-0.00000004,0.5\r\n'
+        stream = io.BytesIO(content)
+        prefix = read_upload_header(stream)[0]
+        blob = self.bucket.blob('in/g')
+        upload_stream_with_match_columns(blob, prefix, stream,
+            ['id', 'country', 'locality', 'decimallatitude', 'decimallongitude'],
+            ['country'], countrycodes)
+        with blob.open('r', newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['bels_matchwithcoords'] for row in rows],
+            ['eccotacachi0.3-78.37', 'gailha00.5'])
+
+        # Content that is not UTF-8 can not have match strings added
+        stream = io.BytesIO(b'country\r\n\xff\xfe\r\n')
+        with self.assertRaises(UnicodeDecodeError):
+            upload_stream_with_match_columns(self.bucket.blob('in/d'), b'', stream,
+                ['country'], ['country'], countrycodes)
+
+    def test_upload_stream_as_csv(self):
+        print('Running test_upload_stream_as_csv')
+        # A latin-1, tab-separated file is uploaded as comma-separated utf-8
+        content = 'id\tcountry\tlocality\r\n1\tPerú\tLima, Centro\r\n2\tChile\r\n'
+        content = content.encode('latin-1')
+        stream = ReadSizeStream(content)
+        prefix, header, dialect, encoding = read_upload_header(stream)
+        self.assertEqual(header, ['id', 'country', 'locality'])
+        self.assertFalse(is_utf8_csv(dialect, encoding))
+        blob = self.bucket.blob('in/e')
+        rowcount = upload_stream_as_csv(blob, prefix, stream, dialect, encoding,
+            chunksize=16)
+        self.assertEqual(rowcount, 2)
+        with blob.open('r', newline='', encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'id,country,locality\r\n' + \
+                '1,Perú,"Lima, Centro"\r\n2,Chile\r\n')
+
+        # Match strings are added to a file that is not comma-separated utf-8
+        countrycodes = countrycode_lookup_dict(self.framework.countrycodefile)
+        stream = io.BytesIO(content)
+        prefix, header, dialect, encoding = read_upload_header(stream)
+        blob = self.bucket.blob('in/f')
+        upload_stream_with_match_columns(blob, prefix, stream, header, ['country'],
+            countrycodes, dialect=dialect, encoding=encoding)
+        expected = io.StringIO(newline='')
+        add_match_columns(io.StringIO('id,country,locality\r\n' + \
+            '1,Perú,"Lima, Centro"\r\n2,Chile\r\n', newline=''), expected,
+            header, ['country'], countrycodes)
+        with blob.open('r', newline='', encoding='utf-8') as f:
+            self.assertEqual(f.read(), expected.getvalue())
+
+if __name__ == '__main__':
+    print('=== upload_utils_tests.py ===')
+    unittest.main()